@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_ecom.settings')
 
 application = get_asgi_application()
+
+from inventory.slugs import warm_slug_index  # noqa: E402
+
+warm_slug_index()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 from datetime import timedelta
+from celery.schedules import crontab
 from celery import Celery
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -180,6 +181,7 @@ STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles') if DEBUG else os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = "/api/media/"
+MEDIA_HOST = os.environ.get('MEDIA_HOST', 'http://localhost')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_FILE_STORAGE = "django.core.files.storage.FileSystemStorage"
 
@@ -190,6 +192,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 RZP_KEY_ID = os.environ['RZP_KEY_ID']
 RZP_SECRET_KEY = os.environ['RZP_SECRET_KEY']
+# Signs Razorpay webhooks; webhooks are refused while it is unset.
+RZP_WEBHOOK_SECRET = os.environ.get('RZP_WEBHOOK_SECRET', '')
+
+# 'razorpay' or 'fake' (offline gateway for load tests and local runs).
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'razorpay')
+# Create gateway orders in a Celery task instead of during the checkout request.
+PAYMENT_GATEWAY_ASYNC = os.environ.get('PAYMENT_GATEWAY_ASYNC', '') == '1'
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+PAYMENT_GATEWAY_RETRIES = 3
+PAYMENT_GATEWAY_POOL_SIZE = 10
+FAKE_GATEWAY_LATENCY = float(os.environ.get('FAKE_GATEWAY_LATENCY', 0))
+# Gateway retries of a webhook already accepted within this window (seconds) are
+# acknowledged from Redis without touching the database.
+PAYMENT_WEBHOOK_DEDUPE_TTL = 60 * 60 * 24
+# Reconciliation checks unpaid orders between these ages (seconds) with the gateway,
+# one bulk query per batch.
+PAYMENT_RECONCILE_MIN_AGE = 15 * 60
+PAYMENT_RECONCILE_MAX_AGE = 7 * 24 * 60 * 60
+PAYMENT_RECONCILE_BATCH_SIZE = 100
+# Orders still unpaid this long (seconds) are cancelled and their stock put back; longer
+# than PAYMENT_RECONCILE_MAX_AGE, so reconciliation is done with them first.
+ORDER_UNPAID_HOLD = PAYMENT_RECONCILE_MAX_AGE + 24 * 60 * 60
+
+# Idempotency-Key on create-order: how long the first request may hold a key (seconds),
+# and how long a concurrent duplicate waits for it before giving up with a 409.
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_WAIT_TIMEOUT = 15
 
 
 CELERY_BROKER_URL = os.environ['CELERY_BROKER_URL']
@@ -201,4 +230,58 @@ CELERY_TASK_SERIALIZER = 'json'
 
 CELERY_IMPORTS = [
     'payment.tasks',
-]
\ No newline at end of file
+    'cart.tasks',
+    'order.tasks',
+]
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-carts': {
+        'task': 'cart.tasks.flush_carts_task',
+        'schedule': 10.0,
+    },
+    'collect-cart-garbage': {
+        'task': 'cart.tasks.collect_cart_garbage_task',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'create-order-partitions': {
+        'task': 'order.tasks.create_order_partitions_task',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'archive-order-partitions': {
+        'task': 'order.tasks.archive_order_partitions_task',
+        'schedule': crontab(hour=4, minute=0, day_of_month=1),
+    },
+    'check-default-partitions': {
+        'task': 'order.tasks.check_default_partitions_task',
+        'schedule': crontab(minute=0),
+    },
+    'roll-up-sales': {
+        'task': 'order.tasks.roll_up_sales_task',
+        'schedule': 60.0,
+    },
+    'reconcile-payments': {
+        'task': 'payment.tasks.reconcile_payments_task',
+        'schedule': crontab(minute='*/15'),
+    },
+    'release-unpaid-orders': {
+        'task': 'order.tasks.release_unpaid_orders_task',
+        'schedule': crontab(minute=30),
+    },
+}
+
+# Most units of one variant a cart line can hold; larger batch quantities are rejected.
+CART_MAX_LINE_QTY = int(os.environ.get('CART_MAX_LINE_QTY', 100))
+
+# Inactive cart lines (and their history) untouched for this long are deleted.
+CART_GC_RETENTION_DAYS = int(os.environ.get('CART_GC_RETENTION_DAYS', 30))
+CART_GC_CHUNK_SIZE = 1000
+
+# Order and SoldProduct are partitioned by month: keep this many future months created,
+# and detach months older than the retention for archival.
+ORDER_PARTITIONS_AHEAD = 3
+ORDER_PARTITION_RETENTION_MONTHS = int(os.environ.get('ORDER_PARTITION_RETENTION_MONTHS', 24))
+
+# Daily sales rollups: SoldProduct rows per statement, and how old (seconds) a row must be
+# before it is rolled up, so checkouts still committing are not skipped by the watermark.
+SALES_ROLLUP_BATCH_SIZE = 5000
+SALES_ROLLUP_LAG_SECONDS = 60
\ No newline at end of file
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_ecom.settings')
 
 application = get_wsgi_application()
+
+from inventory.slugs import warm_slug_index  # noqa: E402
+
+warm_slug_index()
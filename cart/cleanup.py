@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import CartItem
+
+# Re-checks is_active, so a line the write-behind flush revived meanwhile survives.
+DELETE_DEAD_LINES_SQL = "DELETE FROM {table} WHERE id = ANY(%s) AND NOT is_active RETURNING id"
+
+
+def collect_cart_garbage(retention_days=None, chunk_size=None, dry_run=False):
+    """Delete inactive cart lines untouched for retention_days, with their history rows.
+
+    History left behind by lines that no longer exist is swept too. Deletes run in short
+    transactions of chunk_size ids. Returns the rows reclaimed, or that would be on a dry run.
+    """
+    retention_days = settings.CART_GC_RETENTION_DAYS if retention_days is None else retention_days
+    chunk_size = chunk_size or settings.CART_GC_CHUNK_SIZE
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    history = CartItem.history.model
+
+    dead_lines = CartItem.objects.filter(is_active=False, updated_at__lt=cutoff)
+    orphaned_history = history.objects.filter(history_date__lt=cutoff).exclude(
+        Exists(CartItem.objects.filter(id=OuterRef("id")))
+    )
+    report = {"cart_items": 0, "history": 0, "retention_days": retention_days, "dry_run": dry_run}
+
+    if dry_run:
+        report["cart_items"] = dead_lines.count()
+        report["history"] = (
+            history.objects.filter(id__in=dead_lines.values("id")).count() + orphaned_history.count()
+        )
+        return report
+
+    while True:
+        ids = list(dead_lines.order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DELETE_DEAD_LINES_SQL.format(table=CartItem._meta.db_table), [ids])
+            deleted = [row[0] for row in cursor.fetchall()]
+            report["cart_items"] += len(deleted)
+            report["history"] += history.objects.filter(id__in=deleted).delete()[0]
+
+    while True:
+        history_ids = list(orphaned_history.order_by("history_id").values_list("history_id", flat=True)[:chunk_size])
+        if not history_ids:
+            break
+        report["history"] += history.objects.filter(history_id__in=history_ids).delete()[0]
+
+    return report
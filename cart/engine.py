@@ -0,0 +1,291 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+
+from .models import CartItem
+from inventory.cache import get_variant_payloads
+
+logger = logging.getLogger(__name__)
+
+DIRTY_KEY = "cart:dirty"
+# Bumped whenever a variant price changes; carts whose totals were priced under an older
+# version recompute them on their next read.
+PRICE_VERSION_KEY = "cart:price_version"
+# Present in every loaded cart hash, so an empty cart is told apart from one not loaded yet.
+# Bumped by every mutation; the flush compares it to know whether a cart changed under it.
+VERSION_FIELD = "_v"
+COUNT_FIELD = "_count"
+SUBTOTAL_FIELD = "_subtotal"
+PRICE_VERSION_FIELD = "_pv"
+CART_TTL = 60 * 60 * 24 * 7
+FLUSH_BATCH = 200
+
+# Fill the hash from the database rows only if nobody loaded (and mutated) it meanwhile.
+LOAD_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    redis.call('hset', KEYS[1], unpack(ARGV, 2))
+end
+redis.call('expire', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Applies a batch of (variant_id, op, qty, price) changes as one atomic step, op being add,
+# remove or set; a line never goes past the max quantity (ARGV[4]). Returns -1 when the cart is not loaded (the caller loads and retries),
+# otherwise {count, subtotal, totals_current, quantity of each change...}. Totals move by the
+# applied change only while the cart is priced under the version the caller read the prices at.
+APPLY_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then
+    return -1
+end
+local current_version = redis.call('get', KEYS[3]) or '0'
+local priced = redis.call('hget', KEYS[1], '_pv') == ARGV[3] and ARGV[3] == current_version
+local result = {0, 0, priced and 1 or 0}
+
+for i = 5, #ARGV, 4 do
+    local before = tonumber(redis.call('hget', KEYS[1], ARGV[i]) or '0')
+    local quantity = tonumber(ARGV[i + 2])
+    if ARGV[i + 1] == 'add' then
+        quantity = before + quantity
+    elseif ARGV[i + 1] == 'remove' then
+        quantity = before - quantity
+    end
+    quantity = math.min(math.max(quantity, 0), tonumber(ARGV[4]))
+
+    if quantity == 0 then
+        redis.call('hdel', KEYS[1], ARGV[i])
+    else
+        redis.call('hset', KEYS[1], ARGV[i], quantity)
+    end
+    if priced then
+        redis.call('hincrby', KEYS[1], '_count', quantity - before)
+        redis.call('hincrby', KEYS[1], '_subtotal', (quantity - before) * tonumber(ARGV[i + 3]))
+    end
+    table.insert(result, quantity)
+end
+
+redis.call('hincrby', KEYS[1], '_v', 1)
+redis.call('expire', KEYS[1], ARGV[1])
+redis.call('sadd', KEYS[2], ARGV[2])
+local totals = redis.call('hmget', KEYS[1], '_count', '_subtotal')
+result[1] = tonumber(totals[1]) or 0
+result[2] = tonumber(totals[2]) or 0
+return result
+"""
+
+# Drop the user from the dirty set only if the cart is still at the version that was written back.
+CLEAN_SCRIPT = """
+if redis.call('hget', KEYS[1], '_v') == ARGV[2] then
+    redis.call('srem', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+def cart_key(user_id):
+    return f"cart:{user_id}"
+
+
+def parse_cart(raw):
+    return {
+        int(field): int(quantity)
+        for field, quantity in raw.items()
+        if not field.startswith(b"_") and int(quantity) > 0
+    }
+
+
+def price_lines(quantities):
+    """(item count, subtotal) of quantities at the current variant prices."""
+    payloads = get_variant_payloads(list(quantities))
+    subtotal = sum(
+        payloads[variant_id]["price"] * quantity for variant_id, quantity in quantities.items() if variant_id in payloads
+    )
+    return sum(quantities.values()), subtotal
+
+
+def load_cart(conn, user_id):
+    """Copy the user's active cart lines from Postgres into Redis, priced; one query."""
+    price_version = conn.get(PRICE_VERSION_KEY) or b"0"
+    quantities = CartItem.quantities_for_user_id(user_id)
+    count, subtotal = price_lines(quantities)
+
+    fields = [VERSION_FIELD, 0, COUNT_FIELD, count, SUBTOTAL_FIELD, subtotal, PRICE_VERSION_FIELD, price_version]
+    for variant_id, quantity in quantities.items():
+        fields += [variant_id, quantity]
+    conn.eval(LOAD_SCRIPT, 1, cart_key(user_id), CART_TTL, *fields)
+
+
+def reprice_cart(conn, user_id):
+    """Recompute the stored totals from the lines after a price change; returns (count, subtotal)."""
+    key = cart_key(user_id)
+    with conn.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key, PRICE_VERSION_KEY)
+                raw = pipe.hgetall(key)
+                if not raw:
+                    pipe.unwatch()
+                    load_cart(conn, user_id)
+                    continue
+                price_version = pipe.get(PRICE_VERSION_KEY) or b"0"
+                count, subtotal = price_lines(parse_cart(raw))
+
+                pipe.multi()
+                pipe.hset(key, mapping={COUNT_FIELD: count, SUBTOTAL_FIELD: subtotal, PRICE_VERSION_FIELD: price_version})
+                pipe.execute()
+                return count, subtotal
+            except WatchError:
+                continue
+
+
+def read_cart(user_id):
+    """({variant_id: quantity}, {"count", "subtotal"}) of the user's cart, loading it from Postgres on a miss."""
+    conn = get_redis_connection("default")
+    key = cart_key(user_id)
+    pipe = conn.pipeline(transaction=True)
+    pipe.hgetall(key)
+    pipe.get(PRICE_VERSION_KEY)
+    raw, price_version = pipe.execute()
+    if not raw:
+        load_cart(conn, user_id)
+        raw, price_version = conn.hgetall(key), conn.get(PRICE_VERSION_KEY)
+
+    if raw.get(PRICE_VERSION_FIELD.encode()) == (price_version or b"0"):
+        count, subtotal = int(raw[COUNT_FIELD.encode()]), int(raw[SUBTOTAL_FIELD.encode()])
+    else:
+        count, subtotal = reprice_cart(conn, user_id)
+    return parse_cart(raw), {"count": count, "subtotal": subtotal}
+
+
+def get_cart(user_id):
+    """{variant_id: quantity} of the user's cart, loading it from Postgres on a miss."""
+    conn = get_redis_connection("default")
+    raw = conn.hgetall(cart_key(user_id))
+    if not raw:
+        load_cart(conn, user_id)
+        raw = conn.hgetall(cart_key(user_id))
+    return parse_cart(raw)
+
+
+def load_prices(variant_ids):
+    """(price_version, {variant_id: payload}) for variant_ids.
+
+    The version is read before the prices, so a price change in between leaves the totals to be repriced.
+    """
+    price_version = get_redis_connection("default").get(PRICE_VERSION_KEY) or b"0"
+    return price_version, get_variant_payloads(variant_ids)
+
+
+def apply_changes(user_id, changes, price_version, payloads):
+    """Apply [(variant_id, op, qty)] to the cart in one atomic step; op is add, remove or set.
+
+    Every variant must be in payloads (see load_prices). Returns {"quantities", "count", "subtotal"},
+    quantities holding the new quantity after each change.
+    """
+    conn = get_redis_connection("default")
+    apply = conn.register_script(APPLY_SCRIPT)
+    keys = [cart_key(user_id), DIRTY_KEY, PRICE_VERSION_KEY]
+    args = [CART_TTL, user_id, price_version, settings.CART_MAX_LINE_QTY]
+    for variant_id, op, qty in changes:
+        args += [variant_id, op, qty, payloads[variant_id]["price"]]
+
+    result = apply(keys=keys, args=args)
+    if result == -1:
+        load_cart(conn, user_id)
+        result = apply(keys=keys, args=args)
+
+    count, subtotal, priced, *quantities = result
+    if not priced:
+        count, subtotal = reprice_cart(conn, user_id)
+    return {"quantities": quantities, "count": count, "subtotal": subtotal}
+
+
+def change_quantity(user_id, variant_id, delta):
+    """Add delta to one line of the cart; lines at zero are dropped.
+
+    Returns {"quantity", "price", "count", "subtotal"}, or None when the variant does not exist.
+    """
+    price_version, payloads = load_prices([variant_id])
+    if variant_id not in payloads:
+        return None
+
+    result = apply_changes(user_id, [(variant_id, "add" if delta > 0 else "remove", abs(delta))], price_version, payloads)
+    return {
+        "quantity": result["quantities"][0],
+        "price": payloads[variant_id]["price"],
+        "count": result["count"],
+        "subtotal": result["subtotal"],
+    }
+
+
+def bump_price_version():
+    """Mark every cart's totals stale; each reprices itself on its next read or change."""
+    get_redis_connection("default").incr(PRICE_VERSION_KEY)
+
+
+def forget_cart(user_id):
+    """Drop the Redis copy so the next read reloads it from Postgres."""
+    conn = get_redis_connection("default")
+    pipe = conn.pipeline(transaction=True)
+    pipe.delete(cart_key(user_id))
+    pipe.srem(DIRTY_KEY, user_id)
+    pipe.execute()
+
+
+def flush_carts(user_ids, raise_errors=False):
+    """Write the Redis carts of user_ids back to CartItem rows; returns how many carts were written.
+
+    A cart that fails to write is logged and left dirty for the next flush, and the rest of the
+    batch carries on; with raise_errors the failure is raised instead.
+    """
+    conn = get_redis_connection("default")
+    pipe = conn.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.hgetall(cart_key(user_id))
+    snapshots = {
+        int(user_id): raw for user_id, raw in zip(user_ids, pipe.execute())
+    }
+
+    written = {}
+    for user_id, raw in snapshots.items():
+        if not raw:
+            # Expired before it was flushed; nothing left to write.
+            written[user_id] = None
+            continue
+        try:
+            write_cart(user_id, parse_cart(raw))
+        except Exception:
+            if raise_errors:
+                raise
+            logger.exception("Could not write back the cart of user %s", user_id)
+            continue
+        written[user_id] = raw[VERSION_FIELD.encode()]
+
+    pipe = conn.pipeline(transaction=False)
+    for user_id, version in written.items():
+        if version is None:
+            pipe.srem(DIRTY_KEY, user_id)
+        else:
+            pipe.eval(CLEAN_SCRIPT, 2, cart_key(user_id), DIRTY_KEY, user_id, version)
+    pipe.execute()
+    return sum(version is not None for version in written.values())
+
+
+def flush_dirty_carts(batch_size=FLUSH_BATCH):
+    """Write back every cart changed since the last flush, batch_size carts at a time."""
+    conn = get_redis_connection("default")
+    flushed = 0
+    for _ in range(conn.scard(DIRTY_KEY) // batch_size + 1):
+        user_ids = [int(user_id) for user_id in conn.srandmember(DIRTY_KEY, batch_size)]
+        if not user_ids:
+            break
+        flushed += flush_carts(user_ids)
+    return flushed
+
+
+def write_cart(user_id, quantities):
+    """Make the user's CartItem rows match quantities; rows absent from it are deactivated."""
+    with transaction.atomic():
+        CartItem.sync_user_lines(user_id, quantities)
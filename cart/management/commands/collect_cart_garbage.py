@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from cart.cleanup import collect_cart_garbage
+
+
+class Command(BaseCommand):
+    help = "Deletes inactive cart lines past the retention window, with their history rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retention-days", type=int, default=None)
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be deleted")
+
+    def handle(self, *args, **options):
+        report = collect_cart_garbage(options["retention_days"], options["chunk_size"], options["dry_run"])
+        verb = "Would reclaim" if report["dry_run"] else "Reclaimed"
+        self.stdout.write(
+            f"{verb} {report['cart_items']} cart items and {report['history']} history rows "
+            f"older than {report['retention_days']} days"
+        )
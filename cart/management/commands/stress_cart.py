@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+import random
+import threading
+import time
+
+from cart.engine import change_quantity, flush_dirty_carts, forget_cart, get_cart, read_cart
+from cart.models import CartItem
+from inventory.models import ProductVariant
+from user.models import UserProfile
+
+
+STRESS_PREFIX = "stress_cart_"
+
+
+class Command(BaseCommand):
+    help = "Fires concurrent add/remove calls at the cart engine while flushing, then checks the final quantities"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--variants", type=int, default=5)
+        parser.add_argument("--ops", type=int, default=5000)
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--keep", action="store_true", help="Keep the stress users afterwards")
+
+    def handle(self, *args, **options):
+        variant_ids = list(ProductVariant.objects.filter(is_active=True).values_list("id", flat=True)[: options["variants"]])
+        if not variant_ids:
+            raise CommandError("No active variants found, run populate_test_data first")
+
+        users = []
+        for i in range(options["users"]):
+            user, _ = User.objects.get_or_create(username=f"{STRESS_PREFIX}{i}")
+            UserProfile.objects.get_or_create(user=user)
+            forget_cart(user.id)
+            CartItem.objects.filter(user=user).delete()
+            users.append(user.id)
+
+        ops = [(random.choice(users), random.choice(variant_ids), random.choice([1, -1])) for _ in range(options["ops"])]
+        # Seed every line with more than it can lose, so no interleaving hits the zero floor.
+        expected = {}
+        for user_id in users:
+            for variant_id in variant_ids:
+                removes = sum(1 for op in ops if op[:2] == (user_id, variant_id) and op[2] < 0)
+                change_quantity(user_id, variant_id, removes + 1)
+                expected[(user_id, variant_id)] = removes + 1
+        for user_id, variant_id, delta in ops:
+            expected[(user_id, variant_id)] += delta
+
+        done = threading.Event()
+
+        def flush_until_done():
+            try:
+                while not done.is_set():
+                    flush_dirty_carts()
+            finally:
+                connection.close()
+
+        flusher = threading.Thread(target=flush_until_done)
+        flusher.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            list(pool.map(lambda op: change_quantity(*op), ops))
+        elapsed = time.perf_counter() - started
+        done.set()
+        flusher.join()
+        flush_dirty_carts()
+
+        prices = dict(ProductVariant.objects.filter(id__in=variant_ids).values_list("id", "price"))
+        failures = []
+        for user_id in users:
+            wanted = {variant_id: expected[(user_id, variant_id)] for variant_id in variant_ids}
+            quantities, totals = read_cart(user_id)
+            if quantities != wanted:
+                failures.append(f"user {user_id}: redis {quantities} != {wanted}")
+            wanted_totals = {
+                "count": sum(wanted.values()),
+                "subtotal": sum(prices[variant_id] * quantity for variant_id, quantity in wanted.items()),
+            }
+            if totals != wanted_totals:
+                failures.append(f"user {user_id}: totals {totals} != {wanted_totals}")
+            if CartItem.quantities_for_user_id(user_id) != wanted:
+                failures.append(f"user {user_id}: postgres {CartItem.quantities_for_user_id(user_id)} != {wanted}")
+            forget_cart(user_id)
+            if get_cart(user_id) != wanted:
+                failures.append(f"user {user_id}: reloaded {get_cart(user_id)} != {wanted}")
+
+        duplicates = (
+            CartItem.objects.filter(user_id__in=users).values("user_id", "variant_id")
+            .annotate(rows=Count("id")).filter(rows__gt=1).count()
+        )
+        if duplicates:
+            failures.append(f"{duplicates} duplicate cart lines")
+
+        if not options["keep"]:
+            for user_id in users:
+                forget_cart(user_id)
+            User.objects.filter(id__in=users).delete()
+
+        self.stdout.write(f"{len(ops)} mutations on {options['threads']} threads in {elapsed:.2f}s ({len(ops) / elapsed:.0f}/s)")
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Cart quantities match after concurrent mutations"))
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.23 on 2026-10-18 00:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_cart_owners(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    UserProfile = apps.get_model('user', 'UserProfile')
+
+    owners = {}
+    for cartitem_id, user_id in UserProfile.cart_items.through.objects.values_list('cartitem_id', 'userprofile__user_id'):
+        owners.setdefault(cartitem_id, user_id)
+
+    # Keep one line per (user, variant): the active one, else the latest. Duplicates stay ownerless and inactive.
+    kept = set()
+    items = list(CartItem.objects.filter(id__in=owners).order_by('-is_active', '-updated_at', '-id'))
+    for item in items:
+        key = (owners[item.id], item.variant_id)
+        if key in kept:
+            item.is_active = False
+        else:
+            kept.add(key)
+            item.user_id = owners[item.id]
+    CartItem.objects.bulk_update(items, ['user', 'is_active'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0003_auto_20250920_0451'),
+        ('user', '0004_auto_20250920_0519'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='historicalcartitem',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_cart_owners, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'variant'), name='unique_cart_line_per_user'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:20
+
+from django.db import migrations
+
+
+def adopt_remaining_lines(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    UserProfile = apps.get_model('user', 'UserProfile')
+
+    owned = set(CartItem.objects.filter(user__isnull=False).values_list('user_id', 'variant_id'))
+    links = UserProfile.cart_items.through.objects.filter(cartitem__user__isnull=True)
+
+    adopted = []
+    for item_id, user_id, variant_id in links.values_list('cartitem_id', 'userprofile__user_id', 'cartitem__variant_id'):
+        if (user_id, variant_id) not in owned:
+            owned.add((user_id, variant_id))
+            adopted.append(CartItem(id=item_id, user_id=user_id))
+    CartItem.objects.bulk_update(adopted, ['user'], batch_size=1000)
+
+    # Whatever is still ownerless is a duplicate or an orphan of a removed profile link.
+    CartItem.objects.filter(user__isnull=True).delete()
+
+
+# Kept apart from the schema change in 0006: the delete leaves deferred trigger events on
+# cart_cartitem (through the M2M table), and Postgres refuses to ALTER a table that has them
+# pending in the same transaction.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_auto_20250920_0519'),
+        ('cart', '0004_cartitem_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(adopt_remaining_lines, migrations.RunPython.noop),
+    ]
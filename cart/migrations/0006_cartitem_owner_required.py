@@ -0,0 +1,25 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cart', '0005_adopt_remaining_lines'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cartitem',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], include=('variant', 'quantity'), name='cart_active_lines_idx'),
+        ),
+    ]
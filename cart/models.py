@@ -1,12 +1,85 @@
-from django.db import models
+from django.db import connection, models
 import datetime
 from lib.base_classes import BaseModel
 from django.contrib.auth.models import User
 from inventory.models import ProductVariant
 
 class CartItem(BaseModel):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="cart_items")
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="cart_items")
     quantity = models.IntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "variant"], name="unique_cart_line_per_user"),
+        ]
+        indexes = [
+            # Cart reads only want active lines; covering them allows index-only scans.
+            models.Index(
+                fields=["user"],
+                include=["variant", "quantity"],
+                condition=models.Q(is_active=True),
+                name="cart_active_lines_idx",
+            ),
+        ]
+
+    @classmethod
+    def quantities_for_user_id(cls, user_id):
+        """Map variant_id -> quantity for the user's active cart lines, in one query."""
+        return dict(
+            cls.objects.filter(user_id=user_id, is_active=True).values_list("variant_id", "quantity")
+        )
+
+    @classmethod
+    def sync_user_lines(cls, user_id, quantities):
+        """Make the user's active lines equal {variant_id: quantity} with set-based, race-free statements.
+
+        Each statement writes the history rows of the lines it changed, as save() would.
+        """
+        variant_ids = list(quantities)
+        tables = {"table": cls._meta.db_table, "history": cls.history.model._meta.db_table}
+        with connection.cursor() as cursor:
+            if variant_ids:
+                cursor.execute(
+                    UPSERT_LINES_SQL.format(**tables),
+                    [user_id, variant_ids, [quantities[variant_id] for variant_id in variant_ids]],
+                )
+            cursor.execute(DEACTIVATE_LINES_SQL.format(**tables), [user_id, variant_ids])
+
+
+# Copies the lines a statement returned into the history table; inserted lines (xmax = 0) as
+# created, the rest as changed.
+INSERT_LINE_HISTORY_SQL = """
+INSERT INTO {history} (
+    id, user_id, variant_id, quantity, is_active, created_at, updated_at,
+    history_date, history_change_reason, history_type, history_user_id
+)
+SELECT id, user_id, variant_id, quantity, is_active, created_at, updated_at,
+    now(), NULL, CASE WHEN inserted THEN '+' ELSE '~' END, NULL
+FROM line
+"""
+
+# One statement per cart: (user, variant) is unique, so concurrent writers converge on one row each.
+UPSERT_LINES_SQL = """
+WITH line AS (
+    INSERT INTO {table} (user_id, variant_id, quantity, is_active, created_at, updated_at)
+    SELECT %s, line.variant_id, line.quantity, true, now(), now()
+    FROM unnest(%s::bigint[], %s::integer[]) AS line(variant_id, quantity)
+    ON CONFLICT (user_id, variant_id) DO UPDATE
+    SET quantity = EXCLUDED.quantity, is_active = true, updated_at = EXCLUDED.updated_at
+    WHERE {table}.quantity <> EXCLUDED.quantity OR NOT {table}.is_active
+    RETURNING *, xmax = 0 AS inserted
+)
+""" + INSERT_LINE_HISTORY_SQL
+
+# Deactivates the user's active lines for variants outside the given ones.
+DEACTIVATE_LINES_SQL = """
+WITH line AS (
+    UPDATE {table} SET is_active = false, updated_at = now()
+    WHERE user_id = %s AND is_active AND variant_id <> ALL(%s::bigint[])
+    RETURNING *, false AS inserted
+)
+""" + INSERT_LINE_HISTORY_SQL
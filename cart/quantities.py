@@ -0,0 +1,9 @@
+from .engine import get_cart
+
+
+def cart_quantities(request):
+    """Per-request {variant_id: quantity} index of the current user's cart, read once from the cart engine."""
+    if not hasattr(request, "_cart_quantities"):
+        user = request.user
+        request._cart_quantities = get_cart(user.id) if user and user.is_authenticated else {}
+    return request._cart_quantities
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from inventory.models import ProductVariant
+from .engine import bump_price_version
+
+
+@receiver(pre_save, sender=ProductVariant)
+def note_price_change(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    old_price = ProductVariant.objects.filter(pk=instance.pk).values_list("price", flat=True).first()
+    instance._price_changed = old_price is not None and old_price != instance.price
+
+
+# Connected after the inventory receivers, so by the time this runs on commit the
+# variant payload carrying the old price has already been dropped.
+@receiver(post_save, sender=ProductVariant)
+def reprice_carts_on_price_change(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, "_price_changed", False):
+        return
+    transaction.on_commit(bump_price_version)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def reprice_carts_on_variant_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_price_version)
@@ -0,0 +1,28 @@
+import logging
+
+from celery import shared_task
+
+from .cleanup import collect_cart_garbage
+from .engine import flush_dirty_carts
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def flush_carts_task():
+    """Write-behind: persist carts changed in Redis since the last run."""
+    return flush_dirty_carts()
+
+
+@shared_task
+def collect_cart_garbage_task(dry_run=False):
+    """Delete dead cart lines and their history; returns the rows reclaimed."""
+    report = collect_cart_garbage(dry_run=dry_run)
+    logger.info(
+        "Cart GC%s: %s cart items, %s history rows older than %s days",
+        " (dry run)" if dry_run else "",
+        report["cart_items"],
+        report["history"],
+        report["retention_days"],
+    )
+    return report
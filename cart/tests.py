@@ -1,3 +1,155 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.urls import reverse
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+
+from lib.testing import FixturesTestCase
+from .engine import (
+    DIRTY_KEY, apply_changes, change_quantity, flush_carts, forget_cart, get_cart, load_prices, read_cart,
+)
+from .models import CartItem
+
+
+class CartTestCase(FixturesTestCase):
+    def setUp(self):
+        self.make_catalog("Cart", "Cart product")
+        self.variant = self.make_variant("Cart variant", price=250, current_stock=10)
+        self.user = self.make_user("9000000001")
+
+    def add(self, user, qty):
+        price_version, payloads = load_prices([self.variant.id])
+        return apply_changes(user.id, [(self.variant.id, "add", qty)], price_version, payloads)
+
+
+class CartBatchViewTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, changes):
+        return self.client.post(reverse("cart-batch"), {"changes": changes}, format="json")
+
+    def test_applies_changes(self):
+        response = self.post([{"variant_id": self.variant.id, "op": "add", "qty": 3}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["quantities"], {str(self.variant.id): 3})
+        self.assertEqual(response.data["subtotal"], 750)
+
+    def test_rejects_qty_above_the_line_limit(self):
+        response = self.post([{"variant_id": self.variant.id, "op": "set", "qty": settings.CART_MAX_LINE_QTY + 1}])
+        self.assertEqual(response.status_code, 400)
+
+        response = self.post([{"variant_id": self.variant.id, "op": "set", "qty": 10 ** 12}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_repeated_adds_stop_at_the_line_limit(self):
+        for _ in range(3):
+            response = self.post([{"variant_id": self.variant.id, "op": "add", "qty": settings.CART_MAX_LINE_QTY}])
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["quantities"], {str(self.variant.id): settings.CART_MAX_LINE_QTY})
+        self.assertEqual(response.data["item_count"], settings.CART_MAX_LINE_QTY)
+
+
+class FlushCartsTests(CartTestCase):
+    def test_writes_carts_back(self):
+        self.add(self.user, 2)
+        self.assertEqual(flush_carts([self.user.id]), 1)
+        self.assertEqual(CartItem.quantities_for_user_id(self.user.id), {self.variant.id: 2})
+        self.assertFalse(get_redis_connection("default").sismember(DIRTY_KEY, self.user.id))
+
+    def test_one_failing_cart_does_not_stop_the_batch(self):
+        other = self.make_user("9000000002")
+        self.add(self.user, 2)
+        self.add(other, 4)
+
+        from . import engine
+        write_cart = engine.write_cart
+
+        def fail_for_user(user_id, quantities):
+            if user_id == self.user.id:
+                raise ValueError("boom")
+            write_cart(user_id, quantities)
+
+        with mock.patch.object(engine, "write_cart", side_effect=fail_for_user):
+            with self.assertLogs("cart.engine", "ERROR"):
+                self.assertEqual(flush_carts([self.user.id, other.id]), 1)
+
+        self.assertEqual(CartItem.quantities_for_user_id(other.id), {self.variant.id: 4})
+        self.assertEqual(CartItem.quantities_for_user_id(self.user.id), {})
+        # The failed cart stays dirty, so the next flush retries it.
+        self.assertTrue(get_redis_connection("default").sismember(DIRTY_KEY, self.user.id))
+        self.assertEqual(flush_carts([self.user.id]), 1)
+        self.assertEqual(CartItem.quantities_for_user_id(self.user.id), {self.variant.id: 2})
+
+    def test_raise_errors(self):
+        self.add(self.user, 2)
+        with mock.patch("cart.engine.write_cart", side_effect=ValueError("boom")):
+            with self.assertRaises(ValueError):
+                flush_carts([self.user.id], raise_errors=True)
+
+
+class SyncUserLinesTests(CartTestCase):
+    def history(self):
+        return list(
+            CartItem.history.filter(user_id=self.user.id)
+            .order_by("history_id")
+            .values_list("history_type", "quantity", "is_active")
+        )
+
+    def test_writes_history_for_every_changed_line(self):
+        CartItem.sync_user_lines(self.user.id, {self.variant.id: 2})
+        CartItem.sync_user_lines(self.user.id, {self.variant.id: 2})
+        CartItem.sync_user_lines(self.user.id, {self.variant.id: 5})
+        CartItem.sync_user_lines(self.user.id, {})
+        CartItem.sync_user_lines(self.user.id, {self.variant.id: 1})
+
+        self.assertEqual(
+            self.history(),
+            [("+", 2, True), ("~", 5, True), ("~", 5, False), ("~", 1, True)],
+        )
+        line = CartItem.objects.get(user=self.user)
+        self.assertEqual(line.history.latest().updated_at, line.updated_at)
+
+
+class CartEngineTests(CartTestCase):
+    def test_concurrent_changes_are_not_lost(self):
+        self.add(self.user, 50)  # loads the cart and caches the payload, so the threads only talk to Redis
+        deltas = [1, -1, 1, 1, -1] * 40
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda delta: change_quantity(self.user.id, self.variant.id, delta), deltas))
+
+        expected = {self.variant.id: 50 + sum(deltas)}
+        quantities, totals = read_cart(self.user.id)
+        self.assertEqual(quantities, expected)
+        self.assertEqual(totals, {"count": 50 + sum(deltas), "subtotal": 250 * (50 + sum(deltas))})
+
+        flush_carts([self.user.id])
+        self.assertEqual(CartItem.quantities_for_user_id(self.user.id), expected)
+        forget_cart(self.user.id)
+        self.assertEqual(get_cart(self.user.id), expected)
+
+    def test_read_cart_loads_from_postgres_once(self):
+        CartItem.objects.create(user=self.user, variant=self.variant, quantity=3)
+        load_prices([self.variant.id])  # cache the payload
+
+        with self.assertNumQueries(1):
+            quantities, totals = read_cart(self.user.id)
+        self.assertEqual((quantities, totals), ({self.variant.id: 3}, {"count": 3, "subtotal": 750}))
+        with self.assertNumQueries(0):
+            read_cart(self.user.id)
+            self.add(self.user, 1)
+
+    def test_flush_runs_a_fixed_number_of_queries_per_cart(self):
+        users = [self.user] + [self.make_user(f"90000001{i:02d}") for i in range(4)]
+        for user in users:
+            self.add(user, 2)
+
+        # Per cart: a savepoint, the upsert, the deactivation and the release; however many lines.
+        with self.assertNumQueries(4 * len(users)):
+            self.assertEqual(flush_carts([user.id for user in users]), len(users))
+        for user in users:
+            self.assertEqual(CartItem.quantities_for_user_id(user.id), {self.variant.id: 2})
@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('', views.UserCartView.as_view(), name='user-cart'),
     path('add-to-cart/', views.AddToCartView.as_view(), name='add-to-cart'),
+    path('batch/', views.CartBatchView.as_view(), name='cart-batch'),
 ]
\ No newline at end of file
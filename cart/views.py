@@ -1,4 +1,4 @@
-from django.utils.text import slugify
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
 from django.db.models import Q
@@ -8,13 +8,28 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from .models import CartItem
-from user.models import UserProfile
-from inventory.models import ProductVariant
+from .engine import apply_changes, change_quantity, load_prices, read_cart
+from inventory.cache import get_variant_payloads
 from lib.common import calculate_shipping
 
 
 GST_PERC = 0.18
+MAX_BATCH_CHANGES = 100
+BATCH_OPS = ["add", "remove", "set"]
+
+
+def cart_totals(user, totals):
+    """Item count and price breakdown from the cart's running totals."""
+    subtotal = totals["subtotal"]
+    shipping = calculate_shipping(user.id)
+    gst = round(GST_PERC * subtotal)
+    return {
+        "item_count": totals["count"],
+        "subtotal": subtotal,
+        "gst": gst,
+        "shipping": shipping,
+        "total": subtotal + gst + shipping,
+    }
 
 
 class AddToCartView(APIView):
@@ -26,56 +41,70 @@ class AddToCartView(APIView):
         variant_id = request.data.get("variant_id")
         action = request.data.get("action")
 
-        if not user or not variant_id or action not in ["add", "remove"]:
+        if not user or not str(variant_id or "").isdigit() or action not in ["add", "remove"]:
             return Response({"error": "Invalid input data"}, status=HTTP_400_BAD_REQUEST)
 
-        user_profile = UserProfile.objects.filter(user=user).first()
-        if not user_profile:
-            return Response({"error": "User not found"}, status=HTTP_404_NOT_FOUND)
-
-        variant = ProductVariant.objects.filter(id=variant_id).first()
-        if not variant:
+        change = change_quantity(user.id, int(variant_id), 1 if action == "add" else -1)
+        if not change:
             return Response({"error": "Product variant not found"}, status=HTTP_404_NOT_FOUND)
 
-        existing_item = next(
-            (item for item in user_profile.cart_items.all() if item.variant.id == int(variant_id)),
-            None,
+        return Response(
+            {
+                **cart_totals(user, change),
+                "quantity": change["quantity"],
+                "total_amt": change["quantity"] * change["price"],
+                "success": True,
+            },
+            status=HTTP_200_OK,
         )
 
-        if action == "add":
-            if existing_item:
-                existing_item.quantity = existing_item.quantity + 1 if existing_item.is_active else 1
-                existing_item.is_active = True
-                existing_item.save()
-                quantity = existing_item.quantity
-            else:
-                cart_item = CartItem.objects.create(variant=variant, quantity=1)
-                user_profile.cart_items.add(cart_item)
-                quantity = 1
-
-        elif action == "remove":
-            if existing_item and existing_item.quantity > 1:
-                existing_item.quantity -= 1
-                existing_item.save()
-                quantity = existing_item.quantity
-            else:
-                user_profile.cart_items.remove(
-                    *[item for item in user_profile.cart_items.all() if item.variant.id == int(variant_id)]
-                )
-                quantity = 0
-
-        total_amt = quantity * variant.price if quantity else 0
-        user_profile.save()
-
-        cart_items = user_profile.cart_items.all()
-
-        subtotal = sum(
-            ProductVariant.objects.get(id=item.variant.id).price * item.quantity
-            for item in cart_items
-        )
+
+def parse_batch(changes):
+    """[(variant_id, op, qty)] from the batch payload; raises ValueError on any malformed change."""
+    if not isinstance(changes, list) or not 0 < len(changes) <= MAX_BATCH_CHANGES:
+        raise ValueError(f"Send between 1 and {MAX_BATCH_CHANGES} changes")
+
+    parsed = []
+    for change in changes:
+        if not isinstance(change, dict) or change.get("op") not in BATCH_OPS:
+            raise ValueError(f"Each change needs an op out of {', '.join(BATCH_OPS)}")
+        variant_id = change.get("variant_id")
+        qty = change.get("qty", 1 if change["op"] != "set" else None)
+        if not str(variant_id or "").isdigit() or not str(qty if qty is not None else "").isdigit():
+            raise ValueError("variant_id and qty must be non-negative integers")
+        if int(qty) > settings.CART_MAX_LINE_QTY:
+            raise ValueError(f"qty can be at most {settings.CART_MAX_LINE_QTY}")
+        parsed.append((int(variant_id), change["op"], int(qty)))
+    return parsed
+
+
+class CartBatchView(APIView):
+    """Applies a list of add/remove/set changes to the user's cart in one step."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        try:
+            changes = parse_batch(request.data if isinstance(request.data, list) else request.data.get("changes"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+
+        price_version, payloads = load_prices({variant_id for variant_id, _, _ in changes})
+        missing = sorted({variant_id for variant_id, _, _ in changes} - set(payloads))
+        if missing:
+            return Response(
+                {"error": "Product variant not found", "variant_ids": missing},
+                status=HTTP_404_NOT_FOUND,
+            )
+
+        result = apply_changes(user.id, changes, price_version, payloads)
+        # Quantity of each variant after the whole batch; a later change to the same variant wins.
+        quantities = {
+            str(variant_id): quantity for (variant_id, _, _), quantity in zip(changes, result["quantities"])
+        }
 
         return Response(
-            {"quantity": quantity, "subtotal": subtotal, "total_amt": total_amt, "success": True},
+            {**cart_totals(user, result), "quantities": quantities, "success": True},
             status=HTTP_200_OK,
         )
 
@@ -86,47 +115,22 @@ class UserCartView(APIView):
 
     def get(self, request):
         user = request.user
-        user_profile = UserProfile.objects.filter(user_id=user.id).first()
-
-        if not user_profile:
-            return Response({"error": "User profile not found"}, status=HTTP_404_NOT_FOUND)
-
-        cart_items = user_profile.cart_items.filter(is_active=True)
-        variants = []
-        subtotal = 0
-
-        for item in cart_items:
-            variant = ProductVariant.objects.get(id=item.variant_id)
-            subtotal += variant.price * item.quantity
-            variants.append(
-                {
-                    "id": str(variant.id),
-                    "product_id": variant.product_id,
-                    "category_id": variant.category_id,
-                    "price": variant.price,
-                    "name": variant.name,
-                    "slug": slugify(variant.name),
-                    "file_path": f"http://localhost{variant.file_path.url}",
-                    "filters": variant.filters,
-                    "current_stock": variant.current_stock,
-                    "sold_stock": variant.sold_stock,
-                    "is_active": variant.is_active,
-                    "created_at": variant.created_at,
-                    "updated_at": variant.updated_at,
-                    "quantity": item.quantity,
-                    "total_amt": item.quantity * variant.price,
-                }
-            )
-
-        shipping = calculate_shipping(user.id)
-        gst = round(GST_PERC * subtotal)
+        quantities, totals = read_cart(user.id)
+        payloads = get_variant_payloads(list(quantities))
+        variants = [
+            {
+                **payloads[variant_id],
+                "id": str(variant_id),
+                "quantity": quantity,
+                "total_amt": quantity * payloads[variant_id]["price"],
+            }
+            for variant_id, quantity in quantities.items()
+            if variant_id in payloads
+        ]
 
         response_data = {
             "username": user.username,
-            "subtotal": subtotal,
-            "gst": gst,
-            "shipping": shipping,
-            "total": subtotal + gst + shipping,
+            **cart_totals(user, totals),
             "variants": variants,
         }
 
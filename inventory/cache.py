@@ -0,0 +1,89 @@
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .serializers import serialize_variant, variant_queryset
+
+CATALOG_VERSION_KEY = "catalog:version"
+VARIANT_PAYLOAD_TIMEOUT = 60 * 60 * 24
+VARIANT_CACHE_STATS_KEY = "variant_cache:stats"
+
+
+def catalog_version():
+    """Current catalog generation; cached catalog data is keyed on it."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog document by moving to a new generation."""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 1, timeout=None)
+        return 1
+
+
+def variant_payload_key(variant_id):
+    return f"variant:payload:{variant_id}"
+
+
+def get_variant_payloads(variant_ids):
+    """Return {id: payload} for variant_ids: one MGET, then one id__in query for the misses."""
+    from .models import ProductVariant
+
+    keys = {variant_payload_key(variant_id): variant_id for variant_id in set(variant_ids)}
+    payloads = {keys[key]: payload for key, payload in cache.get_many(keys).items()}
+
+    missing = [variant_id for variant_id in keys.values() if variant_id not in payloads]
+    if missing:
+        fresh = {
+            variant.id: serialize_variant(variant)
+            for variant in variant_queryset(ProductVariant.objects.filter(id__in=missing))
+        }
+        cache.set_many(
+            {variant_payload_key(variant_id): payload for variant_id, payload in fresh.items()},
+            timeout=VARIANT_PAYLOAD_TIMEOUT,
+        )
+        payloads.update(fresh)
+
+    record_variant_cache_stats(hits=len(keys) - len(missing), misses=len(missing))
+    return payloads
+
+
+def cached_variants(variant_ids, quantities=None):
+    """Variant payloads in the order of variant_ids, with cart quantities overlaid."""
+    payloads = get_variant_payloads(variant_ids)
+    quantities = quantities or {}
+    return [
+        {**payloads[variant_id], "quantity": quantities.get(variant_id, 0)}
+        for variant_id in variant_ids
+        if variant_id in payloads
+    ]
+
+
+def invalidate_variant_payloads(variant_ids):
+    """Drop cached payloads once the surrounding transaction commits."""
+    keys = [variant_payload_key(variant_id) for variant_id in variant_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def record_variant_cache_stats(hits, misses):
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    if hits:
+        pipe.hincrby(VARIANT_CACHE_STATS_KEY, "hits", hits)
+    if misses:
+        pipe.hincrby(VARIANT_CACHE_STATS_KEY, "misses", misses)
+    pipe.execute()
+
+
+def variant_cache_stats():
+    stats = get_redis_connection("default").hgetall(VARIANT_CACHE_STATS_KEY)
+    hits = int(stats.get(b"hits", 0))
+    misses = int(stats.get(b"misses", 0))
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": round(hits / lookups, 4) if lookups else None}
@@ -0,0 +1,112 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from cart.quantities import cart_quantities
+from .cache import catalog_version, get_variant_payloads
+from .models import FeaturedProductLine
+
+CATALOG_DOCUMENT_TIMEOUT = 60 * 5
+
+
+def digest(value):
+    return hashlib.md5(json.dumps(value, cls=DjangoJSONEncoder, sort_keys=True).encode()).hexdigest()
+
+
+class CatalogDocument:
+    """An anonymous catalog body shared by every user, with its ETag and the variant ids it lists."""
+
+    def __init__(self, body, variant_ids):
+        self.body = body
+        self.variant_ids = list(variant_ids)
+        self.etag = digest(body)
+
+
+def get_document(name, params, build, timeout=CATALOG_DOCUMENT_TIMEOUT):
+    """Cached CatalogDocument for name/params under the current catalog version; build() fills misses."""
+    key = f"catalog:{name}:{catalog_version()}:{digest(params)}"
+    document = cache.get(key)
+    if document is None:
+        document = build()
+        if document is not None:
+            cache.set(key, document, timeout=timeout)
+    return document
+
+
+def overlay_quantities(variants, overlay):
+    return [{**variant, "quantity": overlay.get(variant["id"], 0)} for variant in variants]
+
+
+def catalog_response(request, document, personalize):
+    """Serve document with the user's cart quantities merged in, answering 304 when the ETag matches.
+
+    personalize(body, overlay) returns a copy of body with {variant_id: quantity} applied;
+    it is only called when the user has any of the listed variants in their cart.
+    """
+    quantities = cart_quantities(request)
+    overlay = {variant_id: quantities[variant_id] for variant_id in document.variant_ids if variant_id in quantities}
+
+    etag = document.etag if not overlay else f"{document.etag}-{digest(sorted(overlay.items()))[:12]}"
+    etag = f'"{etag}"'
+
+    client_etags = [tag[2:] if tag.startswith("W/") else tag for tag in parse_etags(request.headers.get("If-None-Match", ""))]
+    if etag in client_etags or "*" in client_etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        body = personalize(document.body, overlay) if overlay else document.body
+        response = Response(body, status=status.HTTP_200_OK)
+
+    response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+def featured_document(limit):
+    """Anonymous featured payload: top `limit` variants per active line, split into primary and secondary."""
+    return get_document("featured", {"limit": limit}, lambda: build_featured_document(limit))
+
+
+def build_featured_document(limit):
+    lines = list(FeaturedProductLine.objects.filter(is_active=True))
+    if not lines:
+        return CatalogDocument({"featured_products": []}, [])
+
+    line_ids = {
+        line.id: [int(variant_id) for variant_id in line.variants if variant_id and variant_id.isdigit()]
+        for line in lines
+    }
+    # One batched fetch for the union of every line's variants.
+    payloads = get_variant_payloads({variant_id for ids in line_ids.values() for variant_id in ids})
+
+    body = {"primary_products": [], "secondary_products": []}
+    variant_ids = set()
+    for line in lines:
+        variants = sorted(
+            (payloads[variant_id] for variant_id in set(line_ids[line.id]) if variant_id in payloads),
+            key=lambda variant: (-variant["sold_stock"], variant["id"]),
+        )[:limit]
+        variant_ids.update(variant["id"] for variant in variants)
+        data = {
+            "id": line.id,
+            "title": line.title,
+            "description": line.description,
+            "images": list(line.images),
+            "is_active": line.is_active,
+            "variants": variants,
+        }
+        body["primary_products" if line.is_primary else "secondary_products"].append(data)
+    return CatalogDocument(body, variant_ids)
+
+
+def personalize_featured(body, overlay):
+    return {
+        group: [{**line, "variants": overlay_quantities(line["variants"], overlay)} for line in lines]
+        for group, lines in body.items()
+    }
@@ -0,0 +1,45 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import connection
+
+from .cache import catalog_version
+
+FACETS_TIMEOUT = 60 * 15
+
+
+def compute_facets(queryset):
+    """Count {key: {value: count}} over the `filters` of every variant in queryset, in one query."""
+    sql, params = queryset.order_by().values("filters").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT kv.key, kv.value, COUNT(*)
+            FROM ({sql}) AS v, jsonb_each_text(v.filters) AS kv
+            WHERE jsonb_typeof(v.filters) = 'object'
+            GROUP BY kv.key, kv.value
+            ORDER BY kv.key, COUNT(*) DESC, kv.value
+            """,
+            params,
+        )
+        rows = cursor.fetchall()
+
+    facets = {}
+    for key, value, count in rows:
+        facets.setdefault(key, {})[value] = count
+    return facets
+
+
+def facets_cache_key(*parts):
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f"facets:{catalog_version()}:{digest}"
+
+
+def get_facets(queryset, *key_parts):
+    """Facet counts for queryset, cached under the filter that produced it."""
+    key = facets_cache_key(*key_parts)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, timeout=FACETS_TIMEOUT)
+    return facets
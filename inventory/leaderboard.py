@@ -0,0 +1,100 @@
+from django_redis import get_redis_connection
+
+LEADERBOARD_KEY = "leaderboard:variants"
+CATEGORY_KEYS_KEY = "leaderboard:categories"
+REBUILD_CHUNK = 5000
+
+# Moves a variant's score from one category board to another; the global board has the
+# score (ARGV[2] when the variant is not on it yet).
+MOVE_SCRIPT = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1]) or ARGV[2]
+redis.call('ZADD', KEYS[1], 'NX', score, ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], score, ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[3])
+return score
+"""
+
+
+def category_leaderboard_key(category_id):
+    return f"leaderboard:category:{category_id}"
+
+
+def leaderboard_keys(category_id):
+    return [LEADERBOARD_KEY, category_leaderboard_key(category_id)]
+
+
+def top_variant_ids(limit, category_id=None):
+    """Best-selling variant ids, highest first; empty when the leaderboard has not been built."""
+    if limit <= 0:
+        # zrevrange(key, 0, -1) would be the whole board.
+        return []
+    key = category_leaderboard_key(category_id) if category_id else LEADERBOARD_KEY
+    return [int(variant_id) for variant_id in get_redis_connection("default").zrevrange(key, 0, limit - 1)]
+
+
+def record_sales(sales):
+    """Add sold quantities to the global and per-category boards; sales is (variant_id, category_id, quantity)."""
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for variant_id, category_id, quantity in sales:
+        for key in leaderboard_keys(category_id):
+            pipe.zincrby(key, quantity, variant_id)
+        pipe.sadd(CATEGORY_KEYS_KEY, category_id)
+    pipe.execute()
+
+
+def add_variant(variant_id, category_id, score):
+    """Put a variant on the boards without touching a score it already has."""
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for key in leaderboard_keys(category_id):
+        pipe.zadd(key, {variant_id: score}, nx=True)
+    pipe.sadd(CATEGORY_KEYS_KEY, category_id)
+    pipe.execute()
+
+
+def move_variant(variant_id, old_category_id, category_id, score):
+    """Carry a variant's score over to the board of its new category."""
+    get_redis_connection("default").eval(
+        MOVE_SCRIPT, 4,
+        LEADERBOARD_KEY, category_leaderboard_key(old_category_id), category_leaderboard_key(category_id),
+        CATEGORY_KEYS_KEY,
+        variant_id, score, category_id,
+    )
+
+
+def remove_variant(variant_id, category_id):
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for key in leaderboard_keys(category_id):
+        pipe.zrem(key, variant_id)
+    pipe.execute()
+
+
+def rebuild_leaderboards(scores):
+    """Replace every board from (variant_id, category_id, score) rows; readers see the swap atomically."""
+    conn = get_redis_connection("default")
+    staged = {}
+
+    pipe = conn.pipeline(transaction=False)
+    for count, (variant_id, category_id, score) in enumerate(scores, start=1):
+        for key in leaderboard_keys(category_id):
+            staging_key = staged.setdefault(key, f"{key}:rebuild")
+            pipe.zadd(staging_key, {variant_id: score})
+        if count % REBUILD_CHUNK == 0:
+            pipe.execute()
+    pipe.execute()
+
+    old_category_ids = [category_id.decode() for category_id in conn.smembers(CATEGORY_KEYS_KEY)]
+    category_ids = {key.rsplit(":", 1)[1] for key in staged if key != LEADERBOARD_KEY}
+
+    pipe = conn.pipeline(transaction=True)
+    pipe.delete(
+        LEADERBOARD_KEY,
+        CATEGORY_KEYS_KEY,
+        *[category_leaderboard_key(category_id) for category_id in old_category_ids],
+    )
+    for key, staging_key in staged.items():
+        pipe.rename(staging_key, key)
+    if category_ids:
+        pipe.sadd(CATEGORY_KEYS_KEY, *category_ids)
+    pipe.execute()
+    return len(staged)
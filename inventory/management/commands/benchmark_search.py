@@ -0,0 +1,127 @@
+from django.core.management.base import BaseCommand
+from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+from django.utils.text import slugify
+import random
+import time
+
+from inventory.models import Category, Product, ProductVariant
+
+
+BENCH_PREFIX = "Bench"
+COLORS = ["Red", "Blue", "Black", "Brown", "Green"]
+SIZES = ["S", "M", "L", "XL"]
+MATERIALS = ["Leather", "Cotton", "Wool", "Silk", "Wood"]
+PRICES = [999, 1299, 1499, 1999, 2499, 2999]
+
+
+def legacy_search(query_string, limit):
+    """The query-time vector that variant search used before search_document."""
+    search_vector = (
+        SearchVector("name", weight="A")
+        + SearchVector("filters", weight="B")
+        + SearchVector("product__name", weight="A")
+        + SearchVector("product__description", weight="B")
+        + SearchVector("category__name", weight="A")
+    )
+    search_query = SearchQuery(query_string)
+    return list(
+        ProductVariant.objects.annotate(rank=SearchRank(search_vector, search_query))
+        .filter(rank__gte=0.1, is_active=True)
+        .order_by("-rank", "-sold_stock")[:limit]
+    )
+
+
+def stored_search(query_string, limit):
+    search_query = SearchQuery(query_string)
+    return list(
+        ProductVariant.objects.filter(is_active=True, search_document=search_query)
+        .annotate(rank=SearchRank(F("search_document"), search_query))
+        .filter(rank__gte=0.1)
+        .order_by("-rank", "-sold_stock")[:limit]
+    )
+
+
+class Command(BaseCommand):
+    help = "Populates benchmark variants and compares query-time and stored search latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--variants", type=int, default=100000)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--limit", type=int, default=8)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark rows afterwards")
+
+    def handle(self, *args, **options):
+        existing = ProductVariant.objects.filter(name__startswith=BENCH_PREFIX).count()
+        if existing < options["variants"]:
+            self.populate(existing, options["variants"], options["batch_size"])
+
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE inventory_productvariant")
+
+        queries = ["leather", "silk scarf", "blue wool rug", "handmade gifts"]
+        for query_string in queries:
+            legacy = self.time_runs(legacy_search, query_string, options)
+            stored = self.time_runs(stored_search, query_string, options)
+            self.stdout.write(
+                f"{query_string!r}: legacy {legacy:.1f} ms, stored {stored:.1f} ms "
+                f"({legacy / stored if stored else 0:.1f}x)"
+            )
+
+        if not options["keep"]:
+            ProductVariant.objects.filter(name__startswith=BENCH_PREFIX).delete()
+            Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+            Category.objects.filter(name__startswith=BENCH_PREFIX).delete()
+
+        self.stdout.write(self.style.SUCCESS("Search benchmark finished"))
+
+    def populate(self, start, total, batch_size):
+        categories = [
+            Category.objects.get_or_create(name=f"{BENCH_PREFIX} {name}")[0]
+            for name in ["Men", "Women", "Home", "Gifts"]
+        ]
+        products = [
+            Product.objects.get_or_create(
+                name=f"{BENCH_PREFIX} {name}",
+                defaults={"description": f"Handcrafted {name.lower()} made with love."},
+            )[0]
+            for name in ["Leather Shoes", "Wool Rug", "Pillow Covers", "Wooden Bangles", "Silk Scarf", "Tote Bag"]
+        ]
+
+        self.stdout.write(f"Populating {total - start} variants...")
+        for batch_start in range(start, total, batch_size):
+            batch = []
+            for i in range(batch_start, min(batch_start + batch_size, total)):
+                product = random.choice(products)
+                filters = {
+                    "Color": random.choice(COLORS),
+                    "Size": random.choice(SIZES),
+                    "Material": random.choice(MATERIALS),
+                }
+                name = f"{BENCH_PREFIX} {product.name} {filters['Color']} {i}"
+                batch.append(
+                    ProductVariant(
+                        name=name,
+                        slug=slugify(name),
+                        product=product,
+                        category=random.choice(categories),
+                        price=random.choice(PRICES),
+                        file_path="variants/variant1.jpg",
+                        filters=filters,
+                        current_stock=random.randint(10, 100),
+                        sold_stock=random.randint(0, 500),
+                    )
+                )
+            ProductVariant.objects.bulk_create(batch)
+
+        # bulk_create skips post_save, so build the documents in one pass.
+        ProductVariant.refresh_search_documents(name__startswith=BENCH_PREFIX)
+
+    def time_runs(self, search, query_string, options):
+        search(query_string, options["limit"])
+        started = time.perf_counter()
+        for _ in range(options["runs"]):
+            search(query_string, options["limit"])
+        return (time.perf_counter() - started) * 1000 / options["runs"]
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.text import slugify
+import random
+import time
+
+from inventory.models import ProductVariant
+from inventory.serializers import serialize_variants, media_url
+
+
+def legacy_serialize(variant_objs, quantities):
+    """The per-view dict builder that serialize_variants replaced."""
+    return [
+        {
+            "id": variant.id,
+            "product_id": variant.product_id,
+            "category_id": variant.category_id,
+            "name": variant.name,
+            "slug": slugify(variant.name),
+            "price": variant.price,
+            "file_path": f"http://localhost{variant.file_path.url}",
+            "filters": variant.filters,
+            "current_stock": variant.current_stock,
+            "sold_stock": variant.sold_stock,
+            "is_active": variant.is_active,
+            "created_at": variant.created_at,
+            "updated_at": variant.updated_at,
+            "quantity": quantities.get(variant.id, 0),
+        }
+        for variant in variant_objs
+    ]
+
+
+class Command(BaseCommand):
+    help = "Serializes in-memory variants with the legacy dict builder and with serialize_variants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--variants", type=int, default=10000)
+        parser.add_argument("--distinct-names", type=int, default=2000)
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Names repeat across runs the way popular variants repeat across requests.
+        variant_objs = [
+            ProductVariant(
+                id=i,
+                product_id=i % 7,
+                category_id=i % 5,
+                name=f"Handmade Leather Shoes Men Variant {i % options['distinct_names']}",
+                slug=f"handmade-leather-shoes-men-variant-{i % options['distinct_names']}",
+                price=random.choice([999, 1299, 1499]),
+                file_path=f"variants/variant{i % options['distinct_names']}.jpg",
+                filters={"Color": "Red", "Size": "M", "Material": "Leather"},
+                current_stock=50,
+                sold_stock=i % 100,
+                created_at=now,
+                updated_at=now,
+            )
+            for i in range(options["variants"])
+        ]
+        quantities = {i: 1 for i in range(0, options["variants"], 10)}
+
+        media_url.cache_clear()
+        for name, serialize in [("legacy", legacy_serialize), ("serialize_variants", serialize_variants)]:
+            serialize(variant_objs, quantities)
+            started = time.perf_counter()
+            for _ in range(options["runs"]):
+                serialize(variant_objs, quantities)
+            elapsed = (time.perf_counter() - started) * 1000 / options["runs"]
+            self.stdout.write(f"{name}: {elapsed:.1f} ms per {len(variant_objs)} variants")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from inventory.leaderboard import rebuild_leaderboards
+from inventory.models import ProductVariant
+from order.models import SoldProduct
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the Redis bestseller leaderboards from sold_stock or from SoldProduct rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-sold-products",
+            action="store_true",
+            help="Score variants by the quantities in SoldProduct instead of ProductVariant.sold_stock",
+        )
+
+    def handle(self, *args, **options):
+        variants = ProductVariant.objects.filter(is_active=True).values_list("id", "category_id", "sold_stock")
+
+        if options["from_sold_products"]:
+            sold = dict(
+                SoldProduct.objects.filter(variant__is_active=True)
+                .values("variant_id")
+                .annotate(total=Sum("quantity"))
+                .values_list("variant_id", "total")
+            )
+            scores = ((variant_id, category_id, sold.get(variant_id, 0)) for variant_id, category_id, _ in variants)
+        else:
+            scores = variants.iterator()
+
+        boards = rebuild_leaderboards(scores)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {boards} leaderboards"))
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.23 on 2026-10-18 00:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_search_documents(apps, schema_editor):
+    ProductVariant = apps.get_model('inventory', 'ProductVariant')
+    Product = apps.get_model('inventory', 'Product')
+    Category = apps.get_model('inventory', 'Category')
+    SearchVector = django.contrib.postgres.search.SearchVector
+
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    category = Category.objects.filter(pk=OuterRef('category_id'))
+    ProductVariant.objects.update(
+        search_document=(
+            SearchVector('name', weight='A')
+            + SearchVector('filters', weight='B')
+            + SearchVector(Subquery(product.values('name')[:1]), weight='A')
+            + SearchVector(Subquery(product.values('description')[:1]), weight='B')
+            + SearchVector(Subquery(category.values('name')[:1]), weight='A')
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_auto_20250920_0451'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalproductvariant',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='productvariant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='variant_search_doc_gin'),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.23 on 2026-10-18 00:58
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def backfill_slugs(apps, schema_editor):
+    ProductVariant = apps.get_model('inventory', 'ProductVariant')
+
+    taken = set()
+    variants = []
+    for variant in ProductVariant.objects.only('id', 'name').order_by('id'):
+        base = slugify(variant.name) or 'variant'
+        slug, suffix = base, 2
+        while slug in taken:
+            slug, suffix = f'{base}-{suffix}', suffix + 1
+        taken.add(slug)
+        variant.slug = slug
+        variants.append(variant)
+    ProductVariant.objects.bulk_update(variants, ['slug'], batch_size=1000)
+
+    slugs = dict(ProductVariant.objects.values_list('id', 'slug'))
+    HistoricalProductVariant = apps.get_model('inventory', 'HistoricalProductVariant')
+    records = list(HistoricalProductVariant.objects.only('history_id', 'id', 'name'))
+    for record in records:
+        record.slug = slugs.get(record.id) or slugify(record.name) or 'variant'
+    HistoricalProductVariant.objects.bulk_update(records, ['slug'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_productvariant_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalproductvariant',
+            name='slug',
+            field=models.SlugField(db_index=False, editable=False, max_length=120, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='slug',
+            field=models.SlugField(db_index=False, editable=False, max_length=120, null=True),
+        ),
+        migrations.RunPython(backfill_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='historicalproductvariant',
+            name='slug',
+            field=models.SlugField(db_index=True, editable=False, max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='productvariant',
+            name='slug',
+            field=models.SlugField(editable=False, max_length=120, unique=True),
+        ),
+    ]
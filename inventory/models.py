@@ -1,12 +1,18 @@
-from collections import defaultdict
-from django.db import models
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
-from django.db.models import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField, SearchQuery, SearchRank
+from django.db.models import F, FloatField, JSONField, OuterRef, Subquery
+from django.db.models.functions import Cast
 
 from lib.base_classes import BaseModel
+from .cache import cached_variants
+from .facets import get_facets
 
 
 class Category(BaseModel):
@@ -77,6 +83,7 @@ class ProductVariant(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="variants")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="variants")
     name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(max_length=120, unique=True, editable=False)
     price = models.IntegerField()
     file_path = models.FileField(upload_to="variants/")
     filters = JSONField(default=dict)
@@ -85,129 +92,175 @@ class ProductVariant(BaseModel):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_document = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_document"], name="variant_search_doc_gin"),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        variant = super().from_db(db, field_names, values)
+        # Read by the post_save handler, which moves the leaderboard score when the category changes.
+        variant.loaded_category_id = variant.__dict__.get("category_id")
+        return variant
+
+    def save(self, *args, **kwargs):
+        base = slugify(self.name) or "variant"
+        # Read by the post_save handler, which forgets the slug a rename replaced.
+        self.replaced_slug = None
+        if self.slug == base or re.fullmatch(rf"{re.escape(base)}-\d+", self.slug or ""):
+            return super().save(*args, **kwargs)
+
+        self.replaced_slug = self.slug
+        for attempt in range(SLUG_ATTEMPTS):
+            self.slug = unique_variant_slug(base, exclude_pk=self.pk)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except (IntegrityError, ValidationError) as e:
+                # A concurrent save took the slug after it was looked up; look again.
+                if attempt == SLUG_ATTEMPTS - 1 or not is_slug_conflict(e):
+                    raise
+
+    # ---------------------------
+    # Search document maintenance
+    # ---------------------------
+
+    @classmethod
+    def refresh_search_documents(cls, **filters):
+        """Rebuild the stored search document for every variant matching filters."""
+        return cls.objects.filter(**filters).update(search_document=search_document_vector())
+
     # ---------------------------
     # Classmethods for Filtering
     # ---------------------------
 
     @classmethod
-    def filter_by_search_str(cls, user_profile, query_string, skip, limit):
+    def filter_by_search_str(cls, quantities, query_string, page):
         """Search product variants by free text query across multiple fields."""
         if not query_string:
-            return {"title": "No results found", "description": "", "variants": []}
-
-        search_vector = (
-            SearchVector("name", weight="A")
-            + SearchVector("filters", weight="B")
-            + SearchVector("product__name", weight="A")
-            + SearchVector("product__description", weight="B")
-            + SearchVector("category__name", weight="A")
-        )
+            return no_results(page)
+
         search_query = SearchQuery(query_string)
 
-        variant_objs = (
-            cls.objects.annotate(rank=SearchRank(search_vector, search_query))
-            .filter(rank__gte=0.1, is_active=True)
-            .order_by("-rank", "-sold_stock")[skip : skip + limit]
+        queryset = (
+            cls.objects.filter(is_active=True, search_document=search_query)
+            .only(*PAGE_KEY_COLUMNS)
+            # ts_rank returns real; as double precision it round-trips exactly through a cursor.
+            .annotate(rank=Cast(SearchRank(F("search_document"), search_query), FloatField()))
+            .filter(rank__gte=0.1)
         )
-        total_count = variant_objs.count()
+        variant_objs, pagination = page.paginate(queryset, SEARCH_ORDERING)
+        facets = get_facets(queryset, "search", query_string.lower())
 
-        variants = variants_data(user_profile, variant_objs)
-        filters_dict = filters_data(variant_objs)
-
-        return {
-            "title": f"Results for {query_string}",
-            "description": "",
-            "filters": filters_dict,
-            "variants": variants,
-            "total_count": total_count,
-        }
+        return paginated_result(
+            quantities, variant_objs, pagination, facets,
+            title=f"Results for {query_string}",
+            description="",
+        )
 
     @classmethod
-    def filter_by_category_product(cls, user_profile, category_name, product_id, skip, limit):
+    def filter_by_category_product(cls, quantities, category_name, product_id, page):
         """Fetch variants belonging to a specific category and product."""
         category = Category.objects.filter(name=category_name).first()
         product = Product.objects.filter(id=product_id).first()
 
         if not category or not product:
-            return {"title": "No results found", "description": "", "variants": []}
+            return no_results(page)
 
-        variant_objs = (
-            cls.objects.filter(product=product, category=category)
-            .order_by("-sold_stock")[skip : skip + limit]
-        )
-        variants = variants_data(user_profile, variant_objs)
-        filters_dict = filters_data(variant_objs)
+        queryset = cls.objects.filter(product=product, category=category).only(*PAGE_KEY_COLUMNS)
+        variant_objs, pagination = page.paginate(queryset, VARIANT_ORDERING)
+        facets = get_facets(queryset, "category", category.id, product.id)
 
-        return {
-            "title": category_name,
-            "description": f"{product.name} ({product.description})",
-            "filters": filters_dict,
-            "variants": variants,
-            "total_count": cls.objects.filter(product=product, category=category).count(),
-        }
+        return paginated_result(
+            quantities, variant_objs, pagination, facets,
+            title=category_name,
+            description=f"{product.name} ({product.description})",
+        )
 
     @classmethod
-    def filter_by_featured_prod(cls, user_profile, featured_prod_id, skip, limit):
+    def filter_by_featured_prod(cls, quantities, featured_prod_id, page):
         """Fetch variants linked to a featured product line."""
         featured_prod = FeaturedProductLine.objects.filter(id=featured_prod_id).first()
         if not featured_prod:
-            return {"title": "No results found", "description": "", "variants": []}
+            return no_results(page)
 
         ids = [variant_id for variant_id in featured_prod.variants if variant_id]
-        variant_objs = (
-            cls.objects.filter(id__in=ids).order_by("-sold_stock")[skip : skip + limit] if ids else []
-        )
+        if not ids:
+            return no_results(page, title=featured_prod.title, description=featured_prod.description)
+
+        queryset = cls.objects.filter(id__in=ids).only(*PAGE_KEY_COLUMNS)
+        variant_objs, pagination = page.paginate(queryset, VARIANT_ORDERING)
+        facets = get_facets(queryset, "featured", featured_prod.id)
 
-        variants = variants_data(user_profile, variant_objs)
-        filters_dict = filters_data(variant_objs)
-
-        return {
-            "title": featured_prod.title,
-            "description": featured_prod.description,
-            "filters": filters_dict,
-            "variants": variants,
-            "total_count": cls.objects.filter(id__in=ids).count(),
-        }
-
-def variants_data(user_profile, variant_objs):
-    """Helper to build consistent variant response payloads."""
-    variants = []
-    for variant in variant_objs:
-        quantity = 0
-        if user_profile:
-            for item in user_profile.cart_items.all():
-                if item.variant_id == str(variant.id):
-                    quantity = item.quantity
-                    break
-        variants.append(
-            {
-                "id": variant.id,
-                "product_id": variant.product.id,
-                "category_id": variant.category.id,
-                "name": variant.name,
-                "slug": slugify(variant.name),
-                "price": variant.price,
-                "file_path": f"http://localhost:8001{variant.file_path.url}",
-                "filters": variant.filters,
-                "current_stock": variant.current_stock,
-                "sold_stock": variant.sold_stock,
-                "is_active": variant.is_active,
-                "created_at": variant.created_at,
-                "updated_at": variant.updated_at,
-                "quantity": quantity,
-            }
+        return paginated_result(
+            quantities, variant_objs, pagination, facets,
+            title=featured_prod.title,
+            description=featured_prod.description,
         )
-    return variants
-
-def filters_data(variant_objs):
-    """Helper to extract distinct filters from variants."""
-    filters_dict = defaultdict(set)
-    for variant in variant_objs:
-        if variant.filters:
-            for key, value in variant.filters.items():
-                filters_dict[key].add(value)
-    return {key: list(values) for key, values in filters_dict.items()}
+
+
+VARIANT_ORDERING = ("-sold_stock", "id")
+SEARCH_ORDERING = ("-rank", "-sold_stock", "id")
+# Pages only load their sort keys; payloads come from the variant cache.
+PAGE_KEY_COLUMNS = ("id", "sold_stock")
+
+
+def paginated_result(quantities, variant_objs, pagination, facets, **extra):
+    """Assemble the filter response for one page of variants and the facets of the whole result set."""
+    result = {
+        **extra,
+        "filters": {key: list(values) for key, values in facets.items()},
+        "facets": facets,
+        "variants": cached_variants([variant.id for variant in variant_objs], quantities),
+        "pagination": pagination,
+    }
+    if "total" in pagination:
+        result["total_count"] = pagination["total"]
+    return result
+
+
+def no_results(page, title="No results found", description=""):
+    return paginated_result({}, [], page.empty(), {}, title=title, description=description)
+
+
+SLUG_ATTEMPTS = 5
+
+
+def is_slug_conflict(error):
+    """Whether a failed save lost its slug to another variant, rather than failing on something else."""
+    if isinstance(error, ValidationError):
+        return set(getattr(error, "error_dict", {})) == {"slug"}
+    constraint = getattr(getattr(error.__cause__, "diag", None), "constraint_name", None)
+    return bool(constraint) and "slug" in constraint
+
+
+def unique_variant_slug(base, exclude_pk=None):
+    """First of base, base-2, base-3, ... not used by another variant."""
+    taken = set(
+        ProductVariant.objects.filter(slug__startswith=base)
+        .exclude(pk=exclude_pk)
+        .values_list("slug", flat=True)
+    )
+    slug, suffix = base, 2
+    while slug in taken:
+        slug, suffix = f"{base}-{suffix}", suffix + 1
+    return slug
+
+
+def search_document_vector():
+    """Weighted search vector over a variant and its product and category."""
+    product = Product.objects.filter(pk=OuterRef("product_id"))
+    category = Category.objects.filter(pk=OuterRef("category_id"))
+    return (
+        SearchVector("name", weight="A")
+        + SearchVector("filters", weight="B")
+        + SearchVector(Subquery(product.values("name")[:1]), weight="A")
+        + SearchVector(Subquery(product.values("description")[:1]), weight="B")
+        + SearchVector(Subquery(category.values("name")[:1]), weight="A")
+    )
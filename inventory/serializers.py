@@ -0,0 +1,60 @@
+from functools import lru_cache
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+# Model fields the payload reads; querysets are narrowed to exactly these.
+VARIANT_COLUMNS = (
+    "id", "product", "category", "name", "slug", "price", "file_path", "filters",
+    "current_stock", "sold_stock", "is_active", "created_at", "updated_at",
+)
+
+_variant_values = attrgetter(
+    "id", "product_id", "category_id", "name", "slug", "price", "file_path", "filters",
+    "current_stock", "sold_stock", "is_active", "created_at", "updated_at",
+)
+
+
+@lru_cache(maxsize=65536)
+def media_url(name):
+    return f"{settings.MEDIA_HOST}{default_storage.url(name)}"
+
+
+def variant_columns(prefix=""):
+    """VARIANT_COLUMNS as only() arguments, optionally through a relation like "variant__"."""
+    return [f"{prefix}{column}" for column in VARIANT_COLUMNS]
+
+
+def variant_queryset(queryset):
+    """Restrict a ProductVariant queryset to the columns serialize_variant needs."""
+    return queryset.only(*VARIANT_COLUMNS)
+
+
+def serialize_variant(variant, quantity=0):
+    (
+        id_, product_id, category_id, name, slug, price, file_path, filters,
+        current_stock, sold_stock, is_active, created_at, updated_at,
+    ) = _variant_values(variant)
+    return {
+        "id": id_,
+        "product_id": product_id,
+        "category_id": category_id,
+        "name": name,
+        "slug": slug,
+        "price": price,
+        "file_path": media_url(file_path.name),
+        "filters": filters,
+        "current_stock": current_stock,
+        "sold_stock": sold_stock,
+        "is_active": is_active,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "quantity": quantity,
+    }
+
+
+def serialize_variants(variant_objs, quantities=None):
+    """Serialize variants in order, overlaying {variant_id: quantity} when given."""
+    quantities = quantities or {}
+    return [serialize_variant(variant, quantities.get(variant.id, 0)) for variant in variant_objs]
@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import leaderboard, slugs
+from .cache import bump_catalog_version, invalidate_variant_payloads
+from .models import Category, FeaturedProductLine, Product, ProductVariant
+
+
+@receiver(post_save, sender=ProductVariant)
+def refresh_variant_search_document(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ProductVariant.refresh_search_documents(pk=instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_search_documents(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ProductVariant.refresh_search_documents(product_id=instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_search_documents(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ProductVariant.refresh_search_documents(category_id=instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=FeaturedProductLine)
+@receiver(post_delete, sender=FeaturedProductLine)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def invalidate_variant_payload(sender, instance, **kwargs):
+    invalidate_variant_payloads([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_variant_payloads(sender, instance, **kwargs):
+    invalidate_variant_payloads(ProductVariant.objects.filter(product_id=instance.pk).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_variant_payloads(sender, instance, **kwargs):
+    invalidate_variant_payloads(ProductVariant.objects.filter(category_id=instance.pk).values_list("id", flat=True))
+
+
+@receiver(post_save, sender=ProductVariant)
+def sync_variant_leaderboard(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    variant_id, category_id, score = instance.pk, instance.category_id, instance.sold_stock
+    old_category_id = getattr(instance, "loaded_category_id", None)
+    instance.loaded_category_id = category_id
+    moved = old_category_id not in (None, category_id)
+
+    if instance.is_active and moved:
+        transaction.on_commit(lambda: leaderboard.move_variant(variant_id, old_category_id, category_id, score))
+    elif instance.is_active:
+        transaction.on_commit(lambda: leaderboard.add_variant(variant_id, category_id, score))
+    else:
+        transaction.on_commit(lambda: leaderboard.remove_variant(variant_id, category_id))
+        if moved:
+            transaction.on_commit(lambda: leaderboard.remove_variant(variant_id, old_category_id))
+
+
+@receiver(post_delete, sender=ProductVariant)
+def remove_variant_from_leaderboard(sender, instance, **kwargs):
+    # The instance's pk is cleared once the delete is done.
+    variant_id, category_id = instance.pk, instance.category_id
+    transaction.on_commit(lambda: leaderboard.remove_variant(variant_id, category_id))
+
+
+@receiver(post_save, sender=ProductVariant)
+def remember_variant_slug(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    slug, variant_id = instance.slug, instance.pk
+    replaced = getattr(instance, "replaced_slug", None)
+
+    def remember():
+        if replaced:
+            slugs.forget_slug(replaced)
+        slugs.remember_slug(slug, variant_id)
+
+    transaction.on_commit(remember)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def forget_variant_slug(sender, instance, **kwargs):
+    slug = instance.slug
+    transaction.on_commit(lambda: slugs.forget_slug(slug))
@@ -0,0 +1,37 @@
+import logging
+
+from django.db import DatabaseError
+
+from .models import ProductVariant
+
+logger = logging.getLogger(__name__)
+
+# slug -> variant id for this process; warmed at startup, filled on miss.
+_slug_ids = {}
+
+
+def warm_slug_index():
+    try:
+        _slug_ids.update(ProductVariant.objects.values_list("slug", "id").iterator())
+    except DatabaseError:
+        logger.warning("Could not warm the variant slug index", exc_info=True)
+
+
+def variant_id_for_slug(slug, refresh=False):
+    """Variant id for slug from the in-process map, falling back to the unique slug index."""
+    variant_id = None if refresh else _slug_ids.get(slug)
+    if variant_id is None:
+        variant_id = ProductVariant.objects.filter(slug=slug).values_list("id", flat=True).first()
+        if variant_id is None:
+            _slug_ids.pop(slug, None)
+        else:
+            _slug_ids[slug] = variant_id
+    return variant_id
+
+
+def remember_slug(slug, variant_id):
+    _slug_ids[slug] = variant_id
+
+
+def forget_slug(slug):
+    _slug_ids.pop(slug, None)
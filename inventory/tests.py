@@ -1,3 +1,197 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+
+from cart.models import CartItem
+from lib.testing import FixturesTestCase
+from . import leaderboard, models, slugs
+from .cache import bump_catalog_version
+from .models import Category, FeaturedProductLine, ProductVariant
+from user.models import UserProfile
+
+PAGE_SIZES = [2, 8, 32]
+
+
+class CatalogTestCase(FixturesTestCase):
+    def setUp(self):
+        self.make_catalog("Shoes", "Walking shoes")
+        self.product.categories.add(self.category)
+        self.variants = [
+            self.make_variant(
+                f"Walking shoes {i}", price=100 + i, filters={"Size": str(i % 5)}, current_stock=10, sold_stock=i,
+            )
+            for i in range(40)
+        ]
+        with self.committed():
+            self.featured = FeaturedProductLine.objects.create(
+                title="Summer", description="Summer", is_primary=True,
+                variants=[str(variant.id) for variant in self.variants[:20]],
+            )
+
+        self.user = self.make_user("9000000010")
+        UserProfile.objects.create(user=self.user)
+        CartItem.objects.bulk_create(
+            [CartItem(user=self.user, variant=variant, quantity=2) for variant in self.variants[::4]]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class CatalogQueryTests(CatalogTestCase):
+    """Catalog endpoints run as many queries for a page of 32 as for a page of 2, cart overlay included."""
+
+    def assertConstantQueries(self, name, params, queries):
+        # Load the cart and every variant payload the pages need.
+        self.client.get(reverse(name), {**params, "limit": max(PAGE_SIZES)})
+        for size in PAGE_SIZES:
+            bump_catalog_version()
+            with self.subTest(limit=size), self.assertNumQueries(queries):
+                response = self.client.get(reverse(name), {**params, "limit": size})
+                self.assertEqual(response.status_code, 200)
+            # Rebuilt once, then served from the catalog cache.
+            with self.subTest(limit=size, cached=True), self.assertNumQueries(0):
+                self.client.get(reverse(name), {**params, "limit": size})
+
+    def test_popular(self):
+        # Redis is shared with other databases; pin the board to this test's variants.
+        best_selling = [variant.id for variant in reversed(self.variants)]
+        with mock.patch.object(leaderboard, "top_variant_ids", side_effect=lambda limit, category_id=None: best_selling[:limit]):
+            self.assertConstantQueries("popular_products", {}, 0)
+
+    def test_popular_without_leaderboard(self):
+        with mock.patch.object(leaderboard, "top_variant_ids", return_value=[]):
+            self.assertConstantQueries("popular_products", {}, 1)
+
+    def test_featured(self):
+        self.assertConstantQueries("featured", {}, 1)
+
+    def test_filter_by_category(self):
+        self.assertConstantQueries("filter", {"category": self.category.name, "product_id": self.product.id}, 5)
+
+    def test_filter_by_search(self):
+        self.assertConstantQueries("filter", {"search_str": "walking"}, 3)
+
+    def test_filter_by_featured_line(self):
+        self.assertConstantQueries("filter", {"featured_prod_id": self.featured.id}, 4)
+
+    def test_out_of_range_paging_is_rejected(self):
+        for params in [{"limit": -1}, {"skip": -1}, {"limit": 0, "cursor": ""}]:
+            with self.subTest(**params):
+                response = self.client.get(reverse("filter"), {"search_str": "walking", **params})
+                self.assertEqual(response.status_code, 400)
+
+
+class CartOverlayTests(CatalogTestCase):
+    def test_listings_show_the_users_cart_quantities(self):
+        response = self.client.get(
+            reverse("filter"), {"category": self.category.name, "product_id": self.product.id, "limit": 32}
+        )
+        self.assertEqual(response.status_code, 200)
+        in_cart = {variant.id for variant in self.variants[::4]}
+        quantities = {variant["id"]: variant["quantity"] for variant in response.json()["variants"]}
+        self.assertEqual(len(quantities), 32)
+        self.assertEqual(
+            {variant_id for variant_id, quantity in quantities.items() if quantity}, in_cart & set(quantities)
+        )
+        self.assertTrue(all(quantities[variant_id] == 2 for variant_id in in_cart & set(quantities)))
+
+    def test_anonymous_listings_show_no_quantities(self):
+        response = APIClient().get(
+            reverse("filter"), {"category": self.category.name, "product_id": self.product.id, "limit": 32}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(variant["quantity"] for variant in response.json()["variants"]))
+
+
+class VariantSlugTests(FixturesTestCase):
+    def setUp(self):
+        self.make_catalog("Bags", "Tote bag")
+
+    def test_saving_puts_the_slug_in_the_map(self):
+        variant = self.make_variant("Tote bag red")
+        with self.assertNumQueries(0):
+            self.assertEqual(slugs.variant_id_for_slug("tote-bag-red"), variant.id)
+
+    def test_renaming_forgets_the_old_slug(self):
+        variant = self.make_variant("Tote bag red")
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.name = "Tote bag crimson"
+            variant.save()
+
+        self.assertEqual(variant.slug, "tote-bag-crimson")
+        self.assertNotIn("tote-bag-red", slugs._slug_ids)
+        self.assertIsNone(slugs.variant_id_for_slug("tote-bag-red"))
+        self.assertEqual(slugs.variant_id_for_slug("tote-bag-crimson"), variant.id)
+
+    def test_stale_map_entry_is_looked_up_again(self):
+        variant = self.make_variant("Tote bag red")
+        # Another process deleted the variant the map points at, and this one took its slug.
+        slugs.remember_slug("tote-bag-red", variant.id + 1000)
+
+        response = self.client.get(reverse("detail"), {"variant_slug": "tote-bag-red"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], variant.id)
+
+    def test_slug_is_forgotten_once_the_delete_commits(self):
+        variant_id = self.make_variant("Tote bag red").id
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductVariant.objects.get(id=variant_id).delete()
+            raise IntegrityError("rolled back")
+        self.assertEqual(slugs._slug_ids.get("tote-bag-red"), variant_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.get(slug="tote-bag-red").delete()
+        self.assertNotIn("tote-bag-red", slugs._slug_ids)
+
+    def test_names_with_the_same_slug_get_a_suffix(self):
+        self.make_variant("Tote bag red")
+        self.assertEqual(self.make_variant("Tote bag: red").slug, "tote-bag-red-2")
+
+    def test_a_slug_taken_after_the_lookup_is_looked_up_again(self):
+        self.make_variant("Tote bag red")
+        real = models.unique_variant_slug
+        # The first lookup misses the row, as it would when a concurrent create commits just after it.
+        stale = mock.patch.object(models, "unique_variant_slug", side_effect=["tote-bag-red", real("tote-bag-red")])
+        for skip_validation in [False, True]:
+            with self.subTest(skip_validation=skip_validation), stale:
+                with mock.patch.object(ProductVariant, "validate_unique") if skip_validation else mock.MagicMock():
+                    variant = self.make_variant(f"Tote bag: red {skip_validation}")
+                self.assertEqual(variant.slug, "tote-bag-red-2")
+                variant.delete()
+
+
+class LeaderboardTests(FixturesTestCase):
+    def setUp(self):
+        self.make_catalog("Bags", "Tote bag")
+        self.bags, self.shoes = self.category, Category.objects.create(name="Shoes")
+        self.variant = self.make_variant("Tote bag red")
+        # Redis is shared with other databases, which may have scored this id; start from nothing.
+        for category in [self.bags, self.shoes]:
+            leaderboard.remove_variant(self.variant.id, category.id)
+            self.addCleanup(leaderboard.remove_variant, self.variant.id, category.id)
+        leaderboard.record_sales([(self.variant.id, self.bags.id, 7)])
+
+    def test_no_limit_means_no_variants(self):
+        self.assertIn(self.variant.id, leaderboard.top_variant_ids(100, self.bags.id))
+        for limit in [0, -1]:
+            with self.subTest(limit=limit):
+                self.assertEqual(leaderboard.top_variant_ids(limit, self.bags.id), [])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in [{"limit": 0}, {"limit": -1}, {"limit": "ten"}, {"category_id": "bags"}]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(reverse("popular_products"), params).status_code, 400)
+
+    def test_category_change_moves_the_score(self):
+        variant = ProductVariant.objects.get(id=self.variant.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.category = self.shoes
+            variant.save()
+
+        conn = get_redis_connection("default")
+        self.assertIsNone(conn.zscore(leaderboard.category_leaderboard_key(self.bags.id), self.variant.id))
+        self.assertEqual(conn.zscore(leaderboard.category_leaderboard_key(self.shoes.id), self.variant.id), 7)
+        self.assertEqual(conn.zscore(leaderboard.LEADERBOARD_KEY, self.variant.id), 7)
@@ -7,4 +7,5 @@ urlpatterns = [
     path('featured/', views.FeaturedProductLineView.as_view(), name='featured'),
     path('filter/', views.FilterVariantsView.as_view(), name='filter'),
     path('details/', views.VariantDetailsView.as_view(), name='detail'),
+    path('cache-stats/', views.VariantCacheStatsView.as_view(), name='variant-cache-stats'),
 ]
\ No newline at end of file
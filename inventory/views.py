@@ -1,14 +1,18 @@
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.utils.decorators import method_decorator
-from django.utils.text import slugify
 from django.views.decorators.cache import cache_page
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Category, ProductVariant, FeaturedProductLine
-from user.models import UserProfile
+from .models import Category, ProductVariant
+from . import leaderboard
+from .cache import cached_variants, variant_cache_stats
+from .catalog import (
+    CatalogDocument, catalog_response, featured_document, get_document, overlay_quantities, personalize_featured,
+)
+from .slugs import variant_id_for_slug
+from lib.pagination import PageParams
 
 
 @method_decorator(cache_page(60 * 5), name="dispatch")
@@ -29,43 +33,35 @@ class ProductCategoriesView(APIView):
 
 
 class PopularVariantsView(APIView):
-    """Fetch top-selling product variants."""
+    """Fetch top-selling product variants, optionally within one category."""
     permission_classes = [AllowAny]
 
     def get(self, request):
-        limit = int(request.GET.get("limit", 8))
-        variants = ProductVariant.objects.filter(is_active=True).order_by("-sold_stock")[:limit]
-
-        user = request.user
-        user_profile = UserProfile.objects.filter(user=user).first() if user.is_authenticated else None
-
-        data = []
-        for variant in variants:
-            quantity = 0
-            if user.is_authenticated and user_profile:
-                for item in user_profile.cart_items.filter(is_active=True):
-                    if item.variant_id == str(variant.id):
-                        quantity = item.quantity
-                        break
-
-            data.append(
-                {
-                    "product_id": variant.product_id,
-                    "category_id": variant.category_id,
-                    "price": variant.price,
-                    "file_path": f"http://localhost{variant.file_path.url}",
-                    "filters": variant.filters,
-                    "current_stock": variant.current_stock,
-                    "sold_stock": variant.sold_stock,
-                    "is_active": variant.is_active,
-                    "created_at": variant.created_at,
-                    "updated_at": variant.updated_at,
-                    "extra_data": getattr(variant, "extra_data", None),
-                    "quantity": quantity,
-                }
-            )
-
-        return Response({"top_selling_variants": data}, status=status.HTTP_200_OK)
+        try:
+            limit = int(request.GET.get("limit", 8))
+            category_id = int(request.GET["category_id"]) if request.GET.get("category_id") else None
+        except ValueError:
+            return Response({"error": "Invalid limit or category_id"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
+
+        def build():
+            variant_ids = leaderboard.top_variant_ids(limit, category_id)
+            if not variant_ids:
+                # Leaderboard not built yet (see rebuild_leaderboard); fall back to the table.
+                variants = ProductVariant.objects.filter(is_active=True)
+                if category_id:
+                    variants = variants.filter(category_id=category_id)
+                variant_ids = list(variants.order_by("-sold_stock").values_list("id", flat=True)[:limit])
+            data = cached_variants(variant_ids, {})
+            return CatalogDocument({"top_selling_variants": data}, [variant["id"] for variant in data])
+
+        # Sales move the leaderboard without bumping the catalog version, so keep this one short-lived.
+        document = get_document("popular", {"limit": limit, "category_id": category_id}, build, timeout=60)
+        return catalog_response(
+            request, document,
+            lambda body, overlay: {"top_selling_variants": overlay_quantities(body["top_selling_variants"], overlay)},
+        )
 
 
 class FeaturedProductLineView(APIView):
@@ -74,72 +70,7 @@ class FeaturedProductLineView(APIView):
 
     def get(self, request):
         limit = int(request.GET.get("limit", 10))
-        try:
-            featured_products = FeaturedProductLine.objects.filter(is_active=True)
-
-            if not featured_products.exists():
-                return Response({"featured_products": []}, status=status.HTTP_200_OK)
-
-            primary_products = []
-            secondary_products = []
-
-            user = request.user
-            user_profile = UserProfile.objects.filter(user=user).first() if user.is_authenticated else None
-
-            for product in featured_products:
-                variants = list(
-                    ProductVariant.objects.filter(id__in=product.variants).order_by("-sold_stock")[:limit]
-                )
-
-                variant_data = []
-                for variant in variants:
-                    quantity = 0
-                    if user_profile:
-                        for item in user_profile.cart_items.filter(is_active=True):
-                            if item.variant == variant:
-                                quantity = item.quantity
-                                break
-
-                    variant_data.append(
-                        {
-                            "id": variant.id,
-                            "product_id": variant.product.id,
-                            "category_id": variant.category.id,
-                            "price": variant.price,
-                            "name": variant.name,
-                            "slug": slugify(variant.name),
-                            "file_path": f"http://localhost{variant.file_path.url}",
-                            "filters": variant.filters,
-                            "current_stock": variant.current_stock,
-                            "sold_stock": variant.sold_stock,
-                            "is_active": variant.is_active,
-                            "created_at": variant.created_at,
-                            "updated_at": variant.updated_at,
-                            "quantity": quantity,
-                        }
-                    )
-
-                data = {
-                    "id": product.id,
-                    "title": product.title,
-                    "description": product.description,
-                    "images": list(product.images),
-                    "is_active": product.is_active,
-                    "variants": variant_data,
-                }
-
-                if product.is_primary:
-                    primary_products.append(data)
-                else:
-                    secondary_products.append(data)
-
-            return Response(
-                {"primary_products": primary_products, "secondary_products": secondary_products},
-                status=status.HTTP_200_OK,
-            )
-
-        except ObjectDoesNotExist:
-            return Response({"error": "Featured products not found."}, status=status.HTTP_404_NOT_FOUND)
+        return catalog_response(request, featured_document(limit), personalize_featured)
 
 
 class FilterVariantsView(APIView):
@@ -151,35 +82,45 @@ class FilterVariantsView(APIView):
         product_id = request.GET.get("product_id")
         search_str = request.GET.get("search_str", "").strip()
         featured_prod_id = request.GET.get("featured_prod_id")
-        skip = int(request.GET.get("skip", 0))
-        limit = int(request.GET.get("limit", 8))
 
-        user = request.user
-        user_profile = UserProfile.objects.filter(user=user).first() if user.is_authenticated else None
+        try:
+            page = PageParams.from_request(request, default_limit=8)
+        except ValueError:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         if category_name and product_id:
-            result = ProductVariant.filter_by_category_product(user_profile, category_name, int(product_id), skip, limit)
-            result.update({"category": category_name, "product_id": product_id})
+            params = {"category": category_name, "product_id": product_id}
         elif search_str:
-            result = ProductVariant.filter_by_search_str(user_profile, search_str, skip, limit)
-            result.update({"search_str": search_str})
+            params = {"search_str": search_str}
         elif featured_prod_id:
-            result = ProductVariant.filter_by_featured_prod(user_profile, featured_prod_id, skip, limit)
-            result.update({"featured_prod_id": featured_prod_id})
+            params = {"featured_prod_id": featured_prod_id}
         else:
             return Response(
                 {"error": "No filter parameters provided"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        result["pagination"] = {
-            "total": result["total_count"],
-            "limit": limit,
-            "skip": skip,
-            "has_more": (skip + limit) < result["total_count"],
-        }
+        def build():
+            # Built without cart quantities; catalog_response overlays them per user.
+            if category_name and product_id:
+                result = ProductVariant.filter_by_category_product({}, category_name, int(product_id), page)
+            elif search_str:
+                result = ProductVariant.filter_by_search_str({}, search_str, page)
+            else:
+                result = ProductVariant.filter_by_featured_prod({}, featured_prod_id, page)
+            result.update(params)
+            return CatalogDocument(result, [variant["id"] for variant in result["variants"]])
+
+        page_key = {"limit": page.limit, "skip": page.skip, "cursor": page.cursor, "total": page.include_total}
+        try:
+            document = get_document("filter", {**params, **page_key}, build)
+        except ValueError:
+            return Response({"error": "Invalid filter or cursor parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(result, status=status.HTTP_200_OK)
+        return catalog_response(
+            request, document,
+            lambda body, overlay: {**body, "variants": overlay_quantities(body["variants"], overlay)},
+        )
 
 
 class VariantDetailsView(APIView):
@@ -191,39 +132,29 @@ class VariantDetailsView(APIView):
         if not variant_slug:
             return Response({"error": "Variant slug is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = request.user
-        user_profile = UserProfile.objects.filter(user=user).first() if user.is_authenticated else None
+        def build():
+            variant_id = variant_id_for_slug(variant_slug)
+            variants = cached_variants([variant_id], {}) if variant_id else []
 
-        try:
-            variant_name = variant_slug.replace("-", " ")
-            variant = ProductVariant.objects.get(name__iexact=variant_name)
-
-            quantity = 0
-            if user_profile:
-                for item in user_profile.cart_items.filter(is_active=True):
-                    if item.variant.id == variant.id:
-                        quantity = item.quantity
-                        break
-
-            variant_data = {
-                "id": variant.id,
-                "product_id": variant.product.id,
-                "category_id": variant.category.id,
-                "name": variant.name,
-                "price": variant.price,
-                "file_path": f"http://localhost{variant.file_path.url}",
-                "filters": variant.filters,
-                "current_stock": variant.current_stock,
-                "sold_stock": variant.sold_stock,
-                "is_active": variant.is_active,
-                "created_at": variant.created_at.isoformat(),
-                "updated_at": variant.updated_at.isoformat(),
-                "quantity": quantity,
-            }
-            return Response(variant_data, status=status.HTTP_200_OK)
-
-        except ProductVariant.DoesNotExist:
+            if variant_id and (not variants or variants[0]["slug"] != variant_slug):
+                # Another process renamed or deleted the variant; our map entry is stale.
+                variant_id = variant_id_for_slug(variant_slug, refresh=True)
+                variants = cached_variants([variant_id], {}) if variant_id else []
+
+            return CatalogDocument(variants[0], [variants[0]["id"]]) if variants else None
+
+        document = get_document("variant", {"slug": variant_slug}, build)
+        if document is None:
             return Response({"error": "Product variant not found"}, status=status.HTTP_404_NOT_FOUND)
+        return catalog_response(
+            request, document,
+            lambda body, overlay: overlay_quantities([body], overlay)[0],
+        )
+
 
-        except ValidationError:
-            return Response({"error": "Invalid ID format"}, status=status.HTTP_400_BAD_REQUEST)
+class VariantCacheStatsView(APIView):
+    """Expose hit/miss counters of the variant payload cache."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(variant_cache_stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,114 @@
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+TRUTHY = ("1", "true", "yes")
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder truncates datetimes to milliseconds, which breaks keyset equality."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """Decode an opaque cursor into its sort-key values, raising ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_filter(ordering, values):
+    """Build the Q that selects rows strictly after `values` in `ordering`."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class PageParams:
+    """Pagination parameters: either skip/limit slicing or an opaque keyset cursor."""
+
+    def __init__(self, limit, skip=0, cursor=None, include_total=None, skip_param="skip"):
+        self.limit = limit
+        self.skip = skip
+        self.cursor = cursor
+        self.skip_param = skip_param
+        # Counting is what makes deep pages slow, so cursor mode only counts on request.
+        self.include_total = (cursor is None) if include_total is None else include_total
+
+    @classmethod
+    def from_request(cls, request, default_limit, skip_param="skip"):
+        """Parse limit, skip (or offset), cursor and include_total; raises ValueError on bad input."""
+        include_total = request.GET.get("include_total")
+        if include_total is not None:
+            include_total = include_total.lower() in TRUTHY
+        limit = int(request.GET.get("limit", default_limit))
+        skip = int(request.GET.get(skip_param, 0))
+        if limit < 1 or skip < 0:
+            raise ValueError(f"limit must be at least 1 and {skip_param} at least 0")
+        return cls(
+            limit=limit,
+            skip=skip,
+            cursor=request.GET.get("cursor"),
+            include_total=include_total,
+            skip_param=skip_param,
+        )
+
+    @property
+    def is_cursor(self):
+        return self.cursor is not None
+
+    def paginate(self, queryset, ordering):
+        """Return (objects, pagination) for one page of queryset sorted by ordering."""
+        queryset = queryset.order_by(*ordering)
+        total = queryset.count() if self.include_total else None
+
+        if self.is_cursor:
+            page = queryset
+            if self.cursor:
+                page = page.filter(keyset_filter(ordering, decode_cursor(self.cursor, len(ordering))))
+            objs = list(page[: self.limit + 1])
+        else:
+            objs = list(queryset[self.skip : self.skip + self.limit + 1])
+
+        has_more = len(objs) > self.limit
+        objs = objs[: self.limit]
+        return objs, self.pagination(objs, ordering, has_more, total)
+
+    def pagination(self, objs, ordering, has_more, total=None):
+        data = {"limit": self.limit, "has_more": has_more}
+        if self.is_cursor:
+            last = objs[-1] if objs and has_more else None
+            data["cursor"] = self.cursor
+            data["next_cursor"] = (
+                encode_cursor([getattr(last, field.lstrip("-")) for field in ordering]) if last else None
+            )
+        else:
+            data[self.skip_param] = self.skip
+        if self.include_total:
+            data["total"] = total or 0
+        return data
+
+    def empty(self):
+        return self.pagination([], [], False, 0)
@@ -0,0 +1,55 @@
+import contextlib
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from cart.engine import forget_cart
+from inventory.models import Category, Product, ProductVariant
+from user.models import UserAddress, UserProfile
+
+
+class FixturesMixin:
+    """Catalog and buyer fixtures for the app tests.
+
+    Redis outlives the test database, and ids are handed out again from one run to the next:
+    catalog rows are created with their cache invalidations run, so no payload cached under
+    a reused id is served, and every user starts from an empty cart.
+    """
+
+    def committed(self):
+        """Run the on_commit callbacks of the block; outside a TestCase they run as it commits."""
+        if isinstance(self, TestCase):
+            return self.captureOnCommitCallbacks(execute=True)
+        return contextlib.nullcontext()
+
+    def make_catalog(self, category_name, product_name):
+        with self.committed():
+            self.category = Category.objects.create(name=category_name)
+            self.product = Product.objects.create(name=product_name, description=product_name)
+
+    def make_variant(self, name, **fields):
+        fields = {
+            "product": self.product, "category": self.category, "price": 100,
+            "file_path": "variants/variant1.jpg", "filters": {"Size": "M"}, **fields,
+        }
+        with self.committed():
+            return ProductVariant.objects.create(name=name, **fields)
+
+    def make_user(self, username):
+        user = User.objects.create(username=username)
+        forget_cart(user.id)
+        self.addCleanup(forget_cart, user.id)
+        return user
+
+    def make_buyer(self, phone):
+        """A user with a profile and a shipping address; returns (user, address)."""
+        user = self.make_user(phone)
+        address = UserAddress.objects.create(
+            profile=UserProfile.objects.create(user=user), address_type="Home", poc_name="Test",
+            phone=phone, line_1="Test street", city="Jaipur", state="Rajasthan", pin=302001,
+        )
+        return user, address
+
+
+class FixturesTestCase(FixturesMixin, TestCase):
+    pass
@@ -0,0 +1,203 @@
+import datetime
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from .models import IdempotencyKey, Order, SoldProduct
+from .rollups import hold_sales_fence, unroll_sales
+from .summaries import refresh_order_summaries
+from cart.engine import apply_changes, flush_carts, load_prices
+from cart.models import CartItem
+from cart.views import GST_PERC
+from inventory import leaderboard
+from inventory.cache import bump_catalog_version, invalidate_variant_payloads
+from inventory.models import ProductVariant
+from lib.common import calculate_shipping
+
+logger = logging.getLogger(__name__)
+
+RELEASE_BATCH = 200
+# How far behind the hold release_unpaid_orders looks, so it prunes the older partitions;
+# an order missed by one run is still in reach of the next ones.
+RELEASE_LOOKBACK = datetime.timedelta(days=7)
+
+
+class CheckoutError(Exception):
+    """The cart cannot be turned into an order."""
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, variant_ids):
+        super().__init__("Not enough stock")
+        self.variant_ids = variant_ids
+
+
+def place_order(user, shipping_address, idempotency_key=None, request_hash=""):
+    """Turn the user's active cart into a Processing order, atomically, and return it.
+
+    Cart lines and their variants are locked in two statements (variants in id order, so
+    concurrent checkouts cannot deadlock), stock is checked and moved from current_stock to
+    sold_stock, SoldProduct rows are bulk-inserted and the cart lines deactivated in one update.
+    An idempotency_key is recorded against the order in the same transaction; if the user
+    already used it, IntegrityError is raised and nothing is written.
+    """
+    # The cart lives in Redis; persist pending changes before reading CartItem rows.
+    flush_carts([user.id], raise_errors=True)
+
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.select_for_update()
+            .filter(user=user, is_active=True)
+            .values_list("id", "variant_id", "quantity")
+        )
+        if not lines:
+            raise CheckoutError("Cart is empty")
+        quantities = {variant_id: quantity for _, variant_id, quantity in lines}
+
+        variants = list(
+            ProductVariant.objects.select_for_update()
+            .filter(id__in=quantities, is_active=True)
+            .order_by("id")
+            .only("id", "category_id", "name", "slug", "file_path", "price", "current_stock", "sold_stock")
+        )
+        if len(variants) != len(quantities):
+            raise CheckoutError("Some products in the cart are no longer available")
+        short = [variant.id for variant in variants if variant.current_stock < quantities[variant.id]]
+        if short:
+            raise OutOfStockError(short)
+
+        hold_sales_fence()
+        cost = sum(variant.price * quantities[variant.id] for variant in variants)
+        gst = round(GST_PERC * cost)
+        shipping = calculate_shipping(user)
+        order = Order.objects.create(
+            user=user,
+            cost=cost,
+            gst=gst,
+            shipping=shipping,
+            shipping_address=shipping_address,
+            status="Processing",
+        )
+        if idempotency_key:
+            IdempotencyKey.objects.create(user=user, key=idempotency_key, request_hash=request_hash, order=order)
+
+        sold_products = []
+        for variant in variants:
+            sold_product = SoldProduct(
+                order=order,
+                variant_id=variant.id,
+                individual_cost=variant.price,
+                total_cost=variant.price * quantities[variant.id],
+                quantity=quantities[variant.id],
+                created_at=order.created_at,
+            )
+            sold_product.copy_variant(variant)
+            sold_products.append(sold_product)
+        bulk_create_with_history(sold_products, SoldProduct)
+
+        for variant in variants:
+            variant.current_stock -= quantities[variant.id]
+            variant.sold_stock += quantities[variant.id]
+        ProductVariant.objects.bulk_update(variants, ["current_stock", "sold_stock"])
+
+        CartItem.objects.filter(id__in=[line_id for line_id, _, _ in lines]).update(
+            is_active=False, updated_at=timezone.now()
+        )
+
+        # The bulk writes skip post_save, so do what the signals would have done.
+        sales = [(variant.id, variant.category_id, quantities[variant.id]) for variant in variants]
+        after_commit(invalidate_variant_payloads, list(quantities))
+        after_commit(bump_catalog_version)
+        after_commit(leaderboard.record_sales, sales)
+        after_commit(clear_purchased_lines, user.id, quantities)
+
+    return order
+
+
+def after_commit(func, *args):
+    """Run func(*args) once the transaction commits, logging rather than raising a failure.
+
+    The order is committed by then; a Redis hiccup must not turn it into an error response.
+    """
+    def run():
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("%s failed after checkout", func.__name__)
+
+    transaction.on_commit(run)
+
+
+def release_unpaid_orders(now=None, batch_size=RELEASE_BATCH):
+    """Cancel the orders left unpaid for ORDER_UNPAID_HOLD seconds and put their stock back; returns how many.
+
+    Placing an order takes its stock out of current_stock at once; an order never paid for
+    would hold it for good. The hold outlasts PAYMENT_RECONCILE_MAX_AGE, so reconciliation
+    has had every chance to find a payment first. Orders are locked with SKIP LOCKED, so one
+    a webhook is marking paid is left for the next run, and variants in id order, as
+    place_order does. Payments that come after are refused (see Order.awaiting_payment).
+    Their lines are taken out of the sales rollups as well.
+    """
+    cutoff = (now or timezone.now()) - datetime.timedelta(seconds=settings.ORDER_UNPAID_HOLD)
+    unpaid = Order.objects.filter(
+        is_paid=False,
+        is_active=True,
+        status="Processing",
+        created_at__gte=cutoff - RELEASE_LOOKBACK,
+        created_at__lt=cutoff,
+    )
+    released = 0
+    while True:
+        with transaction.atomic():
+            orders = list(unpaid.select_for_update(skip_locked=True).order_by("created_at", "id")[:batch_size])
+            if not orders:
+                return released
+            # Before the variants are locked: a rollup batch holding the watermark waits on
+            # checkouts, and those on the variants.
+            unroll_sales(orders)
+            quantities = Counter()
+            for variant_id, quantity in SoldProduct.objects.filter(
+                order_id__in=[order.id for order in orders],
+                created_at__gte=orders[0].created_at,
+                created_at__lte=orders[-1].created_at,
+            ).values_list("variant_id", "quantity"):
+                quantities[variant_id] += quantity
+
+            variants = list(
+                ProductVariant.objects.select_for_update()
+                .filter(id__in=quantities)
+                .order_by("id")
+                .only("id", "category_id", "current_stock", "sold_stock")
+            )
+            for variant in variants:
+                variant.current_stock += quantities[variant.id]
+                variant.sold_stock -= quantities[variant.id]
+            ProductVariant.objects.bulk_update(variants, ["current_stock", "sold_stock"])
+
+            for order in orders:
+                order.status = "Cancelled"
+                order.is_active = False
+                order.updated_at = timezone.now()
+            bulk_update_with_history(orders, Order, ["status", "is_active", "updated_at"])
+
+            order_ids = [order.id for order in orders]
+            unsold = [(variant.id, variant.category_id, -quantities[variant.id]) for variant in variants]
+            after_commit(refresh_order_summaries, order_ids)
+            after_commit(invalidate_variant_payloads, list(quantities))
+            after_commit(bump_catalog_version)
+            after_commit(leaderboard.record_sales, unsold)
+        released += len(orders)
+        if len(orders) < batch_size:
+            return released
+
+
+def clear_purchased_lines(user_id, quantities):
+    """Take the bought quantities out of the Redis cart, keeping anything added during checkout."""
+    price_version, payloads = load_prices(list(quantities))
+    changes = [(variant_id, "remove", quantity) for variant_id, quantity in quantities.items() if variant_id in payloads]
+    if changes:
+        apply_changes(user_id, changes, price_version, payloads)
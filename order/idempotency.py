@@ -0,0 +1,37 @@
+import contextlib
+import hashlib
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(data):
+    """Fingerprint of a request body, so a key reused for a different request can be refused."""
+    encoded = "&".join(f"{name}={value}" for name, value in sorted(data.items()))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def idempotency_lock(user_id, key):
+    """Let one request at a time work under the user's key.
+
+    Yields False when another request held it for longer than IDEMPOTENCY_WAIT_TIMEOUT.
+    """
+    lock = get_redis_connection("default").lock(
+        f"idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}",
+        timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT,
+        blocking_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT,
+    )
+    acquired = lock.acquire()
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                # Held past IDEMPOTENCY_LOCK_TIMEOUT; the unique key row still guards the order.
+                pass
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+import time
+
+from cart.models import CartItem
+from cart.views import GST_PERC
+from inventory.models import ProductVariant
+from lib.common import calculate_shipping
+from order.checkout import place_order
+from order.models import Order, SoldProduct
+from user.models import UserAddress, UserProfile
+
+
+def legacy_checkout(user, shipping_address):
+    """The per-line order creation CreateOrderView used before place_order."""
+    cart_items = list(CartItem.objects.filter(user=user, is_active=True).select_related("variant"))
+    total_cost = sum(item.variant.price * item.quantity for item in cart_items)
+    order = Order.objects.create(
+        user=user,
+        cost=total_cost,
+        gst=total_cost * GST_PERC,
+        shipping=calculate_shipping(user),
+        shipping_address=shipping_address,
+        status="Processing",
+    )
+    for item in cart_items:
+        product = ProductVariant.objects.filter(id=item.variant.id).first()
+        SoldProduct.objects.create(
+            variant=item.variant,
+            individual_cost=product.price,
+            total_cost=product.price * item.quantity,
+            quantity=item.quantity,
+            order=order,
+        )
+        item.is_active = False
+        item.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = "Compares queries and latency of the legacy per-line checkout and place_order for a large cart"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=50)
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        variant_ids = list(ProductVariant.objects.filter(is_active=True).values_list("id", flat=True)[: options["lines"]])
+        if len(variant_ids) < options["lines"]:
+            raise CommandError(f"Need {options['lines']} active variants, run populate_test_data first")
+
+        # Everything happens in one transaction that is rolled back; each run in its own savepoint.
+        with transaction.atomic():
+            user = User.objects.create(username="checkout-benchmark")
+            profile = UserProfile.objects.create(user=user)
+            address = UserAddress.objects.create(
+                profile=profile, address_type="Home", poc_name="Benchmark", phone="0000000000",
+                line_1="Benchmark street", city="Jaipur", state="Rajasthan", pin=302001,
+            )
+            ProductVariant.objects.filter(id__in=variant_ids).update(current_stock=1000000)
+            CartItem.objects.bulk_create(
+                [CartItem(user=user, variant_id=variant_id, quantity=2) for variant_id in variant_ids]
+            )
+
+            for name, checkout in [("legacy", legacy_checkout), ("place_order", place_order)]:
+                timings, queries = [], 0
+                for _ in range(options["runs"]):
+                    savepoint = transaction.savepoint()
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as captured:
+                        checkout(user, address)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    queries = len(captured)
+                    transaction.savepoint_rollback(savepoint)
+                self.stdout.write(
+                    f"{name}: {queries} queries, {sum(timings) / len(timings):.1f} ms per {options['lines']}-line checkout"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,88 @@
+import datetime
+import statistics
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from order.models import Order
+from order.partitions import add_months, create_partitions, list_partitions, month_start
+
+# Orders spread evenly from start over span, round-robin across users.
+INSERT_ORDERS_SQL = """
+INSERT INTO {table} (user_id, cost, gst, shipping, status, is_active, is_paid, created_at, updated_at)
+SELECT users[1 + mod(g, cardinality(users))], 1000, 180, 200, %(status)s, true, true, at, at
+FROM generate_series(1, %(rows)s) AS g,
+    LATERAL (SELECT %(users)s::bigint[] AS users) AS u,
+    LATERAL (SELECT %(start)s::timestamptz + %(span)s::interval * (g / %(rows)s::float8) AS at) AS t
+"""
+
+QUERIES = {
+    "user's recent orders": (
+        "SELECT id, cost, status, created_at FROM {table} "
+        "WHERE user_id = %(user_id)s AND created_at >= %(since)s ORDER BY created_at DESC LIMIT 10"
+    ),
+    "orders placed recently": "SELECT count(*) FROM {table} WHERE created_at >= %(since)s",
+}
+
+
+def scanned_relations(plan):
+    relations = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        relations |= scanned_relations(child)
+    return relations
+
+
+class Command(BaseCommand):
+    help = "Benchmarks recent-order queries on the partitioned Order table against the same rows unpartitioned"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000, help="Historical orders to insert")
+        parser.add_argument("--months", type=int, default=36, help="How far back the historical orders go")
+        parser.add_argument("--recent-days", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by("id").values_list("id", flat=True)[:1000])
+        if not user_ids:
+            raise CommandError("No users, run populate_test_data first")
+
+        table = Order._meta.db_table
+        now = timezone.now()
+        since = now - datetime.timedelta(days=options["recent_days"])
+        oldest = add_months(month_start(now), -options["months"])
+        params = {"user_id": user_ids[0], "since": since}
+
+        # Everything runs in one transaction that is rolled back.
+        with transaction.atomic(), connection.cursor() as cursor:
+            create_partitions(oldest, month_start(now))
+            self.stdout.write(f"inserting {options['rows']} historical orders since {oldest:%Y-%m}...")
+            cursor.execute(
+                INSERT_ORDERS_SQL.format(table=table),
+                {"rows": options["rows"], "users": user_ids, "start": oldest, "span": since - oldest, "status": "Delivered"},
+            )
+            cursor.execute(
+                INSERT_ORDERS_SQL.format(table=table),
+                {"rows": 20, "users": user_ids[:1], "start": since, "span": now - since, "status": "Processing"},
+            )
+            # The same rows, with the indexes the table had before it was partitioned.
+            cursor.execute(f"CREATE TEMPORARY TABLE order_unpartitioned ON COMMIT DROP AS SELECT * FROM {table}")
+            cursor.execute("CREATE INDEX ON order_unpartitioned (user_id)")
+            cursor.execute(f"ANALYZE {table}")
+            cursor.execute("ANALYZE order_unpartitioned")
+            self.stdout.write(f"{table} has {len(list_partitions(cursor, table))} partitions")
+
+            for name, sql in QUERIES.items():
+                for label, target in [("partitioned", table), ("unpartitioned", "order_unpartitioned")]:
+                    timings, relations = [], set()
+                    for _ in range(options["repeat"]):
+                        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql.format(table=target), params)
+                        explained = cursor.fetchone()[0][0]
+                        timings.append(explained["Execution Time"])
+                        relations = scanned_relations(explained["Plan"])
+                    self.stdout.write(
+                        f"{name:<24} {label:<14} median {statistics.median(timings):8.2f} ms, "
+                        f"{len(relations)} relation(s) scanned"
+                    )
+            transaction.set_rollback(True)
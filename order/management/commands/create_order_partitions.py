@@ -0,0 +1,30 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from order.partitions import add_months, create_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = "Creates the monthly Order and SoldProduct partitions for the coming months"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=settings.ORDER_PARTITIONS_AHEAD)
+        parser.add_argument(
+            "--from", dest="first_month", help="YYYY-MM to start from, for rows stuck in the DEFAULT partition"
+        )
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.now())
+        first_month = this_month
+        if options["first_month"]:
+            try:
+                first_month = month_start(datetime.datetime.strptime(options["first_month"], "%Y-%m"))
+            except ValueError:
+                raise CommandError("--from must be a month like 2025-01")
+        created = create_partitions(first_month, add_months(this_month, options["months_ahead"]))
+        for partition in created:
+            self.stdout.write(f"created {partition}")
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions"))
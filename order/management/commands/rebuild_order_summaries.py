@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from order.summaries import REFRESH_BATCH, rebuild_order_summaries
+
+
+class Command(BaseCommand):
+    help = "Backfills the OrderSummary read model by rebuilding the summary of every order"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REFRESH_BATCH)
+
+    def handle(self, *args, **options):
+        written = rebuild_order_summaries(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} order summaries"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from order.rollups import reset_sales_rollups, roll_up_sales
+
+
+class Command(BaseCommand):
+    help = "Rolls the SoldProduct rows written since the last run up into the daily sales tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Empty the rollups and roll up every sale again")
+        parser.add_argument("--lag", type=int, default=None, help="Seconds a sale must be old before it is rolled up")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            reset_sales_rollups()
+        rolled_up = roll_up_sales(lag_seconds=options["lag"])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rolled_up} sold products"))
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+
+from cart.engine import forget_cart
+from cart.models import CartItem
+from inventory.models import Category, Product, ProductVariant
+from order.checkout import OutOfStockError, place_order
+from order.models import SoldProduct
+from user.models import UserAddress, UserProfile
+
+
+STRESS_PREFIX = "checkout_stress_"
+
+
+class Command(BaseCommand):
+    help = "Races many checkouts for the same scarce variants and checks that stock never goes negative"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--stock", type=int, default=20)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--keep", action="store_true", help="Keep the stress rows afterwards")
+
+    def handle(self, *args, **options):
+        category, _ = Category.objects.get_or_create(name="Checkout Stress")
+        product, _ = Product.objects.get_or_create(
+            name=f"{STRESS_PREFIX}product", defaults={"description": "Checkout stress product"}
+        )
+        # Two variants in every cart, so concurrent checkouts contend on more than one lock.
+        variants = []
+        for suffix in ["a", "b"]:
+            variant, _ = ProductVariant.objects.update_or_create(
+                name=f"{STRESS_PREFIX}{suffix}",
+                defaults={
+                    "product": product,
+                    "category": category,
+                    "price": 499,
+                    "file_path": "variants/variant1.jpg",
+                    "filters": {"Size": suffix.upper()},
+                    "current_stock": options["stock"],
+                    "sold_stock": 0,
+                },
+            )
+            variants.append(variant)
+
+        buyers = []
+        for i in range(options["users"]):
+            user, _ = User.objects.get_or_create(username=f"{STRESS_PREFIX}{i}")
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            address, _ = UserAddress.objects.get_or_create(
+                profile=profile, phone=f"{i:010d}",
+                defaults={"address_type": "Home", "poc_name": "Stress", "line_1": "Stress street",
+                          "city": "Jaipur", "state": "Rajasthan", "pin": 302001},
+            )
+            forget_cart(user.id)
+            CartItem.objects.filter(user=user).delete()
+            CartItem.objects.bulk_create([CartItem(user=user, variant=variant, quantity=1) for variant in variants])
+            buyers.append((user, address))
+
+        def checkout(buyer):
+            try:
+                place_order(*buyer)
+                return True
+            except OutOfStockError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            placed = sum(pool.map(checkout, buyers))
+
+        failures = []
+        expected = min(options["users"], options["stock"])
+        if placed != expected:
+            failures.append(f"{placed} orders placed, expected {expected}")
+        for variant in ProductVariant.objects.filter(id__in=[variant.id for variant in variants]):
+            sold = SoldProduct.objects.filter(variant=variant).aggregate(total=Sum("quantity"))["total"] or 0
+            if variant.current_stock < 0:
+                failures.append(f"{variant.name}: current_stock went negative ({variant.current_stock})")
+            if variant.current_stock + variant.sold_stock != options["stock"] or variant.sold_stock != sold:
+                failures.append(
+                    f"{variant.name}: current {variant.current_stock}, sold {variant.sold_stock}, "
+                    f"sold rows {sold}, initial {options['stock']}"
+                )
+
+        if not options["keep"]:
+            for user, _ in buyers:
+                forget_cart(user.id)
+            User.objects.filter(username__startswith=STRESS_PREFIX).delete()
+            ProductVariant.objects.filter(name__startswith=STRESS_PREFIX).delete()
+            product.delete()
+            category.delete()
+
+        self.stdout.write(f"{placed} of {options['users']} concurrent checkouts succeeded for stock {options['stock']}")
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Stock stayed consistent under concurrent checkouts"))
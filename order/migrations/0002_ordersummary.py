@@ -0,0 +1,33 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSummary',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='order.order')),
+                ('rzp_order_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('status', models.CharField(max_length=50)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('document', models.JSONField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ordersummary',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-created_at', 'order'], name='order_summary_history_idx'),
+        ),
+    ]
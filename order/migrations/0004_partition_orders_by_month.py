@@ -0,0 +1,130 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# Self-contained on purpose: order/partitions.py works on the live models, which may have
+# moved on by the time this migration runs.
+PARTITIONS_AHEAD = 3
+
+# (table, indexes, foreign keys) as Django named them on the unpartitioned tables.
+TABLES = [
+    (
+        "order_order",
+        [
+            ("order_order_shipping_address_id_57e64931", "shipping_address_id"),
+            ("order_order_user_id_7cf9bc2b", "user_id"),
+        ],
+        [
+            ("order_order_shipping_address_id_57e64931_fk_user_useraddress_id", "shipping_address_id", "user_useraddress"),
+            ("order_order_user_id_7cf9bc2b_fk_auth_user_id", "user_id", "auth_user"),
+        ],
+    ),
+    (
+        "order_soldproduct",
+        [
+            ("order_soldproduct_order_id_3c306828", "order_id"),
+            ("order_soldproduct_variant_id_0db277c5", "variant_id"),
+        ],
+        [
+            ("order_soldproduct_variant_id_0db277c5_fk_inventory", "variant_id", "inventory_productvariant"),
+        ],
+    ),
+]
+
+BACKFILL_CREATED_AT_SQL = """
+UPDATE {table} AS line SET created_at = o.created_at
+FROM order_order AS o WHERE o.id = line.order_id
+"""
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def rebuild_table(cursor, table, indexes, foreign_keys, partitioned):
+    """Recreate table with its rows, indexes and constraints, either partitioned by month or plain."""
+    new_table = f"{table}_new"
+    if partitioned:
+        cursor.execute(f"SELECT min(created_at) FROM {table}")
+        now = django.utils.timezone.now()
+        month = (cursor.fetchone()[0] or now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last = add_months(now.replace(day=1, hour=0, minute=0, second=0, microsecond=0), PARTITIONS_AHEAD)
+        cursor.execute(f"CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {new_table} FOR VALUES FROM (%s) TO (%s)",
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+        primary_key = "(id, created_at)"
+    else:
+        cursor.execute(f"CREATE TABLE {new_table} (LIKE {table} INCLUDING DEFAULTS)")
+        primary_key = "(id)"
+
+    cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {table}")
+    # The id sequence would go down with the old table.
+    cursor.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+    cursor.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY {primary_key}")
+    for name, column in indexes:
+        cursor.execute(f"CREATE INDEX {name} ON {table} ({column})")
+    for name, column, target in foreign_keys:
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+            f"REFERENCES {target} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+
+
+def partition_tables(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table in ["order_soldproduct", "order_historicalsoldproduct"]:
+            cursor.execute(BACKFILL_CREATED_AT_SQL.format(table=table))
+        for table, indexes, foreign_keys in TABLES:
+            rebuild_table(cursor, table, indexes, foreign_keys, partitioned=True)
+
+
+def unpartition_tables(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, indexes, foreign_keys in TABLES:
+            rebuild_table(cursor, table, indexes, foreign_keys, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsoldproduct',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='soldproduct',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='idempotencykey',
+            name='order',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_key', to='order.order'),
+        ),
+        migrations.AlterField(
+            model_name='ordersummary',
+            name='order',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='order.order'),
+        ),
+        migrations.AlterField(
+            model_name='soldproduct',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='order.order'),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
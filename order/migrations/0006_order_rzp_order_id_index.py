@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='historicalorder',
+            name='rzp_order_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='rzp_order_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_order_rzp_order_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalsoldproduct',
+            name='file_path',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='historicalsoldproduct',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='historicalsoldproduct',
+            name='slug',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+        migrations.AddField(
+            model_name='soldproduct',
+            name='file_path',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='soldproduct',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='soldproduct',
+            name='slug',
+            field=models.CharField(blank=True, default='', max_length=120),
+        ),
+    ]
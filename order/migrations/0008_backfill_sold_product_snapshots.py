@@ -0,0 +1,66 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:45
+
+from django.db import migrations
+
+BATCH = 500
+
+# The best snapshot older lines can get: their variant as it is now.
+BACKFILL_SNAPSHOTS_SQL = """
+UPDATE order_soldproduct AS line
+SET product_name = variant.name, slug = variant.slug, file_path = variant.file_path
+FROM inventory_productvariant AS variant
+WHERE variant.id = line.variant_id AND line.product_name = ''
+"""
+
+
+def backfill_snapshots(apps, schema_editor):
+    schema_editor.execute(BACKFILL_SNAPSHOTS_SQL)
+
+
+# Rewrites the lines of every existing summary from the snapshots, bringing back lines that
+# were dropped for lack of a cached variant. Images are stored by storage name, as new
+# summaries are, and turned into URLs when read. Only historical models are used, so the
+# result does not depend on the code or settings of the day it runs. Summaries of archived
+# orders, whose lines are gone from the live tables, are left as they are.
+def rebuild_summary_lines(apps, schema_editor):
+    OrderSummary = apps.get_model('order', 'OrderSummary')
+    SoldProduct = apps.get_model('order', 'SoldProduct')
+
+    last_id = 0
+    while True:
+        summaries = list(OrderSummary.objects.filter(order_id__gt=last_id).order_by('order_id')[:BATCH])
+        if not summaries:
+            return
+        last_id = summaries[-1].order_id
+
+        lines = {}
+        for line in SoldProduct.objects.filter(order_id__in=[summary.order_id for summary in summaries]).order_by('id'):
+            lines.setdefault(line.order_id, []).append({
+                'variant_id': line.variant_id,
+                'individual_cost': line.individual_cost,
+                'total_cost': line.total_cost,
+                'quantity': line.quantity,
+                'product_name': line.product_name,
+                'file_path': line.file_path,
+                'slug': line.slug,
+            })
+        summaries = [summary for summary in summaries if summary.order_id in lines]
+        for summary in summaries:
+            sold_products = lines[summary.order_id]
+            summary.document['sold_products'] = sold_products
+            summary.document['line_count'] = len(sold_products)
+            summary.document['total_quantity'] = sum(line['quantity'] for line in sold_products)
+        OrderSummary.objects.bulk_update(summaries, ['document'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_productvariant_slug'),
+        ('order', '0007_sold_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_summary_lines, migrations.RunPython.noop),
+    ]
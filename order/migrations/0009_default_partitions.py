@@ -0,0 +1,20 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:50
+
+from django.db import migrations
+
+TABLES = ["order_order", "order_soldproduct"]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0008_backfill_sold_product_snapshots'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT",
+            f"DROP TABLE {table}_default",
+        )
+        for table in TABLES
+    ]
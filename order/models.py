@@ -1,13 +1,20 @@
 from django.db import models
+from django.utils import timezone
 import datetime
 from user.models import UserAddress
 from lib.base_classes import BaseModel
-from inventory.models import ProductVariant
+from inventory.models import Category, ProductVariant
 from django.contrib.auth.models import User
 
 
 class Order(BaseModel):
-    rzp_order_id = models.CharField(max_length=100, blank=True, null=True)
+    """Range-partitioned by month on created_at (see order/partitions.py).
+
+    Postgres keys the table on (id, created_at), so rows pointing at an order carry no foreign key constraint.
+    Django groups an .annotate() aggregate by the primary key alone, which Postgres rejects for this table:
+    aggregate with .values() first, or in Python. SoldProduct is partitioned the same way.
+    """
+    rzp_order_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     rzp_payment_id = models.CharField(max_length=100, blank=True, null=True)
     rzp_callback_order_id = models.CharField(max_length=100, blank=True, null=True)
     rzp_signature = models.CharField(max_length=255, blank=True, null=True)
@@ -22,10 +29,111 @@ class Order(BaseModel):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @property
+    def amount_paise(self):
+        """What the gateway charges for this order, in paise."""
+        return (self.cost + self.gst + self.shipping) * 100
+
+    @property
+    def awaiting_payment(self):
+        """Whether a payment may still be applied; release_unpaid_orders has put the stock of a cancelled order back."""
+        return self.is_active and self.status == "Processing" and not self.is_paid
+
 
 class SoldProduct(BaseModel):
     variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="sold_items")
     individual_cost = models.IntegerField()
     total_cost = models.IntegerField()
     quantity = models.IntegerField()
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, db_constraint=False)
+    # The order's created_at, so an order and its lines land in the same monthly partition.
+    created_at = models.DateTimeField(default=timezone.now)
+    # The variant as it was sold, so the order history does not change with the catalog.
+    product_name = models.CharField(max_length=100, blank=True, default="")
+    slug = models.CharField(max_length=120, blank=True, default="")
+    file_path = models.CharField(max_length=100, blank=True, default="")
+
+    def copy_variant(self, variant):
+        """Take the snapshot of variant this line keeps; bulk inserts must call it themselves."""
+        self.product_name = variant.name
+        self.slug = variant.slug
+        self.file_path = variant.file_path.name
+
+    def save(self, *args, **kwargs):
+        if not self.product_name:
+            self.copy_variant(self.variant)
+        super().save(*args, **kwargs)
+
+
+class OrderSummary(models.Model):
+    """Read model of an order: what the order endpoints return, frozen into one JSON document.
+
+    Kept up to date by order.summaries.refresh_order_summaries whenever the order or its lines change.
+    """
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, primary_key=True, related_name="summary", db_constraint=False
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="order_summaries")
+    rzp_order_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    status = models.CharField(max_length=50)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    document = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "order"],
+                condition=models.Q(is_active=True),
+                name="order_summary_history_idx",
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """An Idempotency-Key sent to create-order, tied to the order its first request placed."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name="idempotency_key", db_constraint=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key_per_user"),
+        ]
+
+
+class DailyVariantSales(models.Model):
+    """Units sold and revenue of a variant on a day, rolled up from SoldProduct by order.rollups."""
+    day = models.DateField()
+    variant = models.ForeignKey(ProductVariant, on_delete=models.CASCADE, related_name="daily_sales")
+    units = models.BigIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "variant"], name="unique_daily_variant_sales"),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    """Units sold and revenue of a category on a day, rolled up from SoldProduct by order.rollups."""
+    day = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="daily_sales")
+    units = models.BigIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category"], name="unique_daily_category_sales"),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has read its source table: the last row id and its created_at."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
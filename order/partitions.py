@@ -0,0 +1,134 @@
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey, Order, SoldProduct
+
+# Both are range-partitioned by month on created_at, partitions named <table>_pYYYY_MM. Rows
+# outside every month land in the DEFAULT partition, <table>_default, rather than failing the
+# write; check_default_partitions reports them.
+PARTITIONED_MODELS = [Order, SoldProduct]
+
+CREATE_PARTITION_SQL = "CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)"
+DETACH_PARTITION_SQL = "ALTER TABLE {table} DETACH PARTITION {partition}"
+# A month the DEFAULT partition holds rows of is built aside, filled from it and then attached.
+CREATE_DETACHED_PARTITION_SQL = "CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)"
+MOVE_DEFAULT_ROWS_SQL = """
+WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *)
+INSERT INTO {partition} SELECT * FROM moved
+"""
+ATTACH_PARTITION_SQL = "ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)"
+DEFAULT_ROWS_IN_RANGE_SQL = "SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s)"
+DEFAULT_ROWS_SQL = "SELECT count(*), min(created_at), max(created_at) FROM {default}"
+LIST_PARTITIONS_SQL = """
+SELECT child.relname
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = %s
+"""
+
+
+def month_start(moment):
+    return datetime.datetime(moment.year, moment.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def partition_month(table, partition):
+    """The month a partition of table holds, or None for a table not named like one."""
+    try:
+        return datetime.datetime.strptime(partition[len(table) + 2:], "%Y_%m").replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def list_partitions(cursor, table):
+    cursor.execute(LIST_PARTITIONS_SQL, [table])
+    return [partition for partition, in cursor.fetchall()]
+
+
+def create_partitions(first_month, last_month):
+    """Create the missing monthly partitions of the order tables from first_month to last_month; returns their names."""
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            existing = set(list_partitions(cursor, table))
+            month = month_start(first_month)
+            while month <= last_month:
+                partition = partition_name(table, month)
+                if partition not in existing:
+                    create_partition(cursor, table, partition, month)
+                    created.append(partition)
+                month = add_months(month, 1)
+    return created
+
+
+def create_partition(cursor, table, partition, month):
+    bounds = [month, add_months(month, 1)]
+    default = default_partition_name(table)
+    cursor.execute(DEFAULT_ROWS_IN_RANGE_SQL.format(default=default), bounds)
+    if not cursor.fetchone()[0]:
+        cursor.execute(CREATE_PARTITION_SQL.format(table=table, partition=partition), bounds)
+        return
+    # Postgres refuses a partition for rows the DEFAULT partition still holds; move them over first.
+    cursor.execute(CREATE_DETACHED_PARTITION_SQL.format(table=table, partition=partition))
+    cursor.execute(MOVE_DEFAULT_ROWS_SQL.format(default=default, partition=partition), bounds)
+    cursor.execute(ATTACH_PARTITION_SQL.format(table=table, partition=partition), bounds)
+
+
+def check_default_partitions():
+    """{table: (rows, oldest, newest)} of the order tables whose DEFAULT partition holds rows.
+
+    Empty while every write found its month. Otherwise partitions are missing for those
+    months: create_partitions over them moves the rows where they belong.
+    """
+    stray = {}
+    with connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            cursor.execute(DEFAULT_ROWS_SQL.format(default=default_partition_name(table)))
+            rows, oldest, newest = cursor.fetchone()
+            if rows:
+                stray[table] = (rows, oldest, newest)
+    return stray
+
+
+def create_future_partitions(months_ahead, now=None):
+    """Make sure orders can be written from this month to months_ahead months out."""
+    this_month = month_start(now or timezone.now())
+    return create_partitions(this_month, add_months(this_month, months_ahead))
+
+
+def archive_partitions(retention_months, now=None):
+    """Detach the partitions whose month ended more than retention_months ago; returns their names.
+
+    Detached partitions stay behind as plain tables, to be dumped to cold storage and dropped.
+    Order summaries are kept, so archived orders still show in the order history.
+    """
+    cutoff = add_months(month_start(now or timezone.now()), -retention_months)
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            for partition in sorted(list_partitions(cursor, table)):
+                month = partition_month(table, partition)
+                if month and add_months(month, 1) <= cutoff:
+                    cursor.execute(DETACH_PARTITION_SQL.format(table=table, partition=partition))
+                    detached.append(partition)
+        # Their orders are gone from the live tables; a replay could not be answered.
+        IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return detached
@@ -0,0 +1,167 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyVariantSales, Order, RollupWatermark, SoldProduct
+from inventory.models import ProductVariant
+
+WATERMARK_NAME = "daily_sales"
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Checkouts hold this advisory lock shared while they write SoldProduct rows; a rollup batch
+# takes it exclusively, so it never sees a higher id commit ahead of a lower one in flight.
+SALES_FENCE_LOCK = 7_301_001
+SALES_FENCE_SHARED_SQL = "SELECT pg_advisory_xact_lock_shared(%s)"
+SALES_FENCE_SQL = "SELECT pg_advisory_xact_lock(%s)"
+
+# Takes the next batch of SoldProduct rows past the watermark and adds them to both rollups
+# in one statement; returns the last id and created_at it took, and how many rows. The batch
+# ends before the first row still inside the lag, even when higher ids are older. Lines of
+# orders cancelled unpaid are passed over.
+ROLL_UP_SQL = """
+WITH stop AS (
+    SELECT min(id) AS id FROM {sold_product} WHERE id > %(last_id)s AND created_at >= %(until)s
+), batch AS (
+    SELECT line.id, line.variant_id, line.quantity, line.total_cost, line.created_at,
+        (line.created_at AT TIME ZONE %(time_zone)s)::date AS day,
+        coalesce(o.is_paid OR o.is_active, true) AS counted
+    FROM {sold_product} AS line
+    LEFT JOIN {order} AS o ON o.id = line.order_id AND o.created_at = line.created_at
+    WHERE line.id > %(last_id)s AND line.created_at >= %(since)s AND line.created_at < %(until)s
+        AND (line.id < (SELECT id FROM stop) OR (SELECT id FROM stop) IS NULL)
+    ORDER BY line.id
+    LIMIT %(batch_size)s
+), variant_sales AS (
+    INSERT INTO {variant_sales} (day, variant_id, units, revenue)
+    SELECT day, variant_id, sum(quantity), sum(total_cost) FROM batch WHERE counted GROUP BY day, variant_id
+    ON CONFLICT (day, variant_id) DO UPDATE SET
+        units = {variant_sales}.units + EXCLUDED.units,
+        revenue = {variant_sales}.revenue + EXCLUDED.revenue
+), category_sales AS (
+    INSERT INTO {category_sales} (day, category_id, units, revenue)
+    SELECT batch.day, variant.category_id, sum(batch.quantity), sum(batch.total_cost)
+    FROM batch JOIN {variant} AS variant ON variant.id = batch.variant_id
+    WHERE batch.counted
+    GROUP BY batch.day, variant.category_id
+    ON CONFLICT (day, category_id) DO UPDATE SET
+        units = {category_sales}.units + EXCLUDED.units,
+        revenue = {category_sales}.revenue + EXCLUDED.revenue
+)
+SELECT max(id), max(created_at), count(*) FROM batch
+"""
+
+# Subtracts the lines of orders_ids already rolled up from both rollups; returns how many lines.
+UNROLL_SQL = """
+WITH lines AS (
+    SELECT line.variant_id, variant.category_id, line.quantity, line.total_cost,
+        (line.created_at AT TIME ZONE %(time_zone)s)::date AS day
+    FROM {sold_product} AS line JOIN {variant} AS variant ON variant.id = line.variant_id
+    WHERE line.order_id = ANY(%(order_ids)s) AND line.id <= %(last_id)s
+        AND line.created_at >= %(since)s AND line.created_at <= %(until)s
+), variant_sales AS (
+    UPDATE {variant_sales} AS sales SET units = sales.units - lines.units, revenue = sales.revenue - lines.revenue
+    FROM (
+        SELECT day, variant_id, sum(quantity) AS units, sum(total_cost) AS revenue FROM lines GROUP BY day, variant_id
+    ) AS lines
+    WHERE sales.day = lines.day AND sales.variant_id = lines.variant_id
+), category_sales AS (
+    UPDATE {category_sales} AS sales SET units = sales.units - lines.units, revenue = sales.revenue - lines.revenue
+    FROM (
+        SELECT day, category_id, sum(quantity) AS units, sum(total_cost) AS revenue FROM lines GROUP BY day, category_id
+    ) AS lines
+    WHERE sales.day = lines.day AND sales.category_id = lines.category_id
+)
+SELECT count(*) FROM lines
+"""
+
+
+def roll_up_sales(batch_size=None, lag_seconds=None):
+    """Add the SoldProduct rows written since the last run to the daily rollups; returns how many.
+
+    Rows are read in id order past the watermark, and only up to the first one that is not yet
+    lag_seconds old: a checkout can commit a higher id with an older created_at, and passing
+    the younger lower id would leave it behind the watermark for good. Checkouts still writing
+    rows are waited for through the sales fence. The created_at lower bound lets Postgres
+    prune the partitions already rolled up. Lines of orders cancelled unpaid are not counted;
+    release_unpaid_orders takes back the ones counted before (see unroll_sales).
+    """
+    batch_size = batch_size or settings.SALES_ROLLUP_BATCH_SIZE
+    lag = datetime.timedelta(seconds=settings.SALES_ROLLUP_LAG_SECONDS if lag_seconds is None else lag_seconds)
+    sql = format_sql(ROLL_UP_SQL)
+    RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+
+    rolled_up = 0
+    while True:
+        with transaction.atomic():
+            # Locking the watermark keeps concurrent runs from counting a row twice.
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+            until = timezone.now() - lag
+            since = watermark.last_created_at - lag if watermark.last_created_at else EPOCH
+            with connection.cursor() as cursor:
+                cursor.execute(SALES_FENCE_SQL, [SALES_FENCE_LOCK])
+                cursor.execute(sql, {
+                    "time_zone": settings.TIME_ZONE,
+                    "last_id": watermark.last_id,
+                    "since": since,
+                    "until": until,
+                    "batch_size": batch_size,
+                })
+                last_id, last_created_at, count = cursor.fetchone()
+            if count:
+                watermark.last_id = last_id
+                watermark.last_created_at = max(last_created_at, watermark.last_created_at or last_created_at)
+                watermark.save()
+        rolled_up += count
+        if count < batch_size:
+            return rolled_up
+
+
+def unroll_sales(orders):
+    """Take the lines of orders, which are being cancelled, back out of the rollups; returns how many.
+
+    Call it in the transaction that cancels them. It waits for a running rollup batch through
+    the watermark lock, so each line is either subtracted here or, its order no longer
+    active, passed over by the batches to come.
+    """
+    watermark = RollupWatermark.objects.select_for_update().filter(name=WATERMARK_NAME).first()
+    if not orders or not watermark:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(format_sql(UNROLL_SQL), {
+            "time_zone": settings.TIME_ZONE,
+            "order_ids": [order.id for order in orders],
+            "last_id": watermark.last_id,
+            "since": min(order.created_at for order in orders),
+            "until": max(order.created_at for order in orders),
+        })
+        return cursor.fetchone()[0]
+
+
+def format_sql(sql):
+    return sql.format(
+        sold_product=SoldProduct._meta.db_table,
+        order=Order._meta.db_table,
+        variant_sales=DailyVariantSales._meta.db_table,
+        category_sales=DailyCategorySales._meta.db_table,
+        variant=ProductVariant._meta.db_table,
+    )
+
+
+def hold_sales_fence():
+    """Keep rollups from reading SoldProduct until the current transaction ends.
+
+    Call it in the transaction that writes SoldProduct rows, before the order is created, so
+    every id it allocates is either committed or not yet allocated when a batch is read.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SALES_FENCE_SHARED_SQL, [SALES_FENCE_LOCK])
+
+
+def reset_sales_rollups():
+    """Empty the rollups and rewind the watermark; the next run rolls up every SoldProduct again."""
+    with transaction.atomic():
+        DailyVariantSales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from inventory import leaderboard
+from inventory.cache import get_variant_payloads
+from .models import Order, SoldProduct
+from .summaries import refresh_order_summaries
+
+
+@receiver(post_save, sender=SoldProduct)
+def record_sale_on_leaderboard(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+
+    def record():
+        variant = get_variant_payloads([instance.variant_id]).get(instance.variant_id)
+        if variant and variant["is_active"]:
+            leaderboard.record_sales([(instance.variant_id, variant["category_id"], instance.quantity)])
+
+    transaction.on_commit(record)
+
+
+def refresh_summary_on_commit(order_id):
+    transaction.on_commit(lambda: refresh_order_summaries([order_id]))
+
+
+# Checkout creates the order before bulk-inserting its lines; the refresh waits for the commit,
+# so the summary is built with every line in place.
+@receiver(post_save, sender=Order)
+def refresh_summary_on_order_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_summary_on_commit(instance.id)
+
+
+@receiver(post_save, sender=SoldProduct)
+@receiver(post_delete, sender=SoldProduct)
+def refresh_summary_on_line_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_summary_on_commit(instance.order_id)
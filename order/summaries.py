@@ -0,0 +1,171 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Prefetch
+
+from .models import Order, OrderSummary, SoldProduct
+from inventory.serializers import media_url
+
+REFRESH_BATCH = 500
+
+UPSERT_SUMMARIES_SQL = """
+INSERT INTO {table} (order_id, user_id, rzp_order_id, status, is_active, created_at, updated_at, document)
+VALUES {rows}
+ON CONFLICT (order_id) DO UPDATE SET
+    user_id = EXCLUDED.user_id,
+    rzp_order_id = EXCLUDED.rzp_order_id,
+    status = EXCLUDED.status,
+    is_active = EXCLUDED.is_active,
+    created_at = EXCLUDED.created_at,
+    updated_at = EXCLUDED.updated_at,
+    document = EXCLUDED.document
+"""
+SUMMARY_ROW = "(%s, %s, %s, %s, %s, %s, now(), %s::jsonb)"
+
+
+def serialize_address(address):
+    if not address:
+        return {}
+    return {
+        "address_type": address.address_type,
+        "poc_name": address.poc_name,
+        "phone": address.phone,
+        "line_1": address.line_1,
+        "line_2": address.line_2,
+        "city": address.city,
+        "state": address.state,
+        "pin": address.pin,
+        "landmark": address.landmark,
+    }
+
+
+def serialize_sold_product(sold_product):
+    """A line as sold: name, slug and image come from the snapshot taken at checkout.
+
+    The image is kept as its storage name; order_response builds the URL when it is read.
+    """
+    return {
+        "variant_id": sold_product.variant_id,
+        "individual_cost": sold_product.individual_cost,
+        "total_cost": sold_product.total_cost,
+        "quantity": sold_product.quantity,
+        "product_name": sold_product.product_name,
+        "file_path": sold_product.file_path,
+        "slug": sold_product.slug,
+    }
+
+
+def image_url(file_path):
+    # Summaries of orders archived before migration 0008 still hold the URL they were written with.
+    if not file_path or "://" in file_path:
+        return file_path
+    return media_url(file_path)
+
+
+def order_response(document):
+    """A stored order document as the order endpoints return it, with image URLs for this host."""
+    return {
+        **document,
+        "sold_products": [
+            {**line, "file_path": image_url(line["file_path"])} for line in document["sold_products"]
+        ],
+    }
+
+
+def order_history(orders):
+    """Orders with their address joined and lines prefetched in one query.
+
+    Lines are counted from the prefetch: with Order partitioned, Postgres no longer accepts a
+    GROUP BY on the primary key alone, so aggregating in SQL would group by every column.
+    """
+    return (
+        orders.select_related("shipping_address")
+        .prefetch_related(
+            Prefetch(
+                "soldproduct_set",
+                queryset=SoldProduct.objects.only(
+                    "id", "order_id", "variant_id", "individual_cost", "total_cost", "quantity",
+                    "product_name", "slug", "file_path",
+                ).order_by("id"),
+            )
+        )
+    )
+
+
+def order_document(order):
+    """The order as the order endpoints return it; order comes from order_history with user__profile joined."""
+    profile = getattr(order.user, "profile", None)
+    sold_products = order.soldproduct_set.all()
+    return {
+        "receipt_id": str(order.id),
+        "order_id": order.rzp_order_id,
+        "is_paid": order.is_paid,
+        "user_id": order.user_id,
+        "cost": order.cost,
+        "gst": order.gst,
+        "shipping": order.shipping,
+        "total_cost": order.cost + order.gst + order.shipping,
+        "status": order.status,
+        "created_at": order.created_at.isoformat(),
+        "updated_at": order.updated_at.isoformat(),
+        "line_count": len(sold_products),
+        "total_quantity": sum(sold_product.quantity for sold_product in sold_products),
+        "sold_products": [
+            serialize_sold_product(sold_product) for sold_product in sold_products
+        ],
+        "address": serialize_address(order.shipping_address),
+        "customer": {
+            "name": profile.name if profile else None,
+            "email": profile.email if profile else None,
+            "phone": order.user.username,
+        },
+    }
+
+
+def refresh_order_summaries(order_ids):
+    """Rebuild the OrderSummary rows of order_ids from the orders; returns how many were written.
+
+    Three queries however many orders: orders, their lines and one upsert.
+    """
+    return write_order_summaries(
+        order_history(Order.objects.filter(id__in=order_ids)).select_related("user__profile").order_by("id")
+    )
+
+
+def write_order_summaries(orders):
+    """Upsert the OrderSummary rows of orders, loaded as refresh_order_summaries loads them; returns how many."""
+    orders = list(orders)
+    if not orders:
+        return 0
+
+    params = []
+    for order in orders:
+        params += [
+            order.id,
+            order.user_id,
+            order.rzp_order_id,
+            order.status,
+            order.is_active,
+            order.created_at,
+            json.dumps(order_document(order), cls=DjangoJSONEncoder),
+        ]
+    sql = UPSERT_SUMMARIES_SQL.format(
+        table=OrderSummary._meta.db_table, rows=", ".join([SUMMARY_ROW] * len(orders))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    return len(orders)
+
+
+def rebuild_order_summaries(batch_size=REFRESH_BATCH):
+    """Refresh the summary of every order, batch_size orders at a time in id order."""
+    written, last_id = 0, 0
+    while True:
+        order_ids = list(
+            Order.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size]
+        )
+        if not order_ids:
+            return written
+        written += refresh_order_summaries(order_ids)
+        last_id = order_ids[-1]
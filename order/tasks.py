@@ -0,0 +1,55 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+from .checkout import release_unpaid_orders
+from .partitions import archive_partitions, check_default_partitions, create_future_partitions
+from .rollups import roll_up_sales
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def create_order_partitions_task():
+    """Keep ORDER_PARTITIONS_AHEAD months of order partitions created ahead of the writes."""
+    created = create_future_partitions(settings.ORDER_PARTITIONS_AHEAD)
+    if created:
+        logger.info("Created order partitions: %s", ", ".join(created))
+    return created
+
+
+@shared_task
+def archive_order_partitions_task():
+    """Detach order partitions older than ORDER_PARTITION_RETENTION_MONTHS for archival."""
+    detached = archive_partitions(settings.ORDER_PARTITION_RETENTION_MONTHS)
+    if detached:
+        logger.info("Detached order partitions for archival: %s", ", ".join(detached))
+    return detached
+
+
+@shared_task
+def check_default_partitions_task():
+    """Alert when orders were written outside every monthly partition."""
+    stray = check_default_partitions()
+    for table, (rows, oldest, newest) in stray.items():
+        logger.error(
+            "%s rows from %s to %s are in the DEFAULT partition of %s; create the partitions of those months",
+            rows, oldest, newest, table,
+        )
+    return {table: rows for table, (rows, _, _) in stray.items()}
+
+
+@shared_task
+def roll_up_sales_task():
+    """Add the sales made since the last run to the daily rollups."""
+    return roll_up_sales()
+
+
+@shared_task
+def release_unpaid_orders_task():
+    """Cancel the orders left unpaid past ORDER_UNPAID_HOLD and return their stock."""
+    released = release_unpaid_orders()
+    if released:
+        logger.info("Released the stock of %s unpaid orders", released)
+    return released
@@ -1,3 +1,355 @@
-from django.test import TestCase
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, ProgrammingError, connection, transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import CartItem
+from inventory.cache import catalog_version
+from inventory.serializers import media_url
+from lib.testing import FixturesMixin
+from .checkout import CheckoutError, OutOfStockError, place_order, release_unpaid_orders
+from .models import DailyCategorySales, DailyVariantSales, IdempotencyKey, Order, SoldProduct
+from .partitions import add_months, check_default_partitions, create_partitions, month_start
+from .rollups import roll_up_sales
+from .summaries import refresh_order_summaries
+from .tasks import check_default_partitions_task
+
+
+class OrderFixtures(FixturesMixin):
+    def make_order_catalog(self):
+        self.make_catalog("Orders", "Order product")
+        self.variant = self.make_variant("Order variant", current_stock=10)
+
+
+class OrderTestCase(OrderFixtures, TestCase):
+    def setUp(self):
+        self.user, self.address = self.make_buyer("9000000000")
+        self.make_order_catalog()
+
+    def checkout(self, quantity):
+        CartItem.objects.update_or_create(
+            user=self.user, variant=self.variant, defaults={"quantity": quantity, "is_active": True}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_order(self.user, self.address)
+
+
+class PlaceOrderTests(OrderTestCase):
+    def test_moves_stock_and_empties_the_cart(self):
+        order = self.checkout(3)
+
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.current_stock, self.variant.sold_stock), (7, 3))
+        self.assertEqual(order.cost, 300)
+        self.assertEqual(
+            list(SoldProduct.objects.filter(order_id=order.id).values_list("variant_id", "quantity")),
+            [(self.variant.id, 3)],
+        )
+        self.assertFalse(CartItem.objects.filter(user=self.user, is_active=True).exists())
+
+    def test_runs_a_fixed_number_of_queries_whatever_the_cart_size(self):
+        for lines in [1, 10]:
+            variants = [self.make_variant(f"Order variant {lines}-{i}", current_stock=5) for i in range(lines)]
+            CartItem.objects.filter(user=self.user).delete()
+            CartItem.objects.bulk_create([CartItem(user=self.user, variant=variant, quantity=1) for variant in variants])
+
+            # The two lock reads, the sales fence, two foreign key checks from full_clean, the
+            # order, its lines and their history, the stock update, the cart update and a savepoint.
+            with self.subTest(lines=lines), self.assertNumQueries(13):
+                order = place_order(self.user, self.address)
+            self.assertEqual(SoldProduct.objects.filter(order_id=order.id).count(), lines)
+
+    def test_out_of_stock_writes_nothing(self):
+        with self.assertRaises(OutOfStockError) as raised:
+            self.checkout(11)
+
+        self.assertEqual(raised.exception.variant_ids, [self.variant.id])
+        self.variant.refresh_from_db()
+        self.assertEqual((self.variant.current_stock, self.variant.sold_stock), (10, 0))
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+        self.assertTrue(CartItem.objects.filter(user=self.user, is_active=True).exists())
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, self.address)
+
+    def test_reused_idempotency_key_places_nothing(self):
+        CartItem.objects.create(user=self.user, variant=self.variant, quantity=1)
+        order = place_order(self.user, self.address, idempotency_key="key-1", request_hash="hash")
+        CartItem.objects.filter(user=self.user).update(is_active=True)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            place_order(self.user, self.address, idempotency_key="key-1", request_hash="hash")
+
+        self.assertEqual(IdempotencyKey.objects.get(user=self.user, key="key-1").order_id, order.id)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_bumps_the_catalog_version(self):
+        version = catalog_version()
+        self.checkout(1)
+        self.assertGreater(catalog_version(), version)
+
+    def test_redis_failures_after_commit_are_logged(self):
+        down = ConnectionError("Redis is down")
+        with mock.patch("order.checkout.leaderboard.record_sales", side_effect=down, autospec=True):
+            with self.assertLogs("order.checkout", "ERROR") as logs:
+                order = self.checkout(1)
+
+        self.assertIn("record_sales failed after checkout", logs.output[0])
+        self.assertTrue(Order.objects.filter(id=order.id).exists())
+
+
+class CheckoutRaceTests(OrderFixtures, TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        self.make_order_catalog()
+        self.variant.current_stock = 3
+        self.variant.save()
+        buyers = [self.make_buyer(f"90000002{i:02d}") for i in range(8)]
+        for user, _ in buyers:
+            CartItem.objects.create(user=user, variant=self.variant, quantity=1)
+
+        def checkout(buyer):
+            try:
+                place_order(*buyer)
+                return True
+            except OutOfStockError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            placed = sum(pool.map(checkout, buyers))
+
+        self.variant.refresh_from_db()
+        self.assertEqual(placed, 3)
+        self.assertEqual((self.variant.current_stock, self.variant.sold_stock), (0, 3))
+        self.assertEqual(SoldProduct.objects.filter(variant=self.variant).aggregate(units=Sum("quantity"))["units"], 3)
+
+
+class OrderSummaryTests(OrderTestCase):
+    def test_lines_keep_the_variant_as_it_was_sold(self):
+        order = self.checkout(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.name = "Renamed variant"
+            self.variant.is_active = False
+            self.variant.save()
+
+        refresh_order_summaries([order.id])
+
+        document = Order.objects.get(id=order.id).summary.document
+        self.assertEqual(document["line_count"], 1)
+        self.assertEqual(document["total_quantity"], 2)
+        [line] = document["sold_products"]
+        self.assertEqual((line["product_name"], line["slug"]), ("Order variant", "order-variant"))
+        self.assertEqual(line["file_path"], "variants/variant1.jpg")
+
+
+class OrderHistoryViewTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        variants = [self.variant] + [self.make_variant(f"Order variant {i}", current_stock=10) for i in range(2)]
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, cost=300, gst=54, shipping=200, shipping_address=self.address, status="Processing")
+            for _ in range(30)
+        ])
+        lines = []
+        for order in orders:
+            for variant in variants:
+                line = SoldProduct(
+                    order=order, variant=variant, individual_cost=100, total_cost=200, quantity=2,
+                    created_at=order.created_at,
+                )
+                line.copy_variant(variant)
+                lines.append(line)
+        SoldProduct.objects.bulk_create(lines)
+        # The bulk inserts skip the signals that keep the summaries current.
+        refresh_order_summaries([order.id for order in orders])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_run_a_fixed_number_of_queries(self):
+        # The total and the page.
+        for limit in [1, 10, 30]:
+            with self.subTest(limit=limit), self.assertNumQueries(2):
+                response = self.client.get(reverse("orders"), {"limit": limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["orders"]), limit)
+            order = response.data["orders"][0]
+            self.assertEqual((order["line_count"], order["total_quantity"]), (3, 6))
+            self.assertEqual(len(order["sold_products"]), 3)
+            self.assertEqual(order["sold_products"][0]["file_path"], media_url("variants/variant1.jpg"))
+
+    def test_pages_follow_on_without_gaps(self):
+        seen, params = [], {"limit": 7, "cursor": ""}
+        while True:
+            response = self.client.get(reverse("orders"), params)
+            seen += [order["receipt_id"] for order in response.data["orders"]]
+            cursor = response.data["pagination"].get("next_cursor")
+            if not cursor:
+                break
+            params = {"limit": 7, "cursor": cursor}
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(len(set(seen)), 30)
+
+    def test_out_of_range_paging_is_rejected(self):
+        for params in [{"limit": -1}, {"limit": 0}, {"offset": -1}, {"limit": 0, "cursor": ""}]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(reverse("orders"), params).status_code, 400)
+
+    def test_detail_by_receipt(self):
+        order = Order.objects.filter(user=self.user).first()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("order-detail"), {"receipt": order.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["order"]["sold_products"]), 3)
+
+
+class ReleaseUnpaidOrdersTests(OrderTestCase):
+    def later(self, seconds):
+        return timezone.now() + datetime.timedelta(seconds=seconds)
+
+    def test_puts_back_the_stock_of_orders_unpaid_past_the_hold(self):
+        order = self.checkout(4)
+
+        self.assertEqual(release_unpaid_orders(now=self.later(settings.ORDER_UNPAID_HOLD - 60)), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_unpaid_orders(now=self.later(settings.ORDER_UNPAID_HOLD + 60)), 1)
+
+        order.refresh_from_db()
+        self.variant.refresh_from_db()
+        self.assertEqual((order.status, order.is_active), ("Cancelled", False))
+        self.assertEqual((self.variant.current_stock, self.variant.sold_stock), (10, 0))
+        self.assertEqual(order.summary.document["status"], "Cancelled")
+        self.assertEqual(order.history.latest().status, "Cancelled")
+
+    def test_keeps_paid_orders(self):
+        order = self.checkout(4)
+        Order.objects.filter(id=order.id).update(is_paid=True)
+
+        self.assertEqual(release_unpaid_orders(now=self.later(settings.ORDER_UNPAID_HOLD + 60)), 0)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.current_stock, 6)
+
+
+class RollUpSalesTests(OrderTestCase):
+    def sell(self, quantity, created_at):
+        order = Order.objects.create(
+            user=self.user, cost=100 * quantity, gst=18 * quantity,
+            shipping_address=self.address, status="Processing",
+        )
+        return SoldProduct.objects.create(
+            order=order, variant=self.variant, individual_cost=100, total_cost=100 * quantity,
+            quantity=quantity, created_at=created_at,
+        )
+
+    def units_rolled_up(self):
+        return DailyVariantSales.objects.aggregate(units=Sum("units"))["units"] or 0
+
+    def test_rolls_up_each_sale_once(self):
+        self.sell(2, timezone.now() - datetime.timedelta(minutes=5))
+        self.sell(3, timezone.now() - datetime.timedelta(minutes=4))
+
+        self.assertEqual(roll_up_sales(lag_seconds=60), 2)
+        self.assertEqual(roll_up_sales(lag_seconds=60), 0)
+        self.assertEqual(self.units_rolled_up(), 5)
+
+    def test_stops_at_a_lower_id_still_inside_the_lag(self):
+        now = timezone.now()
+        # The lower id is the younger row: its checkout started later but took its id first.
+        young = self.sell(2, now - datetime.timedelta(seconds=10))
+        old = self.sell(3, now - datetime.timedelta(minutes=10))
+        self.assertLess(young.id, old.id)
+
+        self.assertEqual(roll_up_sales(lag_seconds=60), 0)
+        self.assertEqual(self.units_rolled_up(), 0)
+
+        # Once both are past the lag, both are counted.
+        self.assertEqual(roll_up_sales(lag_seconds=0), 2)
+        self.assertEqual(self.units_rolled_up(), 5)
+
+    def test_orders_cancelled_unpaid_are_not_counted(self):
+        now = timezone.now()
+        rolled_up = self.sell(2, now - datetime.timedelta(minutes=5))
+        self.assertEqual(roll_up_sales(lag_seconds=60), 1)
+        pending = self.sell(3, now - datetime.timedelta(minutes=4))
+        kept = self.sell(4, now - datetime.timedelta(minutes=3))
+        Order.objects.filter(id=kept.order_id).update(is_paid=True)
+
+        for line in [rolled_up, pending, kept]:
+            Order.objects.filter(id=line.order_id).update(created_at=line.created_at)
+        with self.captureOnCommitCallbacks(execute=True):
+            released = release_unpaid_orders(now=now + datetime.timedelta(seconds=settings.ORDER_UNPAID_HOLD))
+        self.assertEqual(released, 2)
+        self.assertEqual(self.units_rolled_up(), 0)
+
+        self.assertEqual(roll_up_sales(lag_seconds=60), 2)
+        self.assertEqual(self.units_rolled_up(), 4)
+        self.assertEqual(DailyVariantSales.objects.aggregate(revenue=Sum("revenue"))["revenue"], 400)
+        self.assertEqual(DailyCategorySales.objects.aggregate(units=Sum("units"))["units"], 4)
+
+
+class SalesReportViewTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        day = timezone.localdate()
+        for i in range(3):
+            variant = self.make_variant(f"Report variant {i}", current_stock=10)
+            DailyVariantSales.objects.create(day=day, variant=variant, units=i + 1, revenue=100 * (i + 1))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="9000000009", is_staff=True))
+
+    def report(self, limit):
+        return self.client.get(reverse("sales-report"), {"group_by": "variant", "limit": limit})
+
+    def test_limit_below_one_is_rejected(self):
+        for limit in [0, -1]:
+            with self.subTest(limit=limit):
+                response = self.report(limit)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {"error": "limit must be at least 1"})
+
+    def test_large_limit_is_clamped(self):
+        with mock.patch("order.views.SALES_REPORT_MAX_LIMIT", 2):
+            response = self.report(10 ** 12)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["units"] for row in response.data["rows"]], [3, 2])
+
+
+class PartitionTests(OrderTestCase):
+    def test_annotate_cannot_group_by_the_order_primary_key(self):
+        # Order is keyed on (id, created_at); Django groups by id alone. See the Order docstring.
+        self.checkout(2)
+        with self.assertRaises(ProgrammingError), transaction.atomic():
+            list(Order.objects.annotate(lines=Count("soldproduct")))
+
+        self.assertEqual(
+            list(SoldProduct.objects.values("order_id").annotate(units=Sum("quantity")).values_list("units", flat=True)),
+            [2],
+        )
+
+    def test_rows_outside_every_month_are_caught_by_the_default_partition(self):
+        order = self.checkout(2)
+        far_month = add_months(month_start(timezone.now()), 60)
+        Order.objects.filter(id=order.id).update(created_at=far_month)
+        SoldProduct.objects.filter(order_id=order.id).update(created_at=far_month)
+
+        stray = check_default_partitions()
+        self.assertEqual({table: rows for table, (rows, _, _) in stray.items()}, {
+            Order._meta.db_table: 1, SoldProduct._meta.db_table: 1,
+        })
+        with self.assertLogs("order.tasks", "ERROR"):
+            check_default_partitions_task()
+
+        # Creating the month moves its rows out of the DEFAULT partition.
+        create_partitions(far_month, far_month)
+        self.assertEqual(check_default_partitions(), {})
+        self.assertEqual(Order.objects.get(id=order.id).created_at, far_month)
+        self.assertEqual(SoldProduct.objects.filter(order_id=order.id).count(), 1)
@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.OrdersAPIView.as_view(), name='orders'),
     path('detail/', views.OrderDetailAPIView.as_view(), name='order-detail'),
-    path('create-order/', views.CreateOrderView.as_view(), name='create-order')
+    path('create-order/', views.CreateOrderView.as_view(), name='create-order'),
+    path('sales-report/', views.SalesReportView.as_view(), name='sales-report'),
 ]
\ No newline at end of file
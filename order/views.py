@@ -1,36 +1,31 @@
+import datetime
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.db.models import Sum
 from django.http import JsonResponse
-from django.utils.text import slugify
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 
-import razorpay
-
-from .models import Order, SoldProduct
-from inventory.models import ProductVariant
-from cart.views import GST_PERC
-from user.models import UserProfile
-from lib.common import calculate_shipping
-from api_ecom.settings import RZP_KEY_ID, RZP_SECRET_KEY
+from .models import DailyCategorySales, DailyVariantSales, IdempotencyKey, OrderSummary
+from .checkout import CheckoutError, OutOfStockError, place_order
+from .idempotency import MAX_KEY_LENGTH, idempotency_lock, request_hash
+from .summaries import order_response
+from user.models import UserAddress
+from lib.pagination import PageParams
+from payment.gateway import GatewayError, get_gateway
+from payment.tasks import create_gateway_order
 
 
-def serialize_address(address):
-    if not address:
-        return {}
-    return {
-        "address_type": address.address_type,
-        "poc_name": address.poc_name,
-        "phone": address.phone,
-        "line_1": address.line_1,
-        "line_2": address.line_2,
-        "city": address.city,
-        "state": address.state,
-        "pin": address.pin,
-        "landmark": address.landmark,
-    }
+ORDER_ORDERING = ("-created_at", "order_id")
+SALES_REPORT_GROUPS = ("day", "variant", "category")
+SALES_REPORT_MAX_DAYS = 366
+SALES_REPORT_MAX_LIMIT = 500
 
 
 class OrdersAPIView(APIView):
@@ -43,74 +38,21 @@ class OrdersAPIView(APIView):
             user = request.user
             order_id = request.GET.get("order_id")
             order_status = request.GET.get("status")
-            limit = int(request.GET.get("limit", 10))
-            offset = int(request.GET.get("offset", 0))
+            page = PageParams.from_request(request, default_limit=10, skip_param="offset")
 
             query_filters = {"is_active": True, "user": user}
 
             if order_id:
-                query_filters["id"] = order_id
+                query_filters["order_id"] = order_id
             if order_status:
                 query_filters["status"] = order_status
 
-            orders = (
-                Order.objects.filter(**query_filters)
-                .order_by("-created_at")[offset : offset + limit]
-            )
-
-            orders_data = []
-            for order in orders:
-                order_data = {
-                    "receipt_id": str(order.id),
-                    "order_id": order.rzp_order_id,
-                    "is_paid": order.is_paid,
-                    "user_id": order.user_id,
-                    "cost": order.cost,
-                    "gst": order.gst,
-                    "shipping": order.shipping,
-                    "total_cost": order.cost + order.gst + order.shipping,
-                    "status": order.status,
-                    "created_at": order.created_at.isoformat(),
-                    "updated_at": order.updated_at.isoformat(),
-                    "total_quantity": sum(
-                        sold_product.quantity
-                        for sold_product in order.soldproduct_set.all()
-                    ),
-                    "sold_products": [],
-                    "address": serialize_address(order.shipping_address),
-                }
-
-                for sold_product in order.soldproduct_set.all():
-                    variant = ProductVariant.objects.filter(
-                        id=sold_product.variant.id
-                    ).first()
-                    order_data["sold_products"].append(
-                        {
-                            "variant_id": sold_product.variant_id,
-                            "individual_cost": sold_product.individual_cost,
-                            "total_cost": sold_product.total_cost,
-                            "quantity": sold_product.quantity,
-                            "product_name": variant.name,
-                            "file_path": f"http://localhost{variant.file_path.url}",
-                            "slug": slugify(variant.name),
-                        }
-                    )
-
-                orders_data.append(order_data)
-
-            total_count = Order.objects.filter(**query_filters).count()
+            summaries = OrderSummary.objects.filter(**query_filters).only("order_id", "created_at", "document")
+            summaries, pagination = page.paginate(summaries, ORDER_ORDERING)
+            orders_data = [order_response(summary.document) for summary in summaries]
 
             return Response(
-                {
-                    "success": True,
-                    "orders": orders_data,
-                    "pagination": {
-                        "total": total_count,
-                        "limit": limit,
-                        "offset": offset,
-                        "has_more": (offset + limit) < total_count,
-                    },
-                },
+                {"success": True, "orders": orders_data, "pagination": pagination},
                 status=status.HTTP_200_OK,
             )
 
@@ -122,105 +64,193 @@ class OrdersAPIView(APIView):
 
 
 class OrderDetailAPIView(APIView):
-    """API to fetch details of a single order by Razorpay order ID."""
+    """API to fetch details of a single order by Razorpay order ID, or by receipt while its gateway order is pending."""
 
     def get(self, request):
         rzp_order_id = request.GET.get("order_id")
-        order = Order.objects.filter(rzp_order_id=rzp_order_id).first()
-
-        if not order:
+        receipt = request.GET.get("receipt", "")
+        summaries = OrderSummary.objects.only("document")
+        if receipt:
+            summary = summaries.filter(order_id=receipt, user=request.user).first() if receipt.isdigit() else None
+        else:
+            summary = summaries.filter(rzp_order_id=rzp_order_id).first() if rzp_order_id else None
+
+        if not summary:
             return JsonResponse(
                 {"success": False, "error": "Order not found"},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
-        user_profile = UserProfile.objects.filter(user=order.user).first()
-
+        order = summary.document
         order_data = {
-            "order_id": str(order.id),
-            "user_id": order.user_id,
-            "name": user_profile.name,
-            "email": user_profile.email,
-            "phone": order.user.username,
-            "cost": order.cost,
-            "gst": order.gst,
-            "status": order.status,
-            "created_at": order.created_at.isoformat(),
-            "updated_at": order.updated_at.isoformat(),
-            "sold_products": [],
-        }
-
-        for sold_product in order.soldproduct_set.all():
-            order_data["sold_products"].append(
+            "order_id": order["receipt_id"],
+            "rzp_order_id": order["order_id"],
+            "user_id": order["user_id"],
+            "name": order["customer"]["name"],
+            "email": order["customer"]["email"],
+            "phone": order["customer"]["phone"],
+            "cost": order["cost"],
+            "gst": order["gst"],
+            "status": order["status"],
+            "created_at": order["created_at"],
+            "updated_at": order["updated_at"],
+            "sold_products": [
                 {
-                    "variant_id": sold_product.variant_id,
-                    "individual_cost": sold_product.individual_cost,
-                    "total_cost": sold_product.total_cost,
-                    "quantity": sold_product.quantity,
+                    "variant_id": sold_product["variant_id"],
+                    "individual_cost": sold_product["individual_cost"],
+                    "total_cost": sold_product["total_cost"],
+                    "quantity": sold_product["quantity"],
                 }
-            )
+                for sold_product in order["sold_products"]
+            ],
+        }
 
         return JsonResponse({"success": True, "order": order_data}, status=200)
 
 
 class CreateOrderView(APIView):
-    """API to create a new order and initiate Razorpay order creation."""
+    """API to create a new order and initiate Razorpay order creation.
+
+    With an Idempotency-Key header, repeats of a request get the response of the order the first one placed.
+    """
 
     def post(self, request):
         user = request.user
-        user_profile, _ = UserProfile.objects.get_or_create(user=user)
-
         phone = request.POST.get("phone")
         if not phone:
-            raise Exception("Shipping address not found")
-        if not user_profile.cart_items:
-            raise Exception("Cart is empty")
-
-        shipping_address = None
-        for addr in user_profile.useraddress_set.all():
-            if addr.phone == phone:
-                shipping_address = addr
-                break
+            return Response({"error": "Shipping address not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+        shipping_address = UserAddress.objects.filter(profile__user=user, phone=phone).first()
         if not shipping_address:
-            raise Exception("Shipping address not found")
+            return Response({"error": "Shipping address not found"}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return self.create_order(user, shipping_address)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({"error": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_hash(request.POST)
+        # Concurrent duplicates queue here until the first one has placed its order.
+        with idempotency_lock(user.id, key) as acquired:
+            if not acquired:
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still in progress"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            stored = IdempotencyKey.objects.select_related("order").filter(user=user, key=key).first()
+            if not stored:
+                try:
+                    return self.create_order(user, shipping_address, key, fingerprint)
+                except IntegrityError:
+                    # The lock expired under a slow first request, which has committed the key since.
+                    stored = IdempotencyKey.objects.select_related("order").filter(user=user, key=key).first()
+                    if not stored:
+                        raise
+
+        if stored.request_hash != fingerprint:
+            return Response(
+                {"error": "Idempotency-Key was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = self.order_response(stored.order)
+        response["Idempotent-Replayed"] = "true"
+        return response
 
-        total_cost = sum(
-            item.variant.price * item.quantity
-            for item in user_profile.cart_items.filter(is_active=True)
-        )
-        shipping = calculate_shipping(user)
-
-        order = Order.objects.create(
-            user=user,
-            cost=total_cost,
-            gst=total_cost * GST_PERC,
-            shipping=shipping,
-            shipping_address=shipping_address,
-            status="Processing",
-        )
+    def create_order(self, user, shipping_address, idempotency_key=None, fingerprint=""):
+        try:
+            order = place_order(user, shipping_address, idempotency_key, fingerprint)
+        except OutOfStockError as e:
+            return Response({"error": str(e), "variant_ids": e.variant_ids}, status=status.HTTP_409_CONFLICT)
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not settings.PAYMENT_GATEWAY_ASYNC:
+            try:
+                gateway_order = get_gateway().create_order(order.amount_paise, str(order.id))
+            except GatewayError:
+                gateway_order = None
+            if gateway_order:
+                order.rzp_order_id = gateway_order["id"]
+                order.save()
+                return self.order_response(order)
+
+        # Either configured to, or the gateway is struggling: finish in the background. The task looks
+        # the receipt up before creating, in case a create that timed out here did reach the gateway.
+        create_gateway_order.delay(order.id)
+        return self.order_response(order)
+
+    def order_response(self, order):
+        if order.rzp_order_id:
+            return Response({"order_id": order.rzp_order_id}, status=status.HTTP_200_OK)
+        return Response({"order_id": None, "receipt": str(order.id)}, status=status.HTTP_202_ACCEPTED)
+
+
+class SalesReportView(APIView):
+    """API to report units sold and revenue over a date range by day, variant or category, from the daily rollups."""
+    permission_classes = [IsAdminUser]
 
-        for item in user_profile.cart_items.filter(is_active=True):
-            product = ProductVariant.objects.filter(id=item.variant.id).first()
-            SoldProduct.objects.create(
-                variant=item.variant,
-                individual_cost=product.price,
-                total_cost=product.price * item.quantity,
-                quantity=item.quantity,
-                order=order,
+    def get(self, request):
+        group_by = request.GET.get("group_by", "day")
+        if group_by not in SALES_REPORT_GROUPS:
+            return Response(
+                {"error": f"group_by must be one of {', '.join(SALES_REPORT_GROUPS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            end = datetime.date.fromisoformat(request.GET["end"]) if request.GET.get("end") else timezone.localdate()
+            start = (
+                datetime.date.fromisoformat(request.GET["start"]) if request.GET.get("start")
+                else end - datetime.timedelta(days=29)
+            )
+            category_id = int(request.GET["category_id"]) if request.GET.get("category_id") else None
+            limit = int(request.GET.get("limit", 50))
+        except ValueError:
+            return Response({"error": "Invalid parameter format"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, SALES_REPORT_MAX_LIMIT)
+        if start > end or (end - start).days >= SALES_REPORT_MAX_DAYS:
+            return Response(
+                {"error": f"start must not be after end, and the range at most {SALES_REPORT_MAX_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            item.is_active = False
-            item.save()
 
-        client = razorpay.Client(auth=(RZP_KEY_ID, RZP_SECRET_KEY))
-        resp = client.order.create(
+        category_sales = DailyCategorySales.objects.filter(day__range=(start, end))
+        if category_id:
+            category_sales = category_sales.filter(category_id=category_id)
+
+        if group_by == "variant":
+            sales = DailyVariantSales.objects.filter(day__range=(start, end))
+            if category_id:
+                sales = sales.filter(variant__category_id=category_id)
+            sales = sales.values("variant_id", "variant__name")
+        elif group_by == "category":
+            sales = category_sales.values("category_id", "category__name")
+        else:
+            sales = category_sales.values("day")
+        sales = sales.annotate(total_units=Sum("units"), total_revenue=Sum("revenue"))
+        sales = sales.order_by("day") if group_by == "day" else sales.order_by("-total_revenue")[:limit]
+
+        rows = []
+        for row in sales:
+            if group_by == "variant":
+                key = {"variant_id": row["variant_id"], "name": row["variant__name"]}
+            elif group_by == "category":
+                key = {"category_id": row["category_id"], "name": row["category__name"]}
+            else:
+                key = {"day": row["day"].isoformat()}
+            rows.append({**key, "units": row["total_units"], "revenue": row["total_revenue"]})
+
+        totals = category_sales.aggregate(units=Sum("units"), revenue=Sum("revenue"))
+        return Response(
             {
-                "amount": int(total_cost + total_cost * GST_PERC + shipping) * 100,
-                "currency": "INR",
-                "receipt": str(order.id),
-            }
+                "success": True,
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "group_by": group_by,
+                "rows": rows,
+                "totals": {"units": totals["units"] or 0, "revenue": totals["revenue"] or 0},
+            },
+            status=status.HTTP_200_OK,
         )
-
-        order.rzp_order_id = resp.get("id")
-        order.save()
-
-        return Response({"order_id": resp.get("id")}, status=status.HTTP_200_OK)
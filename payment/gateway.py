@@ -0,0 +1,201 @@
+import functools
+import hashlib
+import hmac
+import time
+import uuid
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Razorpay's largest page of a list call.
+PAGE_SIZE = 100
+RAZORPAY_ERRORS = (
+    requests.RequestException,
+    razorpay.errors.BadRequestError,
+    razorpay.errors.ServerError,
+    razorpay.errors.GatewayError,
+)
+
+
+class GatewayError(Exception):
+    """The payment gateway could not be reached or rejected the request."""
+
+
+def payment_state(gateway_order):
+    """{"status", "payment_id"} of a gateway order, payment_id being its captured payment if any."""
+    payments = (gateway_order.get("payments") or {}).get("items") or []
+    captured = [payment["id"] for payment in payments if payment.get("status") == "captured"]
+    return {"status": gateway_order.get("status"), "payment_id": captured[0] if captured else None}
+
+
+class RazorpayGateway:
+    """Razorpay behind one pooled session with strict timeouts and retries.
+
+    Connection failures are retried for every call, since nothing reached Razorpay. Read
+    failures and 5xx responses are only retried for GETs: repeating a POST could create a
+    second gateway order.
+    """
+
+    def __init__(self, key_id, secret, webhook_secret, timeout, retries, pool_size):
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry))
+        self.client = razorpay.Client(session=session, auth=(key_id, secret))
+        self.secret = secret
+        self.webhook_secret = webhook_secret
+        self.timeout = timeout
+
+    def create_order(self, amount, receipt, currency="INR"):
+        """Create a gateway order for amount (in paise) and return it; raises GatewayError."""
+        try:
+            return self.client.order.create(
+                {"amount": amount, "currency": currency, "receipt": receipt},
+                timeout=self.timeout,
+            )
+        except RAZORPAY_ERRORS as e:
+            raise GatewayError(str(e)) from e
+
+    def find_order(self, receipt):
+        """The gateway order created for receipt, or None; raises GatewayError."""
+        try:
+            page = self.client.order.all({"receipt": receipt, "count": 1}, timeout=self.timeout)
+        except RAZORPAY_ERRORS as e:
+            raise GatewayError(str(e)) from e
+        items = page.get("items", [])
+        return items[0] if items else None
+
+    def fetch_orders(self, order_ids, created_from, created_to):
+        """{order_id: payment_state} for the gateway orders among order_ids, all created in the window.
+
+        Razorpay cannot fetch orders by id in bulk, so this pages through the orders created in the
+        window, payments expanded: one call per PAGE_SIZE orders rather than one per order.
+        """
+        wanted = set(order_ids)
+        states = {}
+        params = {
+            "from": int(created_from.timestamp()),
+            "to": int(created_to.timestamp()) + 1,
+            "count": PAGE_SIZE,
+            "expand[]": "payments",
+        }
+        skip = 0
+        while len(states) < len(wanted):
+            try:
+                page = self.client.order.all({**params, "skip": skip}, timeout=self.timeout)
+            except RAZORPAY_ERRORS as e:
+                raise GatewayError(str(e)) from e
+            items = page.get("items", [])
+            for gateway_order in items:
+                if gateway_order["id"] in wanted:
+                    states[gateway_order["id"]] = payment_state(gateway_order)
+            if len(items) < PAGE_SIZE:
+                break
+            skip += PAGE_SIZE
+        return states
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        try:
+            self.client.utility.verify_payment_signature({
+                "razorpay_order_id": order_id,
+                "razorpay_payment_id": payment_id,
+                "razorpay_signature": signature,
+            })
+        except razorpay.errors.SignatureVerificationError:
+            return False
+        return True
+
+    def verify_webhook_signature(self, body, signature):
+        """Whether the X-Razorpay-Signature of a webhook matches its raw body."""
+        if not self.webhook_secret or not signature:
+            return False
+        try:
+            self.client.utility.verify_webhook_signature(body.decode(), signature, self.webhook_secret)
+        except (razorpay.errors.SignatureVerificationError, UnicodeDecodeError):
+            return False
+        return True
+
+
+class FakeGateway:
+    """Offline stand-in for load tests and local runs; signs like Razorpay does."""
+
+    def __init__(self, secret, webhook_secret="", latency=0):
+        self.secret = secret
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.orders = {}
+
+    def create_order(self, amount, receipt, currency="INR"):
+        if self.latency:
+            time.sleep(self.latency)
+        order = {
+            "id": f"order_fake{uuid.uuid4().hex[:14]}",
+            "entity": "order",
+            "amount": amount,
+            "currency": currency,
+            "receipt": receipt,
+            "status": "created",
+            "created_at": int(time.time()),
+        }
+        self.orders[order["id"]] = order
+        return order
+
+    def find_order(self, receipt):
+        if self.latency:
+            time.sleep(self.latency)
+        return next((order for order in self.orders.values() if order["receipt"] == receipt), None)
+
+    def capture(self, order_id):
+        """Pay for a fake gateway order, as a customer would; returns the payment id."""
+        payment_id = f"pay_fake{uuid.uuid4().hex[:14]}"
+        order = self.orders[order_id]
+        order["status"] = "paid"
+        order["payments"] = {"items": [{"id": payment_id, "order_id": order_id, "status": "captured"}]}
+        return payment_id
+
+    def fetch_orders(self, order_ids, created_from, created_to):
+        if self.latency:
+            time.sleep(self.latency * -(-len(order_ids) // PAGE_SIZE))
+        return {order_id: payment_state(self.orders[order_id]) for order_id in order_ids if order_id in self.orders}
+
+    def sign(self, order_id, payment_id):
+        message = f"{order_id}|{payment_id}".encode()
+        return hmac.new(self.secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        return hmac.compare_digest(self.sign(order_id, payment_id), signature or "")
+
+    def sign_webhook(self, body):
+        return hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+
+    def verify_webhook_signature(self, body, signature):
+        return bool(self.webhook_secret) and hmac.compare_digest(self.sign_webhook(body), signature or "")
+
+
+@functools.lru_cache(maxsize=None)
+def get_gateway():
+    """The process-wide gateway picked by PAYMENT_GATEWAY; reused so its connections are pooled."""
+    if settings.PAYMENT_GATEWAY == "fake":
+        return FakeGateway(
+            settings.RZP_SECRET_KEY, settings.RZP_WEBHOOK_SECRET, latency=settings.FAKE_GATEWAY_LATENCY
+        )
+    return RazorpayGateway(
+        settings.RZP_KEY_ID,
+        settings.RZP_SECRET_KEY,
+        settings.RZP_WEBHOOK_SECRET,
+        timeout=settings.PAYMENT_GATEWAY_TIMEOUT,
+        retries=settings.PAYMENT_GATEWAY_RETRIES,
+        pool_size=settings.PAYMENT_GATEWAY_POOL_SIZE,
+    )
@@ -0,0 +1,67 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from order.models import Order, OrderSummary
+from payment.gateway import FakeGateway
+from payment.reconciliation import reconcile_payments
+from user.models import UserAddress, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Reconciles unpaid orders against a fake gateway and reports the throughput and queries per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--latency", type=float, default=0.05, help="Fake gateway seconds per bulk query")
+
+    def handle(self, *args, **options):
+        gateway = FakeGateway(settings.RZP_SECRET_KEY)
+
+        # Everything runs in one transaction that is rolled back.
+        with transaction.atomic():
+            user = User.objects.create(username="reconciliation-check")
+            profile = UserProfile.objects.create(user=user)
+            address = UserAddress.objects.create(
+                profile=profile, address_type="Home", poc_name="Check", phone="0000000000",
+                line_1="Check street", city="Jaipur", state="Rajasthan", pin=302001,
+            )
+            orders = Order.objects.bulk_create(
+                [
+                    Order(user=user, cost=1000, gst=180, shipping=200, shipping_address=address, status="Processing")
+                    for _ in range(options["orders"])
+                ]
+            )
+            for order in orders:
+                order.rzp_order_id = gateway.create_order(order.amount_paise, str(order.id))["id"]
+            Order.objects.bulk_update(orders, ["rzp_order_id"])
+            Order.objects.filter(user=user).update(
+                created_at=timezone.now() - datetime.timedelta(seconds=settings.PAYMENT_RECONCILE_MIN_AGE + 60)
+            )
+            # Every other customer paid, but neither callback nor webhook came through.
+            captured = {order.id for order in orders[::2]}
+            for order in orders[::2]:
+                gateway.capture(order.rzp_order_id)
+
+            gateway.latency = options["latency"]
+            with CaptureQueriesContext(connection) as queries:
+                run = reconcile_payments(gateway=gateway)
+            paid = set(Order.objects.filter(user=user, is_paid=True).values_list("id", flat=True))
+            summarized = OrderSummary.objects.filter(order_id__in=captured, document__is_paid=True).count()
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{run.orders_checked} orders checked in {run.batches} batches, {run.orders_paid} marked paid, "
+            f"{run.orders_per_second:.0f} orders/s, {len(queries) / max(run.batches, 1):.1f} queries per batch"
+        )
+        if run.error or paid != captured or summarized != len(captured):
+            raise CommandError(
+                f"Reconciliation marked {len(paid)} orders paid and {summarized} summaries, expected {len(captured)}"
+                + (f": {run.error}" if run.error else "")
+            )
+        self.stdout.write(self.style.SUCCESS("Every captured payment was reconciled"))
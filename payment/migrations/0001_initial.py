@@ -0,0 +1,27 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dedupe_key', models.CharField(max_length=255, unique=True)),
+                ('event', models.CharField(max_length=100)),
+                ('payment_id', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('rzp_order_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
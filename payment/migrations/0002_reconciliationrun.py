@@ -0,0 +1,26 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('batches', models.IntegerField(default=0)),
+                ('orders_checked', models.IntegerField(default=0)),
+                ('orders_paid', models.IntegerField(default=0)),
+                ('orders_per_second', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+        ),
+    ]
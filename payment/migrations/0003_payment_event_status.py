@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0002_reconciliationrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='amount',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentevent',
+            name='status',
+            field=models.CharField(choices=[('received', 'Received'), ('applied', 'Applied'), ('ignored', 'Ignored'), ('unmatched', 'Unmatched'), ('amount_mismatch', 'Amount mismatch')], default='received', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0003_payment_event_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentevent',
+            name='status',
+            field=models.CharField(choices=[('received', 'Received'), ('applied', 'Applied'), ('ignored', 'Ignored'), ('unmatched', 'Unmatched'), ('amount_mismatch', 'Amount mismatch'), ('cancelled_order', 'Cancelled order')], default='received', max_length=20),
+        ),
+    ]
@@ -1,2 +1,39 @@
 from django.db import models
 
+
+class PaymentEvent(models.Model):
+    """A Razorpay webhook as received, applied to its order by payment.tasks.process_payment_event."""
+    STATUS_CHOICES = [
+        ("received", "Received"),
+        ("applied", "Applied"),
+        ("ignored", "Ignored"),
+        # No order has the event's rzp_order_id yet; retried, then left for reconciliation.
+        ("unmatched", "Unmatched"),
+        # The payment does not cover the order; the order is left unpaid.
+        ("amount_mismatch", "Amount mismatch"),
+        # The order was cancelled and its stock released before the payment came; to be refunded.
+        ("cancelled_order", "Cancelled order"),
+    ]
+
+    # The event name and payment id (the event id for events without a payment).
+    dedupe_key = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=100)
+    payment_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    rzp_order_id = models.CharField(max_length=100, blank=True, null=True)
+    # What the payment took, in paise.
+    amount = models.BigIntegerField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="received")
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+
+class ReconciliationRun(models.Model):
+    """One pass of payment.reconciliation over the unpaid orders, with its throughput."""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    batches = models.IntegerField(default=0)
+    orders_checked = models.IntegerField(default=0)
+    orders_paid = models.IntegerField(default=0)
+    orders_per_second = models.FloatField(default=0)
+    error = models.TextField(blank=True)
@@ -0,0 +1,93 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from simple_history.utils import bulk_update_with_history
+
+from .gateway import GatewayError, get_gateway
+from .models import ReconciliationRun
+from lib.pagination import keyset_filter
+from order.models import Order
+from order.summaries import refresh_order_summaries
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_ORDERING = ("created_at", "id")
+# How long after its Order a gateway order may be created (async creation retries included).
+GATEWAY_ORDER_SLACK = timedelta(minutes=10)
+# A gateway failing this many batches in a row is down; the run stops rather than keep asking.
+MAX_FAILED_BATCHES = 3
+
+
+def reconcile_payments(gateway=None, batch_size=None, now=None):
+    """Mark paid the unpaid orders the gateway has taken payment for; returns the saved ReconciliationRun.
+
+    Orders older than PAYMENT_RECONCILE_MIN_AGE (younger ones may still get their callback or
+    webhook) and younger than PAYMENT_RECONCILE_MAX_AGE are walked in keyset batches: one bulk
+    gateway query and one bulk update per batch. A batch the gateway fails is recorded in the
+    run's error and skipped.
+    """
+    gateway = gateway or get_gateway()
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    run = ReconciliationRun(started_at=now or timezone.now())
+    clock = time.monotonic()
+    unpaid = Order.objects.filter(
+        is_paid=False,
+        is_active=True,
+        rzp_order_id__isnull=False,
+        created_at__gte=run.started_at - timedelta(seconds=settings.PAYMENT_RECONCILE_MAX_AGE),
+        created_at__lt=run.started_at - timedelta(seconds=settings.PAYMENT_RECONCILE_MIN_AGE),
+    ).order_by(*RECONCILE_ORDERING)
+
+    last, failed, failed_in_a_row = None, 0, 0
+    while True:
+        orders = list((unpaid.filter(keyset_filter(RECONCILE_ORDERING, last)) if last else unpaid)[:batch_size])
+        if not orders:
+            break
+        last = [orders[-1].created_at, orders[-1].id]
+        run.batches += 1
+        run.orders_checked += len(orders)
+
+        try:
+            states = gateway.fetch_orders(
+                [order.rzp_order_id for order in orders],
+                orders[0].created_at,
+                orders[-1].created_at + GATEWAY_ORDER_SLACK,
+            )
+        except GatewayError as e:
+            # The batch's orders are checked again by the next run.
+            failed += 1
+            failed_in_a_row += 1
+            logger.warning("Payment reconciliation batch %s failed: %s", run.batches, e)
+            run.error = f"{failed} of {run.batches} batches failed, the last with: {e}"
+            if failed_in_a_row >= MAX_FAILED_BATCHES:
+                logger.warning("Payment reconciliation stopped after %s failed batches in a row", failed_in_a_row)
+                break
+            states = {}
+        else:
+            failed_in_a_row = 0
+
+        paid = []
+        for order in orders:
+            state = states.get(order.rzp_order_id)
+            if state and state["status"] == "paid":
+                order.is_paid = True
+                order.rzp_payment_id = order.rzp_payment_id or state["payment_id"]
+                order.updated_at = timezone.now()
+                paid.append(order)
+        if paid:
+            bulk_update_with_history(paid, Order, ["is_paid", "rzp_payment_id", "updated_at"])
+            # The bulk update skips the signals that keep the summaries current.
+            refresh_order_summaries([order.id for order in paid])
+            run.orders_paid += len(paid)
+
+        if len(orders) < batch_size:
+            break
+
+    elapsed = time.monotonic() - clock
+    run.finished_at = timezone.now()
+    run.orders_per_second = run.orders_checked / elapsed if elapsed else 0
+    run.save()
+    return run
@@ -0,0 +1,97 @@
+import logging
+
+from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+
+from .gateway import GatewayError, get_gateway
+from .models import PaymentEvent
+from .reconciliation import reconcile_payments
+from order.models import Order
+
+logger = logging.getLogger(__name__)
+
+# Webhook events that mean the order has been paid for.
+PAID_EVENTS = {"payment.captured", "order.paid"}
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=5)
+def create_gateway_order(self, order_id):
+    """Create the gateway order of a checkout that did not get one inline; clients poll order/detail/.
+
+    The receipt is looked up first: a create whose response was lost to a read timeout, in the
+    checkout request or an earlier try, may have gone through, and must not be made twice.
+    """
+    order = Order.objects.filter(id=order_id, rzp_order_id__isnull=True).first()
+    if not order:
+        return None
+
+    gateway = get_gateway()
+    try:
+        gateway_order = gateway.find_order(str(order.id)) or gateway.create_order(order.amount_paise, str(order.id))
+    except GatewayError as e:
+        raise self.retry(exc=e)
+
+    order.rzp_order_id = gateway_order["id"]
+    order.save()
+    return order.rzp_order_id
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=60)
+def process_payment_event(self, event_id):
+    """Apply a stored webhook to its order: a payment of the order's amount marks it paid, once.
+
+    A webhook can beat create_gateway_order to saving the order's rzp_order_id; an event with
+    no order yet is retried, then left unprocessed as unmatched for reconciliation to settle.
+    A payment for an order release_unpaid_orders has cancelled is recorded as cancelled_order,
+    to be refunded; the order stays cancelled.
+    """
+    event = PaymentEvent.objects.filter(id=event_id, processed_at__isnull=True).first()
+    if not event:
+        return None
+    if event.event not in PAID_EVENTS or not event.rzp_order_id:
+        PaymentEvent.objects.filter(id=event.id).update(status="ignored", processed_at=timezone.now())
+        return None
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(rzp_order_id=event.rzp_order_id).first()
+        if not order:
+            status = "unmatched"
+        elif order.is_paid:
+            status = "ignored"
+        elif not order.awaiting_payment:
+            logger.error("Payment %s came for cancelled order %s; refund it", event.payment_id, order.id)
+            status = "cancelled_order"
+        elif event.amount != order.amount_paise:
+            logger.error(
+                "Payment %s of %s paise does not cover order %s of %s paise",
+                event.payment_id, event.amount, order.id, order.amount_paise,
+            )
+            status = "amount_mismatch"
+        else:
+            order.rzp_payment_id = event.payment_id
+            order.is_paid = True
+            order.save()
+            status = "applied"
+        PaymentEvent.objects.filter(id=event.id).update(
+            status=status, processed_at=None if status == "unmatched" else timezone.now()
+        )
+
+    if status == "unmatched":
+        if self.request.retries < self.max_retries:
+            raise self.retry()
+        logger.warning("Payment event %s matches no order %s", event.id, event.rzp_order_id)
+        return None
+    return order.id if status == "applied" else None
+
+
+@shared_task
+def reconcile_payments_task():
+    """Catch up on payments whose callback and webhook never arrived; returns the run's counts."""
+    run = reconcile_payments()
+    return {
+        "orders_checked": run.orders_checked,
+        "orders_paid": run.orders_paid,
+        "orders_per_second": run.orders_per_second,
+        "error": run.error,
+    }
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import datetime
+import json
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+
+from cart.models import CartItem
+from lib.testing import FixturesTestCase
+from order.checkout import release_unpaid_orders
+from order.models import Order, OrderSummary
+from .gateway import FakeGateway, GatewayError
+from .models import PaymentEvent, ReconciliationRun
+from .reconciliation import MAX_FAILED_BATCHES, reconcile_payments
+from .tasks import create_gateway_order, process_payment_event
+from .webhooks import ingest_webhook
+
+
+class FailingGateway(FakeGateway):
+    """Fails the bulk queries numbered in failing, counting from 1."""
+
+    def __init__(self, *args, failing=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing = set(failing)
+        self.calls = 0
+
+    def fetch_orders(self, order_ids, created_from, created_to):
+        self.calls += 1
+        if self.calls in self.failing:
+            raise GatewayError("Gateway unavailable")
+        return super().fetch_orders(order_ids, created_from, created_to)
+
+
+class TimingOutGateway(FakeGateway):
+    """Creates the order, then loses the response, as a read timeout would."""
+
+    def create_order(self, amount, receipt, currency="INR"):
+        super().create_order(amount, receipt, currency)
+        raise GatewayError("Read timed out")
+
+
+class PaymentTestCase(FixturesTestCase):
+    def setUp(self):
+        self.user, self.address = self.make_buyer("9000000003")
+        self.make_catalog("Payment", "Payment product")
+        self.variant = self.make_variant("Payment variant", price=500, current_stock=10)
+
+    def make_order(self, **fields):
+        return Order.objects.create(
+            user=self.user, cost=500, gst=90, shipping=200, shipping_address=self.address,
+            status="Processing", **fields,
+        )
+
+
+class CreateGatewayOrderTests(PaymentTestCase):
+    def test_creates_the_gateway_order(self):
+        order = self.make_order()
+        gateway = FakeGateway(settings.RZP_SECRET_KEY)
+        with mock.patch("payment.tasks.get_gateway", return_value=gateway):
+            create_gateway_order(order.id)
+
+        order.refresh_from_db()
+        self.assertEqual(list(gateway.orders), [order.rzp_order_id])
+        self.assertEqual(gateway.orders[order.rzp_order_id]["amount"], order.amount_paise)
+
+    def test_adopts_an_order_created_by_a_timed_out_call(self):
+        order = self.make_order()
+        gateway = TimingOutGateway(settings.RZP_SECRET_KEY)
+        with self.assertRaises(GatewayError):
+            gateway.create_order(order.amount_paise, str(order.id))
+
+        with mock.patch("payment.tasks.get_gateway", return_value=gateway):
+            create_gateway_order(order.id)
+
+        order.refresh_from_db()
+        self.assertEqual(list(gateway.orders), [order.rzp_order_id])
+
+
+@override_settings(PAYMENT_GATEWAY_ASYNC=False)
+class CreateOrderViewTests(PaymentTestCase):
+    def test_read_timeout_leaves_one_gateway_order_per_receipt(self):
+        CartItem.objects.create(user=self.user, variant=self.variant, quantity=2)
+        gateway = TimingOutGateway(settings.RZP_SECRET_KEY)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with mock.patch("order.views.get_gateway", return_value=gateway), \
+                mock.patch("payment.tasks.get_gateway", return_value=gateway), \
+                mock.patch("order.views.create_gateway_order.delay", side_effect=create_gateway_order):
+            response = client.post(reverse("create-order"), {"phone": self.address.phone})
+
+        self.assertEqual(response.status_code, 202)
+        order = Order.objects.get(id=response.data["receipt"])
+        self.assertEqual(list(gateway.orders), [order.rzp_order_id])
+
+
+class WebhookTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gateway = FakeGateway(settings.RZP_SECRET_KEY, webhook_secret="webhook-secret")
+        self.client = APIClient()
+
+    def webhook(self, order_id, amount):
+        payment_id = f"pay_{uuid.uuid4().hex[:14]}"
+        self.addCleanup(get_redis_connection("default").delete, f"payment:webhook:payment.captured:{payment_id}")
+        return json.dumps({
+            "event": "payment.captured",
+            "payload": {"payment": {"entity": {"id": payment_id, "order_id": order_id, "amount": amount}}},
+        }).encode()
+
+    def post(self, body):
+        with mock.patch("payment.views.get_gateway", return_value=self.gateway), \
+                mock.patch("payment.webhooks.process_payment_event.delay", side_effect=process_payment_event), \
+                self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("payment-webhook"), body, content_type="application/json",
+                HTTP_X_RAZORPAY_SIGNATURE=self.gateway.sign_webhook(body),
+            )
+
+    def test_payment_of_the_order_amount_marks_it_paid(self):
+        order = self.make_order(rzp_order_id="order_paid")
+        body = self.webhook("order_paid", order.amount_paise)
+
+        self.assertEqual(self.post(body).data, {"success": True, "duplicate": False})
+        self.assertEqual(self.post(body).data, {"success": True, "duplicate": True})
+
+        order.refresh_from_db()
+        self.assertTrue(order.is_paid)
+        event = PaymentEvent.objects.get(rzp_order_id="order_paid")
+        self.assertEqual(event.status, "applied")
+        self.assertEqual(order.rzp_payment_id, event.payment_id)
+
+    def test_payment_short_of_the_order_amount_leaves_it_unpaid(self):
+        order = self.make_order(rzp_order_id="order_short")
+        with self.assertLogs("payment.tasks", "ERROR"):
+            self.post(self.webhook("order_short", order.amount_paise - 100))
+
+        order.refresh_from_db()
+        self.assertFalse(order.is_paid)
+        self.assertEqual(PaymentEvent.objects.get(rzp_order_id="order_short").status, "amount_mismatch")
+
+    def test_payment_for_a_released_order_is_kept_for_a_refund(self):
+        order = self.make_order(rzp_order_id="order_released")
+        with self.captureOnCommitCallbacks(execute=True):
+            release_unpaid_orders(now=order.created_at + datetime.timedelta(seconds=settings.ORDER_UNPAID_HOLD + 60))
+
+        with self.assertLogs("payment.tasks", "ERROR"):
+            self.post(self.webhook("order_released", order.amount_paise))
+        self.client.force_authenticate(self.user)
+        payment_id = PaymentEvent.objects.get(rzp_order_id="order_released").payment_id
+        with mock.patch("payment.views.get_gateway", return_value=self.gateway):
+            response = self.client.post(reverse("make-payment"), {
+                "razorpay_order_id": "order_released",
+                "razorpay_payment_id": payment_id,
+                "razorpay_signature": self.gateway.sign("order_released", payment_id),
+            })
+        self.assertEqual(response.status_code, 409)
+
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.is_paid), ("Cancelled", False))
+        self.assertEqual(PaymentEvent.objects.get(rzp_order_id="order_released").status, "cancelled_order")
+
+    def test_event_for_an_unknown_order_is_retried_and_left_unprocessed(self):
+        order = self.make_order()
+        with mock.patch("payment.webhooks.process_payment_event.delay"), \
+                self.captureOnCommitCallbacks(execute=True):
+            event = ingest_webhook(self.webhook("order_late", order.amount_paise))
+
+        with self.assertLogs("payment.tasks", "WARNING"):
+            process_payment_event.apply(args=[event.id])
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.processed_at), ("unmatched", None))
+
+        # The gateway order id lands after all; the next try applies the event.
+        Order.objects.filter(id=order.id).update(rzp_order_id="order_late")
+        self.assertEqual(process_payment_event.apply(args=[event.id]).get(), order.id)
+        event.refresh_from_db()
+        self.assertEqual(event.status, "applied")
+
+    def test_dedupe_key_is_set_once_the_event_has_committed(self):
+        body = self.webhook("order_any", 100)
+        payment_id = json.loads(body)["payload"]["payment"]["entity"]["id"]
+        conn = get_redis_connection("default")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertIsNotNone(ingest_webhook(body))
+        self.assertFalse(conn.exists(f"payment:webhook:payment.captured:{payment_id}"))
+        with mock.patch("payment.webhooks.process_payment_event.delay") as delay:
+            for callback in callbacks:
+                callback()
+
+        self.assertTrue(conn.exists(f"payment:webhook:payment.captured:{payment_id}"))
+        delay.assert_called_once()
+        with mock.patch("payment.webhooks.process_payment_event.delay"):
+            self.assertIsNone(ingest_webhook(body))
+
+
+class ReconcilePaymentsTests(PaymentTestCase):
+    def make_gateway_orders(self, gateway, count):
+        """count orders with gateway orders, old enough to be reconciled, in reconciliation order."""
+        with self.captureOnCommitCallbacks(execute=True):
+            orders = [self.make_order() for _ in range(count)]
+            for order in orders:
+                order.rzp_order_id = gateway.create_order(order.amount_paise, str(order.id))["id"]
+                order.save()
+        Order.objects.filter(id__in=[order.id for order in orders]).update(
+            created_at=timezone.now() - datetime.timedelta(seconds=settings.PAYMENT_RECONCILE_MIN_AGE + 60)
+        )
+        return orders
+
+    def paid_ids(self):
+        return set(Order.objects.filter(user=self.user, is_paid=True).values_list("id", flat=True))
+
+    def test_marks_paid_the_orders_the_gateway_was_paid_for(self):
+        gateway = FakeGateway(settings.RZP_SECRET_KEY)
+        orders = self.make_gateway_orders(gateway, 5)
+        captured = {order.id: gateway.capture(order.rzp_order_id) for order in orders[::2]}
+
+        run = reconcile_payments(gateway=gateway, batch_size=2)
+
+        self.assertEqual((run.batches, run.orders_checked, run.orders_paid, run.error), (3, 5, 3, ""))
+        self.assertEqual(self.paid_ids(), set(captured))
+        for order in Order.objects.filter(id__in=captured):
+            self.assertEqual(order.rzp_payment_id, captured[order.id])
+        summaries = dict(OrderSummary.objects.filter(order__in=orders).values_list("order_id", "document__is_paid"))
+        self.assertEqual(summaries, {order.id: order.id in captured for order in orders})
+        # Only the orders still unpaid are checked again.
+        self.assertEqual(reconcile_payments(gateway=gateway, batch_size=2).orders_checked, 2)
+
+    def test_failed_batch_is_recorded_and_skipped(self):
+        gateway = FailingGateway(settings.RZP_SECRET_KEY, failing={1})
+        orders = self.make_gateway_orders(gateway, 5)
+        for order in orders:
+            gateway.capture(order.rzp_order_id)
+
+        with self.assertLogs("payment.reconciliation", "WARNING"):
+            run = reconcile_payments(gateway=gateway, batch_size=2)
+
+        self.assertEqual((run.batches, run.orders_paid), (3, 3))
+        self.assertIn("Gateway unavailable", run.error)
+        self.assertEqual(self.paid_ids(), {order.id for order in orders[2:]})
+        self.assertEqual(ReconciliationRun.objects.get(id=run.id).error, run.error)
+
+    def test_stops_once_the_gateway_looks_down(self):
+        gateway = FailingGateway(settings.RZP_SECRET_KEY, failing=range(1, 100))
+        self.make_gateway_orders(gateway, 10)
+
+        with self.assertLogs("payment.reconciliation", "WARNING"):
+            run = reconcile_payments(gateway=gateway, batch_size=2)
+
+        self.assertEqual((run.batches, run.orders_paid, gateway.calls), (MAX_FAILED_BATCHES, 0, MAX_FAILED_BATCHES))
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('pay/', views.MakePaymentView.as_view(), name='make-payment'),
+    path('webhook/', views.PaymentWebhookView.as_view(), name='payment-webhook'),
 ]
\ No newline at end of file
@@ -1,23 +1,56 @@
 from django.shortcuts import render
 from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework import status
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from user.models import UserProfile
 from order.models import Order
+from .gateway import get_gateway
+from .webhooks import ingest_webhook
 
 class MakePaymentView(APIView):
+    """API for the checkout callback: verifies the Razorpay signature and marks the order paid."""
 
     def post(self, request):
-        user = request.user
-        user_profile = UserProfile.objects.filter(user=user).first()
         order_id = request.POST.get('razorpay_order_id')
         payment_id = request.POST.get('razorpay_payment_id')
         signature = request.POST.get('razorpay_signature')
-        order = Order.objects.filter(rzp_order_id=order_id).first()
-        order.rzp_payment_id = payment_id
-        order.rzp_callback_order_id = order_id
-        order.rzp_signature = signature
-        order.is_paid = True
-        order.save()
-
-        return Response({"success":True})
\ No newline at end of file
+        if not (order_id and payment_id and signature) or not get_gateway().verify_payment_signature(
+            order_id, payment_id, signature
+        ):
+            return Response({"error": "Invalid payment signature"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(rzp_order_id=order_id, user=request.user).first()
+            if not order:
+                return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+            if not order.is_paid and not order.awaiting_payment:
+                # Its stock has been released; the payment's webhook records it for a refund.
+                return Response({"error": "Order has been cancelled"}, status=status.HTTP_409_CONFLICT)
+
+            if not order.is_paid:
+                order.rzp_payment_id = payment_id
+                order.rzp_callback_order_id = order_id
+                order.rzp_signature = signature
+                order.is_paid = True
+                order.save()
+
+        return Response({"success":True})
+
+
+class PaymentWebhookView(APIView):
+    """Razorpay webhook: verifies the signature, stores the event and acknowledges; a Celery task applies it."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if not get_gateway().verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature')):
+            return Response({"error": "Invalid webhook signature"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            event = ingest_webhook(body, request.headers.get('X-Razorpay-Event-Id'))
+        except ValueError:
+            return Response({"error": "Invalid webhook payload"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"success": True, "duplicate": event is None}, status=status.HTTP_200_OK)
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django_redis import get_redis_connection
+
+from .models import PaymentEvent
+from .tasks import process_payment_event
+
+logger = logging.getLogger(__name__)
+
+
+def parse_event(body):
+    """The webhook body as a dict; raises ValueError when it is not a Razorpay event."""
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not payload.get("event"):
+        raise ValueError("Not a Razorpay event")
+    return payload
+
+
+def event_entity(payload, name):
+    return ((payload.get("payload") or {}).get(name) or {}).get("entity") or {}
+
+
+def ingest_webhook(body, event_id=None):
+    """Store a verified webhook and queue its processing; returns the PaymentEvent, or None for a duplicate.
+
+    Duplicates are told apart by event name and payment id. The unique dedupe_key is what
+    decides; once the row has committed its Redis key is set, so a burst of gateway retries
+    after that is turned away without a database write.
+    """
+    payload = parse_event(body)
+    payment = event_entity(payload, "payment")
+    dedupe_key = f"{payload['event']}:{payment.get('id') or event_id or hashlib.sha256(body).hexdigest()}"
+
+    conn = get_redis_connection("default")
+    redis_key = f"payment:webhook:{dedupe_key}"
+    if conn.exists(redis_key):
+        return None
+
+    try:
+        with transaction.atomic():
+            event = PaymentEvent.objects.create(
+                dedupe_key=dedupe_key,
+                event=payload["event"],
+                payment_id=payment.get("id"),
+                rzp_order_id=payment.get("order_id") or event_entity(payload, "order").get("id"),
+                amount=payment.get("amount", event_entity(payload, "order").get("amount_paid")),
+                payload=payload,
+            )
+    except IntegrityError:
+        # Accepted before, and its Redis key has expired since or is not set yet.
+        return None
+
+    def accepted():
+        try:
+            conn.set(redis_key, 1, ex=settings.PAYMENT_WEBHOOK_DEDUPE_TTL)
+        except Exception:
+            # The unique dedupe_key still catches the retries.
+            logger.exception("Could not remember webhook %s", dedupe_key)
+        process_payment_event.delay(event.id)
+
+    transaction.on_commit(accepted)
+    return event
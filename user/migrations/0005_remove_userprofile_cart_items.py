@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 01:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_cartitem_owner_required'),
+        ('user', '0004_auto_20250920_0519'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='cart_items',
+        ),
+    ]
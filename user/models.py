@@ -1,6 +1,5 @@
 from django.db import models
 from datetime import date
-from cart.models import CartItem
 from django.contrib.auth.models import User
 from lib.base_classes import BaseModel
 		
@@ -11,7 +10,6 @@ class UserProfile(BaseModel):
     is_active = models.BooleanField(default=True)
     whitelisted = models.BooleanField(default=False)
     blacklisted = models.BooleanField(default=False)
-    cart_items = models.ManyToManyField(CartItem, related_name="user_profiles")
     dob = models.DateField(default=date(2000, 1, 1))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)